@@ -1,18 +1,36 @@
 from datetime import timedelta
 import datetime
+import os
 import random
 
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import Body, FastAPI, HTTPException, Depends, status
 from fastapi.security import OAuth2PasswordRequestForm
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, field_validator
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Dict, List
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
+from typing import Any, Dict, List, Optional, Union
 
 from min_cost_production import (
-    main,
     Turno,
     gerar_pedidos_para_intervalo
 )
+from catalogos import (
+    TIPOS_CATALOGO,
+    armazem_catalogos,
+    como_datetime_local,
+    validar_demandas,
+    validar_tipo,
+)
+from jobs import MAX_WORKERS_POR_JOB, gerenciador_jobs
+from sessoes import SessaoOcupada, gerenciador_sessoes
+from metricas import registro
+from artefatos import normalizar_saidas, obter_gerenciador_artefatos
+from solvers import (
+    GAP_RELATIVO_PADRAO,
+    NUM_SEARCH_WORKERS_PADRAO,
+    TEMPO_LIMITE_PADRAO_S,
+    validar_solver,
+)
 from auth import (
     User,
     Token, 
@@ -27,6 +45,10 @@ from config import grades, turnos_padrao, recursos_padrao
 
 app = FastAPI(title="API de Otimização de Produção")
 
+CAMINHO_VISUALIZADOR_GANTT = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "static", "gantt.html"
+)
+
 class RecursoModel(BaseModel):
     id: str
     eficiencia: float
@@ -41,6 +63,60 @@ class ConfiguracaoOtimizacao(BaseModel):
     comprimento_mesa_enfesto: float
     penalizacao_superproducao: float
     relaxacao: bool
+    # Processos por job; 0 (todos os núcleos) não é aceito pela API
+    num_workers: int = Field(1, ge=1, le=MAX_WORKERS_POR_JOB)
+    usar_cache: bool = True
+    tamanho_lote: int = 1
+    janela_lote_dias: float = 1.0
+    motor: str = "direto"
+    gerar_grades: bool = False
+    # Solver dos MIPs: scip, cbc ou cp_sat (num_search_workers só vale para o cp_sat)
+    solver: str = "scip"
+    num_search_workers: int = NUM_SEARCH_WORKERS_PADRAO
+    # Orçamento de cada solve e prazo total da execução, em segundos
+    tempo_limite_s: float = TEMPO_LIMITE_PADRAO_S
+    gap_relativo: float = GAP_RELATIVO_PADRAO
+    gap_absoluto: Optional[float] = None
+    prazo_total_s: Optional[float] = None
+    regra_despacho: str = "ordem"
+    # Relatórios gerados em segundo plano: none, json, xlsx e/ou html
+    saidas: List[str] = []
+    # Inclui no resultado o bloco timings (tempo por fase e estatísticas do solver)
+    timings: bool = False
+    # Entradas reais, no formato de config.py (prazos e horários em ISO 8601).
+    # Cada uma pode vir inline ou pelo hash de um catálogo enviado em
+    # /catalogos/{tipo} (campo catalogos: {tipo: hash}); sem elas são usados
+    # os pedidos de teste e os padrões de config.py
+    pedidos: Optional[Dict[str, Dict[str, Any]]] = None
+    grades: Optional[Dict[str, Dict[str, Any]]] = None
+    turnos: Optional[List[Dict[str, Any]]] = None
+    recursos: Optional[Dict[str, List[Dict[str, Any]]]] = None
+    catalogos: Dict[str, str] = {}
+
+class PedidoEntrada(BaseModel):
+    demandas: Dict[str, int]
+    prazo: datetime.datetime
+
+    # Prazos com fuso viram horário local sem fuso, como data_inicio
+    @field_validator("prazo")
+    @classmethod
+    def prazo_local(cls, valor):
+        return como_datetime_local(valor)
+
+class AlteracaoPedido(BaseModel):
+    demandas: Optional[Dict[str, int]] = None
+    prazo: Optional[datetime.datetime] = None
+    opcoes_solver: Optional[Dict] = None
+
+    @field_validator("prazo")
+    @classmethod
+    def prazo_local(cls, valor):
+        return valor if valor is None else como_datetime_local(valor)
+
+class DeltaSessao(BaseModel):
+    adicionar: Dict[str, PedidoEntrada] = {}
+    modificar: Dict[str, AlteracaoPedido] = {}
+    cancelar: List[str] = []
 
 app.add_middleware(
     CORSMiddleware,
@@ -68,47 +144,269 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
     return {"access_token": access_token, "token_type": "bearer"}
 
 
-@app.post("/otimizar")
+@app.on_event("shutdown")
+def encerrar_jobs():
+    gerenciador_jobs.encerrar()
+
+
+def resolver_entradas(parametros_otimizacao, data_inicio):
+    """Pedidos, grades, turnos (objetos Turno) e recursos de uma requisição."""
+    for tipo in parametros_otimizacao.catalogos:
+        validar_tipo(tipo)
+    entradas = {
+        tipo: armazem_catalogos.resolver(
+            tipo,
+            getattr(parametros_otimizacao, tipo),
+            parametros_otimizacao.catalogos.get(tipo),
+        )
+        for tipo in TIPOS_CATALOGO
+    }
+    if entradas["pedidos"] is None:
+        # Gerar pedidos de teste
+        entradas["pedidos"] = gerar_pedidos_para_intervalo(
+            data_inicio, parametros_otimizacao.num_dias
+        )
+    if entradas["grades"] is None:
+        entradas["grades"] = grades
+    if entradas["recursos"] is None:
+        entradas["recursos"] = recursos_padrao
+    validar_demandas(entradas["pedidos"], entradas["grades"])
+
+    # Converter turnos para objetos Turno
+    entradas["turnos"] = [
+        Turno(t["inicio"], t["fim"], eficiencia=t["eficiencia"])
+        for t in entradas["turnos"] or turnos_padrao
+    ]
+    return entradas
+
+
+@app.post("/catalogos/{tipo}", status_code=status.HTTP_201_CREATED)
+def enviar_catalogo(tipo: str, conteudo: Union[Dict[str, Any], List[Any]] = Body(...), current_user: User = Depends(get_current_user)):
+    # Validado e convertido uma vez; as requisições passam a referenciá-lo pelo hash
+    try:
+        chave = armazem_catalogos.armazenar(tipo, conteudo)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"tipo": tipo, "hash": chave, "itens": len(conteudo)}
+
+
+@app.get("/catalogos/{tipo}/{chave}")
+def consultar_catalogo(tipo: str, chave: str, current_user: User = Depends(get_current_user)):
+    try:
+        catalogo = armazem_catalogos.obter(tipo, chave)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if catalogo is None:
+        raise HTTPException(status_code=404, detail="Catálogo não encontrado")
+    return {"tipo": tipo, "hash": chave, "itens": len(catalogo)}
+
+
+@app.post("/otimizar", status_code=status.HTTP_202_ACCEPTED)
 async def otimizar_producao(parametros_otimizacao: ConfiguracaoOtimizacao, current_user: User = Depends(get_current_user)):
+    data_inicio = datetime.datetime.now()
     try:
-        # Configurações padrão
-        data_inicio = datetime.datetime.now()
-        
-        # Converter turnos do config para objetos Turno
-        turnos = [
-            Turno(t["inicio"], t["fim"], eficiencia=t["eficiencia"])
-            for t in turnos_padrao
-        ]
+        saidas = normalizar_saidas(parametros_otimizacao.saidas)
+        validar_solver(parametros_otimizacao.solver)
+        entradas = resolver_entradas(parametros_otimizacao, data_inicio)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-        # Gerar pedidos de teste
-        pedidos = gerar_pedidos_para_intervalo(data_inicio, parametros_otimizacao.num_dias)
+    try:
+        # Enfileirar otimização no pool de processos
+        job_id = gerenciador_jobs.submeter(
+            current_user.username,
+            dict(
+                criterio_prioridade=parametros_otimizacao.criterio,
+                data_inicio=data_inicio,
+                num_dias=parametros_otimizacao.num_dias,
+                recursos=entradas["recursos"],
+                tolerancia_largura=parametros_otimizacao.tolerancia_largura,
+                percentual_superproducao=parametros_otimizacao.percentual_superproducao,
+                max_camadas_por_grade=parametros_otimizacao.max_camadas_por_grade,
+                grades=entradas["grades"],
+                pedidos=entradas["pedidos"],
+                turnos=entradas["turnos"],
+                horas_producao=parametros_otimizacao.horas_producao,
+                comprimento_mesa_enfesto=parametros_otimizacao.comprimento_mesa_enfesto,
+                penalizacao_superproducao=parametros_otimizacao.penalizacao_superproducao,
+                relaxacao=parametros_otimizacao.relaxacao,
+                num_workers=parametros_otimizacao.num_workers,
+                usar_cache=parametros_otimizacao.usar_cache,
+                tamanho_lote=parametros_otimizacao.tamanho_lote,
+                janela_lote_dias=parametros_otimizacao.janela_lote_dias,
+                motor=parametros_otimizacao.motor,
+                gerar_grades=parametros_otimizacao.gerar_grades,
+                solver=parametros_otimizacao.solver,
+                num_search_workers=parametros_otimizacao.num_search_workers,
+                tempo_limite_s=parametros_otimizacao.tempo_limite_s,
+                gap_relativo=parametros_otimizacao.gap_relativo,
+                gap_absoluto=parametros_otimizacao.gap_absoluto,
+                prazo_total_s=parametros_otimizacao.prazo_total_s,
+                regra_despacho=parametros_otimizacao.regra_despacho,
+                saidas=saidas,
+                # Só o usuário que enfileirou o job consulta os relatórios
+                dono_artefatos=current_user.username,
+                timings=parametros_otimizacao.timings,
+            ),
+        )
 
-        # Executar otimização
-        resultado = main(
-            criterio_prioridade=parametros_otimizacao.criterio,
+        return {
+            "status": "accepted",
+            "message": "Otimização enfileirada",
+            "job_id": job_id,
+        }
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/jobs/{job_id}")
+async def consultar_job(job_id: str, current_user: User = Depends(get_current_user)):
+    job = gerenciador_jobs.consultar(job_id, current_user.username)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    return job
+
+
+@app.delete("/jobs/{job_id}")
+async def cancelar_job(job_id: str, current_user: User = Depends(get_current_user)):
+    job = gerenciador_jobs.cancelar(job_id, current_user.username)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    return job
+
+
+# Sessões de planejamento: o plano fica em memória e cada delta re-resolve só
+# os pedidos afetados. A criação e os deltas rodam no pool de jobs, como
+# /otimizar, e podem ser acompanhados e cancelados em /jobs/{job_id}.
+@app.post("/sessoes", status_code=status.HTTP_202_ACCEPTED)
+async def criar_sessao(parametros_otimizacao: ConfiguracaoOtimizacao, current_user: User = Depends(get_current_user)):
+    data_inicio = datetime.datetime.now()
+    try:
+        solver = validar_solver(parametros_otimizacao.solver)
+        entradas = resolver_entradas(parametros_otimizacao, data_inicio)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        sessao_id, job_id = gerenciador_sessoes.criar(
+            current_user.username,
+            **entradas,
             data_inicio=data_inicio,
-            num_dias=parametros_otimizacao.num_dias,
-            recursos=recursos_padrao,
+            criterio_prioridade=parametros_otimizacao.criterio,
             tolerancia_largura=parametros_otimizacao.tolerancia_largura,
             percentual_superproducao=parametros_otimizacao.percentual_superproducao,
             max_camadas_por_grade=parametros_otimizacao.max_camadas_por_grade,
-            grades=grades,
-            pedidos=pedidos,
-            turnos=turnos,
             horas_producao=parametros_otimizacao.horas_producao,
             comprimento_mesa_enfesto=parametros_otimizacao.comprimento_mesa_enfesto,
             penalizacao_superproducao=parametros_otimizacao.penalizacao_superproducao,
             relaxacao=parametros_otimizacao.relaxacao,
+            regra_despacho=parametros_otimizacao.regra_despacho,
+            motor=parametros_otimizacao.motor,
+            gerar_grades=parametros_otimizacao.gerar_grades,
+            num_workers=parametros_otimizacao.num_workers,
+            # prazo_total_s não se aplica: a sessão vive além de uma execução
+            opcoes_solver={
+                "solver": solver,
+                "num_search_workers": parametros_otimizacao.num_search_workers,
+                "tempo_limite_s": parametros_otimizacao.tempo_limite_s,
+                "gap_relativo": parametros_otimizacao.gap_relativo,
+                "gap_absoluto": parametros_otimizacao.gap_absoluto,
+            },
         )
-
-        return {
-            "status": "success",
-            "message": "Otimização concluída com sucesso",
-            "data": resultado
-        }
-
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    return {
+        "status": "accepted",
+        "message": "Criação da sessão enfileirada",
+        "sessao": sessao_id,
+        "job_id": job_id,
+    }
+
+
+@app.get("/sessoes/{sessao_id}")
+async def consultar_sessao(sessao_id: str, current_user: User = Depends(get_current_user)):
+    encontrada = gerenciador_sessoes.obter(sessao_id, current_user.username)
+    if encontrada is None:
+        raise HTTPException(status_code=404, detail="Sessão não encontrada")
+    sessao, job_id = encontrada
+    if sessao is None:
+        # Ainda em criação: o andamento está em /jobs/{job_id}
+        return JSONResponse(
+            status_code=status.HTTP_202_ACCEPTED,
+            content={"sessao": sessao_id, "status": "pendente", "job_id": job_id},
+        )
+    plano = sessao.plano()
+    # Delta em andamento, se houver; o plano é o da última versão concluída
+    plano["job_id"] = job_id
+    return plano
+
+
+@app.post("/sessoes/{sessao_id}/deltas", status_code=status.HTTP_202_ACCEPTED)
+async def aplicar_delta(sessao_id: str, delta: DeltaSessao, current_user: User = Depends(get_current_user)):
+    try:
+        job_id = gerenciador_sessoes.aplicar(
+            sessao_id,
+            current_user.username,
+            adicionar={p: pedido.model_dump() for p, pedido in delta.adicionar.items()},
+            # Só os campos enviados são alterados
+            modificar={
+                p: alteracao.model_dump(exclude_unset=True)
+                for p, alteracao in delta.modificar.items()
+            },
+            cancelar=delta.cancelar,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except SessaoOcupada as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if job_id is None:
+        raise HTTPException(status_code=404, detail="Sessão não encontrada")
+    return {
+        "status": "accepted",
+        "message": "Delta enfileirado",
+        "sessao": sessao_id,
+        "job_id": job_id,
+    }
+
+
+@app.delete("/sessoes/{sessao_id}")
+async def remover_sessao(sessao_id: str, current_user: User = Depends(get_current_user)):
+    # Um job da sessão em andamento é cancelado
+    if not gerenciador_sessoes.remover(sessao_id, current_user.username):
+        raise HTTPException(status_code=404, detail="Sessão não encontrada")
+    return {"sessao": sessao_id, "status": "removida"}
+
+
+@app.get("/visualizador/gantt")
+async def visualizador_gantt():
+    # Página estática; os dados vêm de ?dados=<url do JSON gantt>#token=<token>
+    return FileResponse(CAMINHO_VISUALIZADOR_GANTT, media_type="text/html")
+
+
+@app.get("/artefatos/{artefato_id}")
+async def consultar_artefatos(artefato_id: str, current_user: User = Depends(get_current_user)):
+    manifesto = obter_gerenciador_artefatos().consultar(artefato_id, current_user.username)
+    if manifesto is None:
+        raise HTTPException(status_code=404, detail="Artefato não encontrado")
+    return manifesto
+
+
+@app.get("/artefatos/{artefato_id}/{nome}")
+async def baixar_artefato(artefato_id: str, nome: str, current_user: User = Depends(get_current_user)):
+    caminho = obter_gerenciador_artefatos().caminho_arquivo(
+        artefato_id, nome, current_user.username
+    )
+    if caminho is None:
+        raise HTTPException(status_code=404, detail="Arquivo não encontrado")
+    return FileResponse(caminho, filename=nome)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metricas():
+    # Formato texto do Prometheus; agrega os jobs finalizados neste processo
+    return PlainTextResponse(
+        registro.texto_prometheus(), media_type="text/plain; version=0.0.4"
+    )
 
 # Função auxiliar para gerar pedidos
 # def gerar_pedidos_para_intervalo(data_inicio, num_dias):
@@ -184,7 +482,19 @@ async def root():
         "message": "API de Otimização de Produção",
         "version": "1.0",
         "endpoints": [
-            "/otimizar - POST - Executa otimização de produção",
+            "/catalogos/{tipo} - POST - Envia um catálogo (pedidos, grades, turnos ou recursos) e retorna seu hash",
+            "/catalogos/{tipo}/{hash} - GET - Confere se um catálogo já foi enviado",
+            "/otimizar - POST - Enfileira otimização de produção e retorna o id do job",
+            "/jobs/{job_id} - GET - Status, resultados parciais e resultado do job",
+            "/jobs/{job_id} - DELETE - Cancela o job",
+            "/sessoes - POST - Enfileira a criação de uma sessão de planejamento e retorna os ids da sessão e do job",
+            "/sessoes/{sessao_id} - GET - Plano atual da sessão",
+            "/sessoes/{sessao_id}/deltas - POST - Enfileira a inclusão, alteração ou cancelamento de pedidos e o reparo do plano",
+            "/sessoes/{sessao_id} - DELETE - Encerra a sessão",
+            "/artefatos/{artefato_id} - GET - Status e arquivos dos relatórios do job",
+            "/artefatos/{artefato_id}/{nome} - GET - Baixa um relatório",
+            "/visualizador/gantt - GET - Visualizador das linhas do tempo (saída gantt)",
+            "/metrics - GET - Métricas de fases e solves no formato do Prometheus",
             "/ - GET - Informações da API"
         ]
     }
@@ -0,0 +1,177 @@
+import datetime
+import importlib.util
+import json
+import logging
+import os
+import tempfile
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from metricas import coletar_tempos, span
+
+
+# Diretório onde os artefatos de cada execução são gravados; é compartilhado
+# entre os processos de otimização e a API, que os serve por id
+ARTEFATOS_DIRETORIO = os.getenv("OTIMIZACAO_ARTEFATOS_DIR", "artefatos")
+# Threads que renderizam relatórios em segundo plano por processo
+ARTEFATOS_MAX_WORKERS = int(os.getenv("OTIMIZACAO_ARTEFATOS_MAX_WORKERS", 1))
+
+SAIDAS_VALIDAS = ("json", "xlsx", "csv", "parquet", "gantt", "html")
+
+PENDENTE = "pendente"
+EXECUTANDO = "executando"
+CONCLUIDO = "concluido"
+ERRO = "erro"
+
+MANIFESTO = "manifesto.json"
+
+
+def normalizar_saidas(saidas):
+    """Converte saidas (None, "none", str ou lista) em uma tupla validada."""
+    if saidas is None:
+        return ()
+    if isinstance(saidas, str):
+        saidas = [saidas]
+    normalizadas = []
+    for saida in saidas:
+        if saida == "none":
+            continue
+        if saida not in SAIDAS_VALIDAS:
+            raise ValueError(
+                f"Saída inválida: {saida}. Use none ou {', '.join(SAIDAS_VALIDAS)}"
+            )
+        if saida == "parquet" and importlib.util.find_spec("pyarrow") is None:
+            raise ValueError("A saída parquet requer o pacote pyarrow")
+        if saida not in normalizadas:
+            normalizadas.append(saida)
+    return tuple(normalizadas)
+
+
+def _agora():
+    return datetime.datetime.now().isoformat()
+
+
+class GerenciadorArtefatos:
+    """Renderiza relatórios em segundo plano e os guarda por id.
+
+    Cada agendamento recebe um id e um diretório próprio com um manifesto
+    (status, arquivos gerados e dono). O manifesto fica em disco para que
+    outro processo, como a API, consulte e sirva os artefatos; com dono, a
+    consulta só encontra os artefatos daquele usuário.
+    """
+
+    def __init__(self, diretorio=ARTEFATOS_DIRETORIO, max_workers=ARTEFATOS_MAX_WORKERS):
+        self.diretorio = diretorio
+        self.max_workers = max_workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _iniciar(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="artefatos"
+                )
+        return self._executor
+
+    def _caminho(self, artefato_id, nome=MANIFESTO):
+        return os.path.join(self.diretorio, artefato_id, nome)
+
+    def _gravar_manifesto(self, artefato_id, manifesto):
+        caminho = self._caminho(artefato_id)
+        # Escrita atômica: a API pode ler o manifesto durante a renderização
+        fd, temporario = tempfile.mkstemp(dir=os.path.dirname(caminho))
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(manifesto, f)
+        os.replace(temporario, caminho)
+
+    def agendar(self, renderizar, saidas, *args, dono=None):
+        """Agenda renderizar(diretorio, saidas, *args) e retorna o id do artefato.
+
+        renderizar deve retornar a lista de nomes de arquivos gravados no
+        diretório recebido. dono é o usuário que pode consultar o artefato.
+        """
+        artefato_id = uuid.uuid4().hex
+        os.makedirs(os.path.join(self.diretorio, artefato_id), exist_ok=True)
+        manifesto = {
+            "id": artefato_id,
+            "dono": dono,
+            "status": PENDENTE,
+            "saidas": list(saidas),
+            "arquivos": [],
+            "criado_em": _agora(),
+            "finalizado_em": None,
+            "erro": None,
+        }
+        self._gravar_manifesto(artefato_id, manifesto)
+        self._iniciar().submit(
+            self._executar, artefato_id, manifesto, renderizar, saidas, args
+        )
+        return artefato_id
+
+    def _executar(self, artefato_id, manifesto, renderizar, saidas, args):
+        manifesto["status"] = EXECUTANDO
+        self._gravar_manifesto(artefato_id, manifesto)
+        with coletar_tempos() as tempos:
+            try:
+                with span("exportacao", saidas=",".join(saidas)):
+                    manifesto["arquivos"] = list(
+                        renderizar(os.path.join(self.diretorio, artefato_id), saidas, *args)
+                    )
+                manifesto["status"] = CONCLUIDO
+            except Exception as e:
+                logging.error(f"Erro ao gerar os artefatos {artefato_id}: {e}")
+                manifesto["status"] = ERRO
+                manifesto["erro"] = str(e)
+        manifesto["finalizado_em"] = _agora()
+        manifesto["timings"] = tempos.resumo()["fases"]
+        self._gravar_manifesto(artefato_id, manifesto)
+        logging.info(f"Artefatos {artefato_id} finalizados com status {manifesto['status']}")
+
+    def consultar(self, artefato_id, dono=None):
+        """Manifesto do artefato, ou None se o id não existir.
+
+        Com dono, também None se o artefato for de outro usuário (ou não
+        tiver dono), sem revelar que o id existe.
+        """
+        # O id vem da URL: só aceita o formato gerado por agendar
+        if not _id_valido(artefato_id):
+            return None
+        try:
+            with open(self._caminho(artefato_id), "r", encoding="utf-8") as f:
+                manifesto = json.load(f)
+        except FileNotFoundError:
+            return None
+        if dono is not None and manifesto.get("dono") != dono:
+            return None
+        return manifesto
+
+    def caminho_arquivo(self, artefato_id, nome, dono=None):
+        """Caminho de um arquivo gerado, ou None se não fizer parte do artefato."""
+        manifesto = self.consultar(artefato_id, dono)
+        if manifesto is None or nome not in manifesto["arquivos"]:
+            return None
+        return self._caminho(artefato_id, nome)
+
+    def aguardar(self):
+        """Espera todas as renderizações agendadas terminarem."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+def _id_valido(artefato_id):
+    return len(artefato_id) == 32 and all(c in "0123456789abcdef" for c in artefato_id)
+
+
+_gerenciador_padrao = None
+
+
+def obter_gerenciador_artefatos():
+    """Gerenciador único por processo, configurado pelas variáveis de ambiente."""
+    global _gerenciador_padrao
+    if _gerenciador_padrao is None:
+        _gerenciador_padrao = GerenciadorArtefatos()
+    return _gerenciador_padrao
@@ -0,0 +1,513 @@
+"""Benchmark do min_cost_production.main e do LayoutOptimizer.optimize_order.
+
+Gera cargas sintéticas parametrizadas (carteiras de pedidos, catálogos de
+grades e conjuntos de layouts), executa os otimizadores em várias escalas e
+grava um relatório JSON com latência, vazão e pico de memória (RSS, medido
+em um processo novo por cenário; requer Unix, pelo módulo resource). Com
+--comparar, o relatório é confrontado com um relatório de referência e a
+execução termina com erro se algum cenário regredir além da tolerância.
+
+    python benchmark.py --cenarios pequeno medio --saida benchmark.json
+    python benchmark.py --comparar benchmark-base.json --tolerancia 0.2
+"""
+import argparse
+import contextlib
+import copy
+import datetime
+import io
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import ortools
+
+from metricas import coletar_tempos
+
+
+# Nomes dos tamanhos gerados, na ordem; além destes usa T9, T10, ...
+TAMANHOS = ("P", "M", "G", "GG", "XG", "XGG", "EG", "EGG")
+
+# Distribuição da demanda de um pedido entre os tamanhos
+MIXES = ("uniforme", "central", "aleatorio")
+
+# Parâmetros de main iguais para todos os cenários
+PARAMETROS_MAIN = {
+    "criterio_prioridade": "prazo",
+    "tolerancia_largura": 0.1,
+    "percentual_superproducao": 0.05,
+    "max_camadas_por_grade": 30,
+    "horas_producao": 16,
+    "comprimento_mesa_enfesto": 10,
+    "penalizacao_superproducao": 10,
+    "relaxacao": True,
+}
+
+# Escalas pré-definidas. pedidos/grades/tamanhos valem para main;
+# layouts/ordens/padroes para o LayoutOptimizer
+CENARIOS = {
+    "pequeno": {
+        "pedidos": 10, "grades": 7, "tamanhos": 4, "mix": "uniforme", "dispersao_prazo_dias": 7,
+        "layouts": 50, "ordens": 5, "padroes": 5,
+    },
+    "medio": {
+        "pedidos": 50, "grades": 20, "tamanhos": 6, "mix": "central", "dispersao_prazo_dias": 14,
+        "layouts": 500, "ordens": 20, "padroes": 15,
+    },
+    "grande": {
+        "pedidos": 100, "grades": 30, "tamanhos": 8, "mix": "aleatorio", "dispersao_prazo_dias": 30,
+        "layouts": 5000, "ordens": 50, "padroes": 40,
+    },
+}
+
+DATA_INICIO = datetime.datetime(2024, 11, 1, 8)
+
+
+def nomes_tamanhos(num_tamanhos):
+    return [
+        TAMANHOS[i] if i < len(TAMANHOS) else f"T{i + 1}" for i in range(num_tamanhos)
+    ]
+
+
+def _pesos_mix(mix, num_tamanhos, rng):
+    if mix == "uniforme":
+        return [1.0] * num_tamanhos
+    if mix == "central":
+        # Curva em sino centrada nos tamanhos do meio
+        centro = (num_tamanhos - 1) / 2
+        return [1.0 / (1 + (i - centro) ** 2) for i in range(num_tamanhos)]
+    if mix == "aleatorio":
+        return [rng.random() + 0.1 for _ in range(num_tamanhos)]
+    raise ValueError(f"Mix inválido: {mix}. Use {', '.join(MIXES)}")
+
+
+def gerar_catalogo_grades(num_grades, num_tamanhos, semente=0, largura_tecido=1.5):
+    """Catálogo {GradeN: dados} no formato de config.grades.
+
+    As primeiras grades priorizam um tamanho cada, para que toda demanda
+    tenha cobertura; as demais combinam tamanhos ao acaso. A largura somada
+    das peças de cada grade cabe na largura do tecido.
+    """
+    rng = random.Random(semente)
+    tamanhos = nomes_tamanhos(num_tamanhos)
+    larguras = {t: round(0.2 + 0.01 * i, 3) for i, t in enumerate(tamanhos)}
+    areas = {t: round(larguras[t] * (0.7 + 0.1 * i), 4) for i, t in enumerate(tamanhos)}
+    perimetros = {t: round(2.0 + 0.2 * i, 2) for i, t in enumerate(tamanhos)}
+
+    grades = {}
+    for g in range(num_grades):
+        quantidades = dict.fromkeys(tamanhos, 0)
+        if g < num_tamanhos:
+            quantidades[tamanhos[g]] = 2
+        largura = sum(quantidades[t] * larguras[t] for t in tamanhos)
+        for _ in range(rng.randint(1, 6)):
+            t = rng.choice(tamanhos)
+            if largura + larguras[t] > largura_tecido:
+                break
+            quantidades[t] += 1
+            largura += larguras[t]
+        grades[f"Grade{g + 1}"] = {
+            "quantidades": quantidades,
+            "aproveitamento": round(rng.uniform(0.82, 0.9), 3),
+            "custo_setup": rng.randrange(150, 351, 10),
+            "larguras": dict(larguras),
+            "areas": dict(areas),
+            "perimetros": dict(perimetros),
+            "largura_tecido": largura_tecido,
+            "custo_tecido": 18.90,
+            "custo_corte": 0.45,
+            "custo_enfesto_fixo": 1.25,
+            "custo_enfesto_variavel": 0.30,
+            "tempo_enfesto_por_metro": 0.5,
+            "tempo_corte_por_metro": 0.01,
+        }
+    return grades
+
+
+def gerar_pedidos(
+    num_pedidos,
+    tamanhos,
+    mix="uniforme",
+    dispersao_prazo_dias=7,
+    semente=0,
+    data_inicio=DATA_INICIO,
+    volume=(100, 300),
+):
+    """Carteira {id: {"demandas", "prazo"}} no formato de gerar_pedidos_para_intervalo.
+
+    O volume total de cada pedido é sorteado em volume e dividido entre os
+    tamanhos pelo mix; os prazos se espalham por dispersao_prazo_dias dias a
+    partir de data_inicio. Usa um gerador próprio, sem mexer no random global.
+    """
+    rng = random.Random(semente)
+    pesos = _pesos_mix(mix, len(tamanhos), rng)
+    pedidos = {}
+    for p in range(1, num_pedidos + 1):
+        if mix == "aleatorio":
+            pesos = _pesos_mix(mix, len(tamanhos), rng)
+        total = rng.randint(*volume)
+        soma = sum(pesos)
+        pedidos[p] = {
+            "demandas": {
+                t: max(1, round(total * peso / soma)) for t, peso in zip(tamanhos, pesos)
+            },
+            "prazo": data_inicio + datetime.timedelta(days=rng.randint(1, dispersao_prazo_dias)),
+        }
+    return pedidos
+
+
+def gerar_entrada_layouts(
+    num_layouts,
+    num_ordens,
+    num_padroes,
+    semente=0,
+    larguras_tecido=(1500, 1600, 1800),
+    tecidos=("knit", "woven"),
+):
+    """input_data do LayoutOptimizer no formato de dados_entrada.json.
+
+    Cada layout traz de 1 a 3 padrões; cada ordem pede os padrões de um
+    layout sorteado, na mesma largura, com a produção desse layout em algumas
+    camadas, para que tenha ao menos uma solução viável.
+    """
+    from select_grids_layers import SIZES
+
+    rng = random.Random(semente)
+    padroes = [f"padrao_{k + 1}" for k in range(num_padroes)]
+    layouts = []
+    for i in range(1, num_layouts + 1):
+        largura = rng.choice(larguras_tecido)
+        comprimento = rng.randrange(2000, 6001, 100)
+        utilizacao = round(rng.uniform(0.78, 0.92), 3)
+        area_total = largura * comprimento // 100
+        pecas = [
+            {
+                "pattern": padrao,
+                "size_grade": {s: rng.randint(0, 8) for s in SIZES},
+            }
+            for padrao in rng.sample(padroes, rng.randint(1, min(3, num_padroes)))
+        ]
+        layouts.append({
+            "id": i,
+            "utilization": utilizacao,
+            "fabric_width": largura,
+            "fabric": rng.choice(tecidos),
+            "layout_length": comprimento,
+            "total_perimeter": rng.randrange(1500, 4001, 50),
+            "utilized_area": round(area_total * utilizacao),
+            "waste_area": area_total - round(area_total * utilizacao),
+            "total_area": area_total,
+            "pieces": pecas,
+        })
+
+    ordens = []
+    for k in range(1, num_ordens + 1):
+        base = rng.choice(layouts)
+        # Demanda que o layout base atende sozinho com esse número de camadas
+        camadas = rng.randint(5, 25)
+        ordens.append({
+            "id": k,
+            "demand": [{
+                "fabric_width": base["fabric_width"],
+                "max_layers": 30,
+                "max_length": 40000,
+                "pieces": [
+                    {
+                        "pattern": peca["pattern"],
+                        "fabrics": [base["fabric"]],
+                        "quantity": {
+                            s: peca["size_grade"][s] * camadas for s in SIZES
+                        },
+                    }
+                    for peca in base["pieces"]
+                ],
+            }],
+        })
+
+    return {
+        "general_configuration": {
+            "criteria": "waste",
+            "overproduction_percentage": 0.05,
+            "max_layers": 30,
+            "max_total_length": 10000,
+        },
+        "layouts": layouts,
+        "fabrics": [
+            {
+                "fabric": tecido,
+                "cost_per_cut_meter": 0.45,
+                "price_per_linear_meter": 18.9,
+                "cost_per_layout_meter": 0.3,
+                "cost_per_layer": 1.25,
+            }
+            for tecido in tecidos
+        ],
+        "production_orders": ordens,
+    }
+
+
+@contextlib.contextmanager
+def _silencioso():
+    """Suprime os prints e os logs INFO dos otimizadores durante a medição."""
+    logging.disable(logging.INFO)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield
+    finally:
+        logging.disable(logging.NOTSET)
+
+
+def _rss_mb(quem):
+    # ru_maxrss vem em KiB no Linux e em bytes no macOS
+    pico = resource.getrusage(quem).ru_maxrss
+    return pico / 2**20 if sys.platform == "darwin" else pico / 2**10
+
+
+def medir(funcao, repeticoes=3):
+    """Executa funcao repeticoes vezes e mede latência e pico de memória.
+
+    O pico é o RSS máximo do processo (ru_maxrss), que inclui a memória
+    nativa do solver, e o do maior processo filho já encerrado (os workers
+    dos pools); memoria_inicial_mb é o RSS antes da primeira execução, com
+    as entradas já geradas. Como o pico nunca diminui, cada cenário deve
+    rodar em um processo novo (ver executar_benchmark). Retorna (medidas,
+    resultado, timings da última execução).
+    """
+    memoria_inicial = _rss_mb(resource.RUSAGE_SELF)
+    latencias = []
+    for _ in range(repeticoes):
+        with _silencioso(), coletar_tempos() as tempos:
+            inicio = time.perf_counter()
+            resultado = funcao()
+            latencias.append(time.perf_counter() - inicio)
+
+    medidas = {
+        "latencia_s": {
+            "mediana": statistics.median(latencias),
+            "min": min(latencias),
+            "max": max(latencias),
+            "execucoes": latencias,
+        },
+        "memoria_inicial_mb": memoria_inicial,
+        "pico_memoria_mb": _rss_mb(resource.RUSAGE_SELF),
+        "pico_memoria_workers_mb": _rss_mb(resource.RUSAGE_CHILDREN),
+    }
+    return medidas, resultado, tempos.resumo()
+
+
+def benchmark_main(cenario, parametros, repeticoes=3, workers=1, semente=0, solver="scip"):
+    from min_cost_production import Turno, main
+    from config import recursos_padrao, turnos_padrao
+
+    tamanhos = nomes_tamanhos(parametros["tamanhos"])
+    grades = gerar_catalogo_grades(parametros["grades"], parametros["tamanhos"], semente)
+    pedidos = gerar_pedidos(
+        parametros["pedidos"],
+        tamanhos,
+        parametros["mix"],
+        parametros["dispersao_prazo_dias"],
+        semente,
+    )
+    turnos = [
+        Turno(t["inicio"], t["fim"], eficiencia=t["eficiencia"]) for t in turnos_padrao
+    ]
+
+    def executar():
+        return main(
+            data_inicio=DATA_INICIO,
+            num_dias=parametros["dispersao_prazo_dias"],
+            recursos=recursos_padrao,
+            grades=copy.deepcopy(grades),
+            pedidos=pedidos,
+            turnos=turnos,
+            num_workers=workers,
+            solver=solver,
+            saidas=(),
+            **PARAMETROS_MAIN,
+        )
+
+    medidas, retorno, timings = medir(executar, repeticoes)
+    metricas = retorno["metricas_globais"]
+    return {
+        "cenario": cenario,
+        "alvo": "main",
+        "parametros": {
+            "pedidos": parametros["pedidos"],
+            "grades": parametros["grades"],
+            "tamanhos": parametros["tamanhos"],
+            "mix": parametros["mix"],
+            "dispersao_prazo_dias": parametros["dispersao_prazo_dias"],
+            "workers": workers,
+            "solver": solver,
+        },
+        **medidas,
+        "vazao_pedidos_s": parametros["pedidos"] / medidas["latencia_s"]["mediana"],
+        "custo_total": metricas["custo_total"],
+        "pedidos_sem_solucao": metricas["pedidos_sem_solucao"],
+        "timings": timings,
+    }
+
+
+def benchmark_layouts(cenario, parametros, repeticoes=3, workers=1, semente=0, solver="scip"):
+    from select_grids_layers import LayoutOptimizer
+
+    entrada = gerar_entrada_layouts(
+        parametros["layouts"], parametros["ordens"], parametros["padroes"], semente
+    )
+    inicio = time.perf_counter()
+    with _silencioso():
+        otimizador = LayoutOptimizer(entrada, solver_options={"solver": solver})
+    carga_s = time.perf_counter() - inicio
+
+    def executar():
+        return dict(otimizador.optimize_all(workers=workers))
+
+    medidas, resultados, timings = medir(executar, repeticoes)
+    return {
+        "cenario": cenario,
+        "alvo": "optimize_order",
+        "parametros": {
+            "layouts": parametros["layouts"],
+            "ordens": parametros["ordens"],
+            "padroes": parametros["padroes"],
+            "workers": workers,
+            "solver": solver,
+        },
+        **medidas,
+        "carga_s": carga_s,
+        "vazao_pedidos_s": parametros["ordens"] / medidas["latencia_s"]["mediana"],
+        "custo_total": sum(r["metrics"]["total_cost"] for r in resultados.values() if r),
+        "pedidos_sem_solucao": sum(1 for r in resultados.values() if not r),
+        "timings": timings,
+    }
+
+
+ALVOS = {"main": benchmark_main, "optimize_order": benchmark_layouts}
+
+
+def _executar_alvo(alvo, cenario, opcoes):
+    return ALVOS[alvo](cenario, CENARIOS[cenario], **opcoes)
+
+
+def executar_benchmark(cenarios, alvos=tuple(ALVOS), **opcoes):
+    """Relatório com uma entrada por (cenário, alvo), mais o ambiente da execução.
+
+    Cada (cenário, alvo) roda em um processo novo, para que o pico de RSS de
+    um não contamine o do seguinte.
+    """
+    contexto = multiprocessing.get_context("spawn")
+    resultados = []
+    for cenario in cenarios:
+        for alvo in alvos:
+            logging.info(f"Benchmark {alvo} no cenário {cenario}")
+            with ProcessPoolExecutor(max_workers=1, mp_context=contexto) as executor:
+                resultados.append(
+                    executor.submit(_executar_alvo, alvo, cenario, opcoes).result()
+                )
+    return {
+        "gerado_em": datetime.datetime.now().isoformat(),
+        "ambiente": {
+            "python": platform.python_version(),
+            "ortools": ortools.__version__,
+            "plataforma": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "opcoes": opcoes,
+        "resultados": resultados,
+    }
+
+
+def comparar(relatorio, referencia, tolerancia=0.2):
+    """Regressões do relatório em relação à referência.
+
+    Compara a latência mediana e o pico de memória de cada (cenário, alvo)
+    presente nos dois relatórios; retorna as medidas que pioraram mais que a
+    tolerância (fração), e mudanças de custo, que indicam outra solução.
+    """
+    anteriores = {(r["cenario"], r["alvo"]): r for r in referencia["resultados"]}
+    regressoes = []
+    for r in relatorio["resultados"]:
+        base = anteriores.get((r["cenario"], r["alvo"]))
+        if base is None:
+            continue
+        for medida, atual, anterior in (
+            ("latencia_s", r["latencia_s"]["mediana"], base["latencia_s"]["mediana"]),
+            ("pico_memoria_mb", r["pico_memoria_mb"], base["pico_memoria_mb"]),
+            (
+                "pico_memoria_workers_mb",
+                r["pico_memoria_workers_mb"],
+                base.get("pico_memoria_workers_mb", 0),
+            ),
+        ):
+            if anterior > 0 and atual > anterior * (1 + tolerancia):
+                regressoes.append({
+                    "cenario": r["cenario"],
+                    "alvo": r["alvo"],
+                    "medida": medida,
+                    "referencia": anterior,
+                    "atual": atual,
+                    "variacao": atual / anterior - 1,
+                })
+        if abs(r["custo_total"] - base["custo_total"]) > 1e-6 * max(1, abs(base["custo_total"])):
+            regressoes.append({
+                "cenario": r["cenario"],
+                "alvo": r["alvo"],
+                "medida": "custo_total",
+                "referencia": base["custo_total"],
+                "atual": r["custo_total"],
+            })
+    return regressoes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cenarios", nargs="+", choices=list(CENARIOS), default=["pequeno"])
+    parser.add_argument("--alvos", nargs="+", choices=list(ALVOS), default=list(ALVOS))
+    parser.add_argument("--repeticoes", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--semente", type=int, default=0)
+    parser.add_argument("--solver", default="scip")
+    parser.add_argument("--saida", default="benchmark.json")
+    parser.add_argument("--comparar", help="relatório de referência")
+    parser.add_argument("--tolerancia", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    relatorio = executar_benchmark(
+        args.cenarios,
+        args.alvos,
+        repeticoes=args.repeticoes,
+        workers=args.workers,
+        semente=args.semente,
+        solver=args.solver,
+    )
+    with open(args.saida, "w", encoding="utf-8") as f:
+        json.dump(relatorio, f, indent=2)
+
+    for r in relatorio["resultados"]:
+        print(
+            f"{r['cenario']:>8} {r['alvo']:<15} "
+            f"mediana {r['latencia_s']['mediana']:.3f} s  "
+            f"{r['vazao_pedidos_s']:.1f} pedidos/s  "
+            f"pico {r['pico_memoria_mb']:.1f} MB (workers {r['pico_memoria_workers_mb']:.1f} MB)  "
+            f"sem solução {r['pedidos_sem_solucao']}"
+        )
+    print(f"Relatório gravado em {args.saida}")
+
+    if args.comparar:
+        with open(args.comparar, "r", encoding="utf-8") as f:
+            regressoes = comparar(relatorio, json.load(f), args.tolerancia)
+        for r in regressoes:
+            print(f"REGRESSÃO {r['cenario']} {r['alvo']} {r['medida']}: {r['referencia']} -> {r['atual']}")
+        return 1 if regressoes else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,222 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+# Configuração do cache padrão usado pelos jobs da API
+CACHE_MAX_ITENS = int(os.getenv("OTIMIZACAO_CACHE_MAX_ITENS", 4096))
+CACHE_DIRETORIO = os.getenv("OTIMIZACAO_CACHE_DIR") or None
+
+CONTADORES = ("hits_memoria", "hits_disco", "misses", "gravacoes")
+
+
+def _canonico(obj):
+    return json.dumps(obj, sort_keys=True, separators=(",", ":"), default=str)
+
+
+def hash_canonico(obj):
+    return hashlib.sha256(_canonico(obj).encode("utf-8")).hexdigest()
+
+
+class CacheSolucoes:
+    """Cache de resultados de otimizar_pedido em dois níveis.
+
+    O nível em memória é um LRU limitado a max_itens; o nível em disco (opcional)
+    guarda um JSON por chave em diretorio e é compartilhado entre processos.
+    Pedidos inviáveis também são armazenados, pois são os mais caros de resolver.
+
+    Enviado a um processo do pool, o cache leva uma cópia do nível em memória;
+    a cópia guarda o que gravar para que o processo principal o incorpore
+    (retirar_gravacoes e incorporar), de modo que os solves do pool não se
+    percam mesmo sem o nível em disco.
+    """
+
+    def __init__(self, max_itens=CACHE_MAX_ITENS, diretorio=None):
+        self.max_itens = max_itens
+        self.diretorio = diretorio
+        self._memoria = OrderedDict()
+        self._lock = threading.Lock()
+        self.contadores = dict.fromkeys(CONTADORES, 0)
+        # Gravações a devolver ao processo de origem; só nas cópias enviadas
+        self._gravacoes = None
+        if diretorio:
+            os.makedirs(diretorio, exist_ok=True)
+
+    def __getstate__(self):
+        # Os contadores ficam: cada processo devolve só a diferença (acumular)
+        with self._lock:
+            itens = list(self._memoria.items())
+        return {"max_itens": self.max_itens, "diretorio": self.diretorio, "itens": itens}
+
+    def __setstate__(self, estado):
+        self.__init__(estado["max_itens"], estado["diretorio"])
+        self._memoria.update(estado["itens"])
+        self._gravacoes = []
+
+    def contexto(
+        self,
+        tabela,
+        recursos,
+        comprimento_mesa_enfesto,
+        percentual_superproducao,
+        max_camadas_por_grade,
+        horas_producao,
+        penalizacao_superproducao,
+        motor="direto",
+        opcoes_motor=None,
+        opcoes_solver=None,
+    ):
+        """Retorna uma visão do cache presa a uma tabela de grades e parâmetros.
+
+        A parte da chave que não depende do pedido é calculada uma única vez.
+        """
+        assinatura = hash_canonico(
+            {
+                # A assinatura da GradeTable cobre a ordem das grades e dos
+                # tamanhos; a lista de recursos preserva a ordem das variáveis
+                "tabela": tabela.assinatura,
+                "recursos": {
+                    tipo: [[r.id, r.eficiencia] for r in lista]
+                    for tipo, lista in recursos.items()
+                },
+                "comprimento_mesa_enfesto": comprimento_mesa_enfesto,
+                "percentual_superproducao": percentual_superproducao,
+                "max_camadas_por_grade": max_camadas_por_grade,
+                "horas_producao": horas_producao,
+                "penalizacao_superproducao": penalizacao_superproducao,
+                "motor": motor,
+                "opcoes_motor": opcoes_motor or {},
+                "opcoes_solver": opcoes_solver or {},
+            }
+        )
+        return ContextoCache(self, assinatura)
+
+    def _caminho(self, chave):
+        return os.path.join(self.diretorio, chave[:2], f"{chave}.json")
+
+    def obter(self, chave):
+        """Retorna (encontrado, resultado); resultado None indica pedido inviável."""
+        with self._lock:
+            if chave in self._memoria:
+                self._memoria.move_to_end(chave)
+                self.contadores["hits_memoria"] += 1
+                return True, json.loads(self._memoria[chave])["resultado"]
+
+        if self.diretorio:
+            try:
+                with open(self._caminho(chave), "r", encoding="utf-8") as f:
+                    serializado = f.read()
+            except FileNotFoundError:
+                serializado = None
+            except OSError as e:
+                logging.warning(f"Erro ao ler o cache em disco: {e}")
+                serializado = None
+            if serializado is not None:
+                with self._lock:
+                    self.contadores["hits_disco"] += 1
+                    self._inserir_memoria(chave, serializado)
+                return True, json.loads(serializado)["resultado"]
+
+        with self._lock:
+            self.contadores["misses"] += 1
+        return False, None
+
+    def armazenar(self, chave, resultado):
+        # Sem ordenar as chaves: a ordem de camadas e produção é preservada
+        serializado = json.dumps({"resultado": resultado}, default=str)
+        with self._lock:
+            self.contadores["gravacoes"] += 1
+            self._inserir_memoria(chave, serializado)
+            if self._gravacoes is not None:
+                self._gravacoes.append((chave, serializado))
+
+        if self.diretorio:
+            caminho = self._caminho(chave)
+            try:
+                os.makedirs(os.path.dirname(caminho), exist_ok=True)
+                # Escrita atômica para leitores concorrentes de outros processos
+                fd, temporario = tempfile.mkstemp(dir=os.path.dirname(caminho))
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    f.write(serializado)
+                os.replace(temporario, caminho)
+            except OSError as e:
+                logging.warning(f"Erro ao gravar o cache em disco: {e}")
+
+    def _inserir_memoria(self, chave, serializado):
+        # Guarda o JSON serializado: cada leitura devolve uma cópia independente
+        self._memoria[chave] = serializado
+        self._memoria.move_to_end(chave)
+        while len(self._memoria) > self.max_itens:
+            self._memoria.popitem(last=False)
+
+    def retirar_gravacoes(self):
+        """Entradas gravadas nesta cópia desde a última chamada."""
+        with self._lock:
+            if not self._gravacoes:
+                return []
+            gravacoes, self._gravacoes = self._gravacoes, []
+        return gravacoes
+
+    def incorporar(self, gravacoes):
+        """Insere no nível em memória entradas gravadas em outro processo."""
+        with self._lock:
+            for chave, serializado in gravacoes:
+                self._inserir_memoria(chave, serializado)
+
+    def acumular(self, contadores):
+        """Soma contadores registrados em outro processo."""
+        with self._lock:
+            for nome, valor in contadores.items():
+                self.contadores[nome] += valor
+
+    def estatisticas(self):
+        with self._lock:
+            contadores = dict(self.contadores)
+            itens_memoria = len(self._memoria)
+        consultas = (
+            contadores["hits_memoria"] + contadores["hits_disco"] + contadores["misses"]
+        )
+        hits = contadores["hits_memoria"] + contadores["hits_disco"]
+        return {
+            **contadores,
+            "itens_memoria": itens_memoria,
+            "taxa_acerto": hits / consultas if consultas else 0.0,
+        }
+
+
+class ContextoCache:
+    """Visão de CacheSolucoes para uma tabela de grades e parâmetros fixos."""
+
+    def __init__(self, cache, assinatura):
+        self.cache = cache
+        self.assinatura = assinatura
+
+    def chave(self, demandas, fator_relaxacao):
+        return hash_canonico(
+            {
+                "contexto": self.assinatura,
+                "demandas": demandas,
+                "fator_relaxacao": fator_relaxacao,
+            }
+        )
+
+    def obter(self, demandas, fator_relaxacao):
+        return self.cache.obter(self.chave(demandas, fator_relaxacao))
+
+    def armazenar(self, demandas, fator_relaxacao, resultado):
+        self.cache.armazenar(self.chave(demandas, fator_relaxacao), resultado)
+
+
+_cache_padrao = None
+
+
+def obter_cache_padrao():
+    """Cache único por processo, configurado pelas variáveis de ambiente."""
+    global _cache_padrao
+    if _cache_padrao is None:
+        _cache_padrao = CacheSolucoes(CACHE_MAX_ITENS, CACHE_DIRETORIO)
+    return _cache_padrao
@@ -0,0 +1,111 @@
+import datetime
+from bisect import bisect_left, bisect_right
+
+
+# Horizonte inicial do calendário; é estendido sob demanda
+HORIZONTE_PADRAO_DIAS = 14
+
+
+class ShiftCalendar:
+    """Calendário de turnos com capacidade efetiva acumulada.
+
+    Expande os turnos em intervalos [início, fim) a partir de um dia de
+    origem e guarda, para cada intervalo, a capacidade efetiva acumulada até
+    ele (segundos de relógio × eficiência do turno). O fim de uma operação é
+    obtido por busca binária nesses pontos de quebra em vez de percorrer os
+    turnos um a um.
+
+    Turnos que viram a noite (fim <= início, como 22:00–06:00) terminam no
+    dia seguinte, e os horários são considerados com precisão de segundos.
+    Intervalos sobrepostos são cortados para não contar a mesma hora duas
+    vezes; turnos com eficiência zero não acumulam capacidade, mas ao menos
+    um turno precisa ter eficiência positiva.
+    """
+
+    def __init__(self, turnos, inicio, horizonte_dias=HORIZONTE_PADRAO_DIAS):
+        if not turnos:
+            raise ValueError("O calendário precisa de pelo menos um turno")
+        self.turnos = list(turnos)
+        # Sem capacidade nenhuma, capacidade_ate estenderia o horizonte até
+        # estourar o limite de datas
+        if not any(t.eficiencia > 0 for t in self.turnos):
+            raise ValueError("O calendário precisa de um turno com eficiência positiva")
+        # Começa um dia antes para incluir o turno noturno iniciado na véspera
+        self.origem = datetime.datetime.combine(
+            inicio.date() - datetime.timedelta(days=1), datetime.time()
+        )
+        self.horizonte_dias = 0
+        self._inicios = []
+        self._fins = []
+        self._eficiencias = []
+        self._acumulado_inicio = []
+        self._acumulado_fim = []
+        self._estender(horizonte_dias + 1)
+
+    def _segundos(self, instante):
+        return (instante - self.origem).total_seconds()
+
+    def _instante(self, segundos):
+        return self.origem + datetime.timedelta(seconds=round(segundos))
+
+    def _estender(self, dias):
+        """Acrescenta dias ao horizonte, mantendo os pontos de quebra."""
+        intervalos = []
+        for d in range(self.horizonte_dias, self.horizonte_dias + dias):
+            dia = self.origem.date() + datetime.timedelta(days=d)
+            for turno in self.turnos:
+                if turno.eficiencia <= 0:
+                    continue
+                inicio = datetime.datetime.combine(dia, turno.inicio)
+                fim = datetime.datetime.combine(dia, turno.fim)
+                if fim <= inicio:
+                    fim += datetime.timedelta(days=1)
+                intervalos.append(
+                    (self._segundos(inicio), self._segundos(fim), turno.eficiencia)
+                )
+        intervalos.sort()
+
+        acumulado = self._acumulado_fim[-1] if self._acumulado_fim else 0.0
+        for inicio, fim, eficiencia in intervalos:
+            if self._fins:
+                inicio = max(inicio, self._fins[-1])
+            if fim <= inicio:
+                continue
+            self._inicios.append(inicio)
+            self._fins.append(fim)
+            self._eficiencias.append(eficiencia)
+            self._acumulado_inicio.append(acumulado)
+            acumulado += (fim - inicio) * eficiencia
+            self._acumulado_fim.append(acumulado)
+        self.horizonte_dias += dias
+
+    def capacidade_ate(self, instante):
+        """Capacidade efetiva acumulada (em segundos) da origem até instante."""
+        s = self._segundos(instante)
+        if s < 0:
+            raise ValueError(
+                f"Instante {instante} anterior à origem do calendário {self.origem}"
+            )
+        while not self._fins or s > self._fins[-1]:
+            self._estender(max(self.horizonte_dias, 1))
+        i = bisect_right(self._inicios, s) - 1
+        if i < 0:
+            return 0.0
+        return self._acumulado_inicio[i] + (
+            min(s, self._fins[i]) - self._inicios[i]
+        ) * self._eficiencias[i]
+
+    def fim_operacao(self, inicio, duracao):
+        """Instante em que termina uma operação de duracao horas efetivas."""
+        if duracao <= 0:
+            return inicio
+        alvo = self.capacidade_ate(inicio) + duracao * 3600
+        while self._acumulado_fim[-1] < alvo:
+            self._estender(self.horizonte_dias)
+        # Primeiro intervalo cuja capacidade acumulada alcança o alvo
+        i = bisect_left(self._acumulado_fim, alvo)
+        s = (
+            self._inicios[i]
+            + (alvo - self._acumulado_inicio[i]) / self._eficiencias[i]
+        )
+        return self._instante(s)
@@ -0,0 +1,283 @@
+import datetime
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+from cache_solucoes import hash_canonico
+from tabela_grades import CAMPOS_GRADE, CAMPOS_TAMANHO
+
+
+# Catálogos enviados à API, guardados pelo hash do conteúdo
+CATALOGOS_MAX_ITENS = int(os.getenv("OTIMIZACAO_CATALOGOS_MAX_ITENS", 256))
+CATALOGOS_DIRETORIO = os.getenv("OTIMIZACAO_CATALOGOS_DIR") or None
+
+TIPOS_CATALOGO = ("pedidos", "grades", "turnos", "recursos")
+TIPOS_RECURSO = ("enfestadeiras", "maquinas_corte")
+# Campos da grade que dividem na GradeTable: zero geraria coeficientes
+# infinitos no modelo
+CAMPOS_GRADE_POSITIVOS = ("aproveitamento", "largura_tecido")
+
+
+def como_datetime_local(valor, campo="prazo"):
+    """Converte um instante ISO 8601 ou datetime em datetime local sem fuso.
+
+    data_inicio é um horário local sem fuso, então prazos com fuso ("...Z",
+    "+00:00") são convertidos para o fuso do servidor antes de compará-los.
+    """
+    if not isinstance(valor, datetime.datetime):
+        try:
+            # fromisoformat só aceita o sufixo Z a partir do Python 3.11
+            valor = datetime.datetime.fromisoformat(valor.replace("Z", "+00:00"))
+        except (AttributeError, ValueError):
+            raise ValueError(f"{campo} inválido: {valor!r} (use o formato ISO 8601)")
+    if valor.tzinfo is not None:
+        valor = valor.astimezone().replace(tzinfo=None)
+    return valor
+
+
+def _como_time(valor, campo):
+    if isinstance(valor, datetime.time):
+        return valor
+    try:
+        return datetime.time.fromisoformat(valor)
+    except (TypeError, ValueError):
+        raise ValueError(f"{campo} inválido: {valor!r} (use HH:MM)")
+
+
+def _numero(valor, campo):
+    if isinstance(valor, bool) or not isinstance(valor, (int, float)):
+        raise ValueError(f"{campo} deve ser numérico")
+    return valor
+
+
+def _positivo(valor, campo):
+    if _numero(valor, campo) <= 0:
+        raise ValueError(f"{campo} deve ser maior que zero")
+    return valor
+
+
+def _nao_negativo(valor, campo):
+    if _numero(valor, campo) < 0:
+        raise ValueError(f"{campo} não pode ser negativo")
+    return valor
+
+
+def _eficiencia(valor, campo):
+    # Eficiência zero tornaria infinitas as durações no calendário e nos recursos
+    return _positivo(valor, campo)
+
+
+def _normalizar_pedidos(pedidos):
+    if not isinstance(pedidos, dict) or not pedidos:
+        raise ValueError("pedidos deve ser um objeto {id: pedido} não vazio")
+    normalizados = {}
+    for p, pedido in pedidos.items():
+        if not isinstance(pedido, dict) or not isinstance(pedido.get("demandas"), dict):
+            raise ValueError(f"Pedido {p} sem demandas")
+        normalizado = dict(pedido)
+        normalizado["demandas"] = {
+            t: int(_numero(q, f"Demanda {t} do pedido {p}"))
+            for t, q in pedido["demandas"].items()
+        }
+        normalizado["prazo"] = como_datetime_local(
+            pedido.get("prazo"), f"Prazo do pedido {p}"
+        )
+        normalizados[p] = normalizado
+    return normalizados
+
+
+def _normalizar_grades(grades):
+    if not isinstance(grades, dict) or not grades:
+        raise ValueError("grades deve ser um objeto {nome: grade} não vazio")
+    tamanhos = None
+    for g, grade in grades.items():
+        if not isinstance(grade, dict):
+            raise ValueError(f"Grade {g} inválida")
+        for campo in ("quantidades",) + CAMPOS_TAMANHO:
+            if not isinstance(grade.get(campo), dict):
+                raise ValueError(f"Grade {g} sem {campo}")
+            if tamanhos is None:
+                tamanhos = list(grade[campo])
+            if set(grade[campo]) != set(tamanhos):
+                raise ValueError(
+                    f"Grade {g}: {campo} deve ter os tamanhos {', '.join(tamanhos)}"
+                )
+            for t, valor in grade[campo].items():
+                _nao_negativo(valor, f"Grade {g}: {campo}[{t}]")
+        for campo in CAMPOS_GRADE:
+            validar = _positivo if campo in CAMPOS_GRADE_POSITIVOS else _nao_negativo
+            validar(grade.get(campo), f"Grade {g}: {campo}")
+    return grades
+
+
+def _normalizar_turnos(turnos):
+    if not isinstance(turnos, list) or not turnos:
+        raise ValueError("turnos deve ser uma lista não vazia")
+    normalizados = []
+    for i, turno in enumerate(turnos):
+        if not isinstance(turno, dict):
+            raise ValueError(f"Turno {i} inválido")
+        inicio = _como_time(turno.get("inicio"), f"Início do turno {i}")
+        fim = _como_time(turno.get("fim"), f"Fim do turno {i}")
+        if inicio == fim:
+            raise ValueError(f"Turno {i} com início igual ao fim")
+        normalizados.append(
+            {
+                "inicio": inicio,
+                "fim": fim,
+                "eficiencia": _eficiencia(
+                    turno.get("eficiencia", 1.0), f"Eficiência do turno {i}"
+                ),
+            }
+        )
+    return normalizados
+
+
+def _normalizar_recursos(recursos):
+    if not isinstance(recursos, dict):
+        raise ValueError("recursos deve ser um objeto {enfestadeiras, maquinas_corte}")
+    normalizados = {}
+    for tipo in TIPOS_RECURSO:
+        lista = recursos.get(tipo)
+        if not isinstance(lista, list) or not lista:
+            raise ValueError(f"recursos sem {tipo}")
+        normalizados[tipo] = []
+        for r in lista:
+            if not isinstance(r, dict) or "id" not in r:
+                raise ValueError(f"Recurso inválido em {tipo}: {r!r}")
+            normalizados[tipo].append(
+                {
+                    "id": str(r["id"]),
+                    "eficiencia": _eficiencia(
+                        r.get("eficiencia"), f"Eficiência do recurso {r['id']}"
+                    ),
+                }
+            )
+    return normalizados
+
+
+_NORMALIZADORES = {
+    "pedidos": _normalizar_pedidos,
+    "grades": _normalizar_grades,
+    "turnos": _normalizar_turnos,
+    "recursos": _normalizar_recursos,
+}
+
+
+def validar_tipo(tipo):
+    if tipo not in TIPOS_CATALOGO:
+        raise ValueError(
+            f"Tipo de catálogo inválido: {tipo}. Use {', '.join(TIPOS_CATALOGO)}"
+        )
+    return tipo
+
+
+def normalizar_catalogo(tipo, conteudo):
+    """Valida o conteúdo JSON de um catálogo e o converte no formato de main.
+
+    Prazos e horários dos turnos chegam como strings ISO e viram datetime e
+    time; grades e recursos mantêm o formato de config.py. Levanta ValueError
+    se o conteúdo for inválido.
+    """
+    return _NORMALIZADORES[validar_tipo(tipo)](conteudo)
+
+
+def validar_demandas(pedidos, grades):
+    """Confere se todo pedido tem demanda para cada tamanho das grades."""
+    tamanhos = list(next(iter(grades.values()))["quantidades"])
+    for p, pedido in pedidos.items():
+        faltantes = [t for t in tamanhos if t not in pedido["demandas"]]
+        if faltantes:
+            raise ValueError(f"Pedido {p} sem demanda para: {', '.join(faltantes)}")
+
+
+class ArmazemCatalogos:
+    """Catálogos de pedidos, grades, turnos e recursos por hash do conteúdo.
+
+    Cada catálogo é validado e convertido uma vez, no envio, e a versão
+    convertida é mantida em um LRU em memória; as requisições que o
+    referenciam recebem o mesmo objeto, que não deve ser alterado. Com
+    diretorio, o JSON enviado também é gravado em disco e recarregado sob
+    demanda (por exemplo após reiniciar a API ou em outro processo).
+    """
+
+    def __init__(self, max_itens=CATALOGOS_MAX_ITENS, diretorio=None):
+        self.max_itens = max_itens
+        self.diretorio = diretorio
+        self._memoria = OrderedDict()
+        self._lock = threading.Lock()
+        if diretorio:
+            os.makedirs(diretorio, exist_ok=True)
+
+    def _caminho(self, tipo, chave):
+        return os.path.join(self.diretorio, tipo, f"{chave}.json")
+
+    def armazenar(self, tipo, conteudo):
+        """Valida e guarda o catálogo; retorna o hash que o referencia."""
+        normalizado = normalizar_catalogo(tipo, conteudo)
+        chave = hash_canonico(conteudo)
+        with self._lock:
+            existente = (tipo, chave) in self._memoria
+            self._inserir_memoria(tipo, chave, normalizado)
+
+        if self.diretorio and not existente:
+            caminho = self._caminho(tipo, chave)
+            try:
+                os.makedirs(os.path.dirname(caminho), exist_ok=True)
+                fd, temporario = tempfile.mkstemp(dir=os.path.dirname(caminho))
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(conteudo, f, default=str)
+                os.replace(temporario, caminho)
+            except OSError as e:
+                logging.warning(f"Erro ao gravar o catálogo em disco: {e}")
+        logging.info(f"Catálogo de {tipo} armazenado: {chave}")
+        return chave
+
+    def obter(self, tipo, chave):
+        """Catálogo convertido, ou None se o hash não for conhecido."""
+        validar_tipo(tipo)
+        with self._lock:
+            if (tipo, chave) in self._memoria:
+                self._memoria.move_to_end((tipo, chave))
+                return self._memoria[(tipo, chave)]
+
+        # O hash vem do cliente: só hexadecimal chega ao caminho em disco
+        if not self.diretorio or not chave.isalnum():
+            return None
+        try:
+            with open(self._caminho(tipo, chave), "r", encoding="utf-8") as f:
+                conteudo = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logging.warning(f"Erro ao ler o catálogo em disco: {e}")
+            return None
+        normalizado = normalizar_catalogo(tipo, conteudo)
+        with self._lock:
+            self._inserir_memoria(tipo, chave, normalizado)
+        return normalizado
+
+    def resolver(self, tipo, conteudo=None, chave=None):
+        """Entrada de uma requisição: enviada inline, por hash ou ausente (None)."""
+        if conteudo is not None and chave is not None:
+            raise ValueError(f"Envie {tipo} inline ou por catálogo, não ambos")
+        if chave is not None:
+            catalogo = self.obter(tipo, chave)
+            if catalogo is None:
+                raise ValueError(f"Catálogo de {tipo} não encontrado: {chave}")
+            return catalogo
+        if conteudo is not None:
+            return normalizar_catalogo(tipo, conteudo)
+        return None
+
+    def _inserir_memoria(self, tipo, chave, normalizado):
+        self._memoria[(tipo, chave)] = normalizado
+        self._memoria.move_to_end((tipo, chave))
+        while len(self._memoria) > self.max_itens:
+            self._memoria.popitem(last=False)
+
+
+armazem_catalogos = ArmazemCatalogos(diretorio=CATALOGOS_DIRETORIO)
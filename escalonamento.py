@@ -0,0 +1,317 @@
+import datetime
+import heapq
+import itertools
+
+from calendario_turnos import ShiftCalendar
+
+
+# Regras de despacho registradas: nome -> função que recebe um Tarefa e
+# retorna a chave de prioridade (menor chave é despachada primeiro)
+REGRAS_DESPACHO = {}
+
+
+def registrar_regra_despacho(nome):
+    """Decorador que registra uma regra de despacho com o nome dado."""
+
+    def registrar(regra):
+        REGRAS_DESPACHO[nome] = regra
+        return regra
+
+    return registrar
+
+
+class Tarefa:
+    """Um pedido a escalonar, com os dados usados pelas regras de despacho."""
+
+    def __init__(self, pedido, posicao, tempo_enfesto, tempo_corte, prazo=None):
+        self.pedido = pedido
+        self.posicao = posicao
+        self.tempo_enfesto = tempo_enfesto
+        self.tempo_corte = tempo_corte
+        self.prazo = prazo
+
+
+@registrar_regra_despacho("ordem")
+def _regra_ordem(tarefa):
+    # Ordem recebida (a priorização de main)
+    return tarefa.posicao
+
+
+@registrar_regra_despacho("prazo")
+def _regra_prazo(tarefa):
+    # Earliest due date; pedidos sem prazo vão para o fim
+    return (tarefa.prazo is None, tarefa.prazo or datetime.datetime.max, tarefa.posicao)
+
+
+@registrar_regra_despacho("menor_tempo")
+def _regra_menor_tempo(tarefa):
+    return (tarefa.tempo_enfesto + tarefa.tempo_corte, tarefa.posicao)
+
+
+@registrar_regra_despacho("maior_tempo")
+def _regra_maior_tempo(tarefa):
+    return (-(tarefa.tempo_enfesto + tarefa.tempo_corte), tarefa.posicao)
+
+
+def _obter_regra(regra):
+    if callable(regra):
+        return regra
+    try:
+        return REGRAS_DESPACHO[regra]
+    except KeyError:
+        raise ValueError(
+            f"Regra de despacho inválida: {regra}. "
+            f"Disponíveis: {', '.join(sorted(REGRAS_DESPACHO))}"
+        )
+
+
+def _como_datetime(prazo):
+    if prazo is None or isinstance(prazo, datetime.datetime):
+        return prazo
+    # Prazo só com a data vale até o fim do dia
+    return datetime.datetime.combine(prazo, datetime.time.max)
+
+
+class _FilaRecursos:
+    """Heap de recursos por instante de disponibilidade.
+
+    Em caso de empate, o recurso mais eficiente é escolhido primeiro.
+    disponibilidade, se dada, é o instante em que cada recurso fica livre.
+    """
+
+    def __init__(self, recursos, inicio, disponibilidade=None):
+        disponibilidade = disponibilidade or [inicio] * len(recursos)
+        self._heap = [
+            (livre, -r.eficiencia, i, r)
+            for i, (r, livre) in enumerate(zip(recursos, disponibilidade))
+        ]
+        heapq.heapify(self._heap)
+
+    def proximo_livre(self):
+        return self._heap[0][0]
+
+    def alocar(self):
+        disponivel, _, i, recurso = heapq.heappop(self._heap)
+        return disponivel, i, recurso
+
+    def liberar(self, instante, i, recurso):
+        heapq.heappush(self._heap, (instante, -recurso.eficiencia, i, recurso))
+
+
+def escalonar(
+    pedidos_ordenados,
+    resultados,
+    data_inicio,
+    recursos,
+    turnos,
+    pedidos=None,
+    regra_enfesto="ordem",
+    regra_corte=None,
+    registro=None,
+):
+    """Escalona enfesto e corte dos pedidos em enfestadeiras e máquinas de corte.
+
+    Cada etapa usa um heap de recursos por instante de disponibilidade e um
+    heap de pedidos pela chave da regra de despacho, de modo que cada
+    despacho custa O(log recursos + log pedidos). A duração de uma operação
+    em um recurso é o tempo do resultado dividido pela eficiência do
+    recurso, convertida em horário pelo calendário de turnos.
+
+    No corte, uma máquina livre escolhe, entre os pedidos com enfesto já
+    concluído, o de menor chave em regra_corte (por padrão, a mesma regra do
+    enfesto); sem pedido pronto, espera o próximo enfesto terminar. Com
+    pedidos, o prazo de cada pedido é usado pela regra "prazo" e para
+    calcular o atraso.
+
+    Com registro (um dicionário), grava nele a sequência de despachos de
+    cada etapa, usada por reparar_escalonamento.
+    """
+    return reparar_escalonamento(
+        {},
+        {"enfesto": [], "corte": []},
+        pedidos_ordenados,
+        resultados,
+        data_inicio,
+        recursos,
+        turnos,
+        afetados=(),
+        pedidos=pedidos,
+        regra_enfesto=regra_enfesto,
+        regra_corte=regra_corte,
+        registro=registro,
+    )
+
+
+def _disponibilidade(recursos, cronograma, despachados, campo_recurso, campo_fim, inicio):
+    """Instante em que cada recurso fica livre após os despachos mantidos."""
+    livre = {r.id: inicio for r in recursos}
+    for p in despachados:
+        item = cronograma[p]
+        livre[item[campo_recurso]] = max(livre[item[campo_recurso]], item[campo_fim])
+    return [livre[r.id] for r in recursos]
+
+
+def reparar_escalonamento(
+    cronograma,
+    registro_anterior,
+    pedidos_ordenados,
+    resultados,
+    data_inicio,
+    recursos,
+    turnos,
+    afetados,
+    pedidos=None,
+    regra_enfesto="ordem",
+    regra_corte=None,
+    registro=None,
+):
+    """Refaz um cronograma a partir do primeiro despacho afetado.
+
+    cronograma e registro_anterior vêm de um escalonar (ou reparo) anterior
+    com os mesmos recursos, turnos e regras; afetados são os pedidos
+    incluídos, alterados ou removidos desde então. O despacho é guloso e
+    sequencial, então os despachos anteriores ao primeiro afetado saem
+    iguais: eles são mantidos, o estado dos recursos é reconstruído a partir
+    deles e só o restante é despachado de novo. O resultado é o mesmo de um
+    escalonar completo sempre que as chaves da regra não empatam (as regras
+    registradas desempatam pela posição).
+
+    No corte, um despacho é mantido se foi decidido antes de qualquer enfesto
+    refeito terminar, no cronograma anterior ou no novo.
+    """
+    regra_enfesto = _obter_regra(regra_enfesto)
+    regra_corte = _obter_regra(regra_corte) if regra_corte else regra_enfesto
+    calendario = (
+        turnos
+        if isinstance(turnos, ShiftCalendar)
+        else ShiftCalendar(turnos, data_inicio)
+    )
+    afetados = set(afetados)
+
+    tarefas = [
+        Tarefa(
+            p,
+            posicao,
+            resultados[p]["tempo_enfesto"],
+            resultados[p]["tempo_corte"],
+            _como_datetime(pedidos[p].get("prazo")) if pedidos is not None else None,
+        )
+        for posicao, p in enumerate(pedidos_ordenados)
+    ]
+    # Contador desempata chaves iguais sem comparar as tarefas
+    desempate = itertools.count()
+
+    # Enfesto: todos os pedidos estão disponíveis desde data_inicio, então a
+    # sequência de despacho é a ordem das chaves da regra
+    fila = [(regra_enfesto(t), next(desempate), t) for t in tarefas]
+    heapq.heapify(fila)
+    sequencia = [heapq.heappop(fila)[2] for _ in range(len(fila))]
+
+    mantidos = 0
+    for anterior, tarefa in zip(registro_anterior["enfesto"], sequencia):
+        if anterior != tarefa.pedido or anterior in afetados:
+            break
+        mantidos += 1
+    prefixo = [t.pedido for t in sequencia[:mantidos]]
+    refeitos = set(registro_anterior["enfesto"][mantidos:]) | {
+        t.pedido for t in sequencia[mantidos:]
+    }
+
+    novo = {p: dict(cronograma[p]) for p in prefixo}
+    enfestadeiras = _FilaRecursos(
+        recursos["enfestadeiras"],
+        data_inicio,
+        _disponibilidade(
+            recursos["enfestadeiras"], cronograma, prefixo,
+            "enfestadeira", "fim_enfestamento", data_inicio,
+        ),
+    )
+    for tarefa in sequencia[mantidos:]:
+        inicio, i, enfestadeira = enfestadeiras.alocar()
+        fim = calendario.fim_operacao(
+            inicio, tarefa.tempo_enfesto / enfestadeira.eficiencia
+        )
+        enfestadeiras.liberar(fim, i, enfestadeira)
+        novo[tarefa.pedido] = {
+            "inicio_enfestamento": inicio,
+            "fim_enfestamento": fim,
+            "enfestadeira": enfestadeira.id,
+        }
+
+    # Primeiro término de enfesto refeito, no cronograma anterior ou no novo
+    limite = min(
+        [cronograma[p]["fim_enfestamento"] for p in refeitos if p in cronograma]
+        + [novo[p]["fim_enfestamento"] for p in refeitos if p in novo],
+        default=None,
+    )
+    cortes_mantidos = []
+    for p, decisao in registro_anterior["corte"]:
+        if limite is not None and decisao >= limite:
+            break
+        cortes_mantidos.append((p, decisao))
+    cortados = {p for p, _ in cortes_mantidos}
+    for p, _ in cortes_mantidos:
+        item = cronograma[p]
+        novo[p].update(
+            {k: item[k] for k in ("inicio_corte", "fim_corte", "maquina_corte")}
+        )
+        for k in ("prazo", "atraso_horas"):
+            if k in item:
+                novo[p][k] = item[k]
+
+    liberados = [
+        (novo[t.pedido]["fim_enfestamento"], next(desempate), t)
+        for t in sequencia
+        if t.pedido not in cortados
+    ]
+    heapq.heapify(liberados)
+
+    # Corte: simulação por eventos sobre os pedidos liberados pelo enfesto
+    maquinas = _FilaRecursos(
+        recursos["maquinas_corte"],
+        data_inicio,
+        _disponibilidade(
+            recursos["maquinas_corte"], cronograma, cortados,
+            "maquina_corte", "fim_corte", data_inicio,
+        ),
+    )
+    decisoes = list(cortes_mantidos)
+    prontos = []
+    while liberados or prontos:
+        livre = maquinas.proximo_livre()
+        if not prontos:
+            livre = max(livre, liberados[0][0])
+        while liberados and liberados[0][0] <= livre:
+            _, _, tarefa = heapq.heappop(liberados)
+            heapq.heappush(prontos, (regra_corte(tarefa), next(desempate), tarefa))
+        _, _, tarefa = heapq.heappop(prontos)
+        decisoes.append((tarefa.pedido, livre))
+        disponivel, i, maquina = maquinas.alocar()
+        inicio = max(disponivel, novo[tarefa.pedido]["fim_enfestamento"])
+        fim = calendario.fim_operacao(inicio, tarefa.tempo_corte / maquina.eficiencia)
+        maquinas.liberar(fim, i, maquina)
+
+        item = novo[tarefa.pedido]
+        item.update(
+            {
+                "inicio_corte": inicio,
+                "fim_corte": fim,
+                "maquina_corte": maquina.id,
+            }
+        )
+        if tarefa.prazo is not None:
+            item["prazo"] = tarefa.prazo
+            item["atraso_horas"] = max(
+                0.0, (fim - tarefa.prazo).total_seconds() / 3600
+            )
+
+    if registro is not None:
+        registro.update(
+            enfesto=[t.pedido for t in sequencia],
+            corte=decisoes,
+            enfesto_mantidos=mantidos,
+            corte_mantidos=len(cortes_mantidos),
+        )
+
+    # Mesma ordem de pedidos_ordenados, como no cronograma anterior
+    return {p: novo[p] for p in pedidos_ordenados}
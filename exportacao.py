@@ -0,0 +1,138 @@
+import csv
+import os
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, PatternFill
+
+
+# Linhas gravadas por lote no Parquet
+TAMANHO_LOTE_PARQUET = 10_000
+
+FORMATOS = ("xlsx", "csv", "parquet")
+
+
+class Secao(list):
+    """Linha de título de seção (negrito, maior) no Excel."""
+
+    def __init__(self, titulo):
+        super().__init__([titulo])
+
+
+class Cabecalho(list):
+    """Linha de cabeçalho de tabela (negrito, fundo cinza) no Excel."""
+
+
+def formato_arquivo(nome_arquivo):
+    formato = os.path.splitext(nome_arquivo)[1].lstrip(".").lower()
+    if formato not in FORMATOS:
+        raise ValueError(
+            f"Formato de exportação inválido: {formato}. Use {', '.join(FORMATOS)}"
+        )
+    return formato
+
+
+def exportar_linhas(linhas, nome_arquivo, titulo_planilha="Resultados", colunas=None):
+    """Grava as linhas de um gerador em xlsx, csv ou parquet, pela extensão.
+
+    As linhas são consumidas uma a uma e gravadas em modo streaming (Excel
+    write-only, csv linha a linha, Parquet em lotes), com memória constante
+    em relação ao número de linhas. Linhas Secao e Cabecalho recebem estilo
+    no Excel e são gravadas como linhas comuns no csv.
+
+    Parquet exige uma tabela plana: colunas dá os nomes das colunas e cada
+    linha deve ter um valor por coluna (Secao e Cabecalho não são aceitos).
+    Requer o pacote opcional pyarrow.
+
+    Retorna o número de linhas gravadas.
+    """
+    formato = formato_arquivo(nome_arquivo)
+    if formato == "xlsx":
+        return _exportar_xlsx(linhas, nome_arquivo, titulo_planilha, colunas)
+    if formato == "csv":
+        return _exportar_csv(linhas, nome_arquivo, colunas)
+    return _exportar_parquet(linhas, nome_arquivo, colunas)
+
+
+def _exportar_xlsx(linhas, nome_arquivo, titulo_planilha, colunas):
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(titulo_planilha)
+
+    fonte_secao = Font(bold=True, size=14)
+    fonte_cabecalho = Font(bold=True)
+    fundo_cabecalho = PatternFill(
+        start_color="DDDDDD", end_color="DDDDDD", fill_type="solid"
+    )
+
+    def celulas(valores, fonte, fundo=None):
+        for valor in valores:
+            cell = WriteOnlyCell(ws, value=valor)
+            cell.font = fonte
+            if fundo is not None:
+                cell.fill = fundo
+            yield cell
+
+    total = 0
+    if colunas is not None:
+        ws.append(list(celulas(colunas, fonte_cabecalho, fundo_cabecalho)))
+        total += 1
+    for linha in linhas:
+        if isinstance(linha, Secao):
+            ws.append(list(celulas(linha, fonte_secao)))
+        elif isinstance(linha, Cabecalho):
+            ws.append(list(celulas(linha, fonte_cabecalho, fundo_cabecalho)))
+        else:
+            ws.append(linha)
+        total += 1
+    wb.save(nome_arquivo)
+    return total
+
+
+def _exportar_csv(linhas, nome_arquivo, colunas):
+    total = 0
+    with open(nome_arquivo, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        if colunas is not None:
+            writer.writerow(colunas)
+            total += 1
+        for linha in linhas:
+            writer.writerow(linha)
+            total += 1
+    return total
+
+
+def _exportar_parquet(linhas, nome_arquivo, colunas):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Exportação em Parquet requer o pacote pyarrow")
+    if colunas is None:
+        raise ValueError("Exportação em Parquet requer os nomes das colunas")
+
+    writer = None
+    lote = []
+    total = 0
+
+    def gravar():
+        nonlocal writer
+        tabela = pa.Table.from_pylist([dict(zip(colunas, linha)) for linha in lote])
+        if writer is None:
+            writer = pq.ParquetWriter(nome_arquivo, tabela.schema)
+        writer.write_table(tabela.cast(writer.schema))
+        lote.clear()
+
+    try:
+        for linha in linhas:
+            if isinstance(linha, (Secao, Cabecalho)):
+                raise ValueError("Parquet aceita apenas linhas de dados")
+            lote.append(linha)
+            total += 1
+            if len(lote) >= TAMANHO_LOTE_PARQUET:
+                gravar()
+        if lote or writer is None:
+            gravar()
+    finally:
+        if writer is not None:
+            writer.close()
+    return total
@@ -0,0 +1,106 @@
+import datetime
+import json
+
+import numpy as np
+import plotly.graph_objects as go
+
+
+OPERACOES = ("Enfestamento", "Corte")
+
+# Campos do cronograma de cada operação: (início, fim, recurso, rótulo do recurso)
+CAMPOS_OPERACOES = (
+    ("inicio_enfestamento", "fim_enfestamento", "enfestadeira", "Enfestadeira"),
+    ("inicio_corte", "fim_corte", "maquina_corte", "Máquina de Corte"),
+)
+
+CORES_OPERACOES = ("#1f77b4", "#ff7f0e")
+
+
+def linha_do_tempo(cronograma, pedidos_ordenados, titulo):
+    """Converte o cronograma em uma linha do tempo colunar e compacta.
+
+    Cada tarefa (pedido × operação) ocupa uma posição nas listas pedido,
+    operacao, recurso, inicio e duracao; operacao e recurso são índices em
+    OPERACOES e em recursos, e inicio é contado em segundos a partir de
+    origem. É o formato gravado em JSON e lido pelo visualizador estático.
+    """
+    inicios = [
+        cronograma[p][inicio] for p in pedidos_ordenados for inicio, *_ in CAMPOS_OPERACOES
+    ]
+    origem = min(inicios) if inicios else datetime.datetime.now().replace(microsecond=0)
+
+    recursos = []
+    indice_recurso = {}
+    colunas = {"pedido": [], "operacao": [], "recurso": [], "inicio": [], "duracao": []}
+    for p in pedidos_ordenados:
+        etapas = cronograma[p]
+        for operacao, (inicio, fim, recurso, rotulo) in enumerate(CAMPOS_OPERACOES):
+            nome = f"{rotulo} {etapas[recurso]}"
+            if nome not in indice_recurso:
+                indice_recurso[nome] = len(recursos)
+                recursos.append(nome)
+            colunas["pedido"].append(str(p))
+            colunas["operacao"].append(operacao)
+            colunas["recurso"].append(indice_recurso[nome])
+            colunas["inicio"].append(round((etapas[inicio] - origem).total_seconds()))
+            colunas["duracao"].append(
+                round((etapas[fim] - etapas[inicio]).total_seconds())
+            )
+
+    return {
+        "versao": 1,
+        "titulo": titulo,
+        "origem": origem.isoformat(),
+        "operacoes": list(OPERACOES),
+        "recursos": recursos,
+        **colunas,
+    }
+
+
+def salvar_linha_do_tempo(linha, caminho_arquivo):
+    with open(caminho_arquivo, "w", encoding="utf-8") as f:
+        json.dump(linha, f, ensure_ascii=False, separators=(",", ":"))
+
+
+def figura_gantt(linha):
+    """Monta o Gantt a partir da linha do tempo, com uma barra horizontal por operação.
+
+    Usa um go.Bar por operação sobre arrays (base = início, x = duração em
+    ms), sem criar um shape por tarefa como plotly.figure_factory.create_gantt.
+    """
+    origem = np.datetime64(linha["origem"], "ms")
+    operacao = np.asarray(linha["operacao"], dtype=np.int64)
+    inicio = origem + np.asarray(linha["inicio"], dtype=np.int64) * np.timedelta64(1, "s")
+    duracao_ms = np.asarray(linha["duracao"], dtype=np.int64) * 1000
+    recursos = np.asarray(linha["recursos"], dtype=object)
+    recurso = np.asarray(linha["recurso"], dtype=np.int64)
+    pedido = np.asarray(linha["pedido"], dtype=object)
+
+    fig = go.Figure()
+    for i, nome in enumerate(linha["operacoes"]):
+        selecao = operacao == i
+        fim = inicio[selecao] + duracao_ms[selecao] * np.timedelta64(1, "ms")
+        fig.add_trace(
+            go.Bar(
+                name=nome,
+                orientation="h",
+                base=inicio[selecao].astype(str),
+                x=duracao_ms[selecao],
+                y=recursos[recurso[selecao]] if len(recursos) else [],
+                customdata=np.column_stack(
+                    (pedido[selecao], inicio[selecao].astype(str), fim.astype(str))
+                ),
+                hovertemplate=(
+                    "Pedido %{customdata[0]}<br>%{y}<br>"
+                    "%{customdata[1]} – %{customdata[2]}<extra>" + nome + "</extra>"
+                ),
+                marker_color=CORES_OPERACOES[i % len(CORES_OPERACOES)],
+            )
+        )
+    fig.update_layout(
+        title=linha["titulo"],
+        xaxis=dict(type="date", title="Data"),
+        yaxis=dict(title="Recursos", autorange="reversed"),
+        barmode="overlay",
+    )
+    return fig
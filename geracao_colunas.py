@@ -0,0 +1,414 @@
+import logging
+
+import numpy as np
+from ortools.linear_solver import pywraplp
+
+from tabela_grades import GradeTable
+
+
+# Custo das variáveis artificiais de demanda do mestre; mantém o LP sempre
+# viável enquanto o pool ainda não cobre a demanda
+CUSTO_ARTIFICIAL = 1e6
+
+# Custo reduzido abaixo do qual uma coluna é considerada atrativa
+TOLERANCIA_CUSTO_REDUZIDO = 1e-6
+
+# Dados de uma grade que definem a mochila do pricing; grades que só diferem
+# nos custos fixos (setup, enfesto fixo) ou nas quantidades resolvem a mesma
+CAMPOS_MOCHILA = (
+    "aproveitamento",
+    "largura_tecido",
+    "custo_tecido",
+    "custo_corte",
+    "custo_enfesto_variavel",
+    "tempo_enfesto_por_metro",
+    "tempo_corte_por_metro",
+    "areas",
+    "perimetros",
+    "larguras",
+)
+
+
+def nome_grade_gerada(modelo, tamanhos, quantidades):
+    """Nome determinístico de uma grade gerada a partir de uma grade modelo."""
+    composicao = ",".join(f"{t}{int(q)}" for t, q in zip(tamanhos, quantidades))
+    return f"{modelo}[{composicao}]"
+
+
+class ModeloGeracaoColunas:
+    """Motor de geração de colunas (Gilmore-Gomory) para um pedido.
+
+    Mesma interface de PedidoModel (solve(demandas, fator_relaxacao, dica)),
+    mas em vez de uma variável por grade do catálogo parte de um pool pequeno
+    de grades e adiciona colunas enquanto o LP mestre indicar custo reduzido
+    negativo:
+
+    - o mestre é a relaxação linear de otimizar_pedido restrita ao pool, com
+      o setup amortizado por max_camadas_por_grade e a capacidade somada de
+      todos os recursos;
+    - o pricing avalia as grades do catálogo fora do pool e, com
+      gerar_grades=True, resolve para cada grade modelo uma mochila inteira
+      sobre o vetor de tamanhos (largura das peças contra a largura do tecido)
+      para compor novas grades.
+
+    Ao final, o MIP de PedidoModel é resolvido sobre o pool. Cada solve parte
+    do mesmo pool inicial, de modo que o resultado depende só das demandas e
+    do fator (como a chave do cache), e não dos pedidos resolvidos antes no
+    mesmo processo. Um solve que atinge max_iteracoes não é conclusivo.
+    """
+
+    def __init__(
+        self,
+        tabela,
+        comprimento_mesa_enfesto,
+        recursos,
+        percentual_superproducao,
+        max_camadas_por_grade,
+        horas_producao,
+        penalizacao_superproducao,
+        gerar_grades=False,
+        max_pecas_por_grade=10,
+        max_iteracoes=50,
+        colunas_por_iteracao=5,
+        opcoes_solver=None,
+    ):
+        # Import local: min_cost_production importa este módulo
+        from min_cost_production import PedidoModel
+
+        self._classe_modelo = PedidoModel
+        self.tabela = tabela
+        self.comprimento_mesa_enfesto = comprimento_mesa_enfesto
+        self.recursos = recursos
+        self.percentual_superproducao = percentual_superproducao
+        self.max_camadas_por_grade = max_camadas_por_grade
+        self.horas_producao = horas_producao
+        self.penalizacao_superproducao = penalizacao_superproducao
+        self.gerar_grades = gerar_grades
+        self.max_pecas_por_grade = max_pecas_por_grade
+        self.max_iteracoes = max_iteracoes
+        self.colunas_por_iteracao = colunas_por_iteracao
+        self.opcoes_solver = opcoes_solver
+
+        self.capacidade_enfesto = horas_producao * sum(
+            r.eficiencia for r in recursos["enfestadeiras"]
+        )
+        self.capacidade_corte = horas_producao * sum(
+            r.eficiencia for r in recursos["maquinas_corte"]
+        )
+
+        # Pool de colunas: {nome: grade no formato do catálogo} e a origem
+        self.pool = {}
+        self.origem = {}
+        self._tabela_pool = None
+        self._modelo_pool = None
+        self._grupos_mochila = None
+        self._conclusivo = True
+        self._iniciais = self._grades_iniciais()
+        self._reiniciar_pool()
+
+    def _grades_iniciais(self):
+        """Para cada tamanho, a grade do catálogo com menor custo por peça dele."""
+        t = self.tabela
+        custo = t.custo_por_camada + t.custo_setup / self.max_camadas_por_grade
+        iniciais = []
+        for j in range(len(t.tamanhos)):
+            pecas = t.quantidades[:, j]
+            if not pecas.any():
+                continue
+            custo_por_peca = np.where(pecas > 0, custo / np.maximum(pecas, 1), np.inf)
+            g = t.nomes[int(np.argmin(custo_por_peca))]
+            if g not in iniciais:
+                iniciais.append(g)
+        return iniciais
+
+    def _reiniciar_pool(self):
+        self.pool = {}
+        self.origem = {}
+        for g in self._iniciais:
+            self._adicionar(g, self.tabela.grade(g), "catalogo")
+
+    def _adicionar(self, nome, grade, origem):
+        self.pool[nome] = grade
+        self.origem[nome] = origem
+        self._tabela_pool = None
+        self._modelo_pool = None
+
+    def _tabela(self):
+        if self._tabela_pool is None:
+            self._tabela_pool = GradeTable(
+                self.pool, self.tabela.tamanhos, self.tabela.tolerancia_largura
+            )
+        return self._tabela_pool
+
+    def _resolver_mestre(self, tabela, demandas, comprimento_enfesto_maximo):
+        """Resolve o LP mestre restrito e retorna (valor, artificial, duais)."""
+        solver = pywraplp.Solver.CreateSolver("GLOP")
+        infinito = solver.infinity()
+        x = [
+            solver.NumVar(0, self.max_camadas_por_grade, f"x_{g}") for g in tabela.nomes
+        ]
+        superproducao = [
+            solver.NumVar(0, infinito, f"super_{t}") for t in tabela.tamanhos
+        ]
+        artificial = [
+            solver.NumVar(0, infinito, f"artificial_{t}") for t in tabela.tamanhos
+        ]
+
+        linhas = []
+        for j, t in enumerate(tabela.tamanhos):
+            quantidades = tabela.quantidades[:, j].tolist()
+            minima = solver.Constraint(demandas[t], infinito, f"demanda_min_{t}")
+            maxima = solver.Constraint(
+                -infinito,
+                demandas[t] * (1 + self.percentual_superproducao),
+                f"demanda_max_{t}",
+            )
+            for xg, q in zip(x, quantidades):
+                minima.SetCoefficient(xg, q)
+                maxima.SetCoefficient(xg, q)
+            minima.SetCoefficient(artificial[j], 1)
+            maxima.SetCoefficient(superproducao[j], -1)
+            linhas.append(("demanda", j, minima))
+            linhas.append(("demanda", j, maxima))
+
+        for nome, coeficientes, limite in (
+            ("comprimento", tabela.comprimento_enfesto, comprimento_enfesto_maximo),
+            ("enfesto", tabela.tempo_enfesto_por_camada, self.capacidade_enfesto),
+            ("corte", tabela.tempo_corte_por_camada, self.capacidade_corte),
+        ):
+            ct = solver.Constraint(-infinito, limite, nome)
+            for xg, c in zip(x, coeficientes.tolist()):
+                ct.SetCoefficient(xg, c)
+            linhas.append((nome, None, ct))
+
+        objetivo = solver.Objective()
+        custo = tabela.custo_por_camada + tabela.custo_setup / self.max_camadas_por_grade
+        for xg, c in zip(x, custo.tolist()):
+            objetivo.SetCoefficient(xg, c)
+        for s in superproducao:
+            objetivo.SetCoefficient(s, self.penalizacao_superproducao)
+        for a in artificial:
+            objetivo.SetCoefficient(a, CUSTO_ARTIFICIAL)
+        objetivo.SetMinimization()
+
+        if solver.Solve() != pywraplp.Solver.OPTIMAL:
+            return None
+
+        # Duais agregados por tipo de linha: custo reduzido = c - A^T y
+        duais = {
+            "demanda": np.zeros(len(tabela.tamanhos)),
+            "comprimento": 0.0,
+            "enfesto": 0.0,
+            "corte": 0.0,
+        }
+        for nome, j, ct in linhas:
+            if j is None:
+                duais[nome] = ct.dual_value()
+            else:
+                duais[nome][j] += ct.dual_value()
+        return (
+            objetivo.Value(),
+            sum(a.solution_value() for a in artificial),
+            duais,
+        )
+
+    def _custos_reduzidos(self, tabela, duais):
+        return (
+            tabela.custo_por_camada
+            + tabela.custo_setup / self.max_camadas_por_grade
+            - tabela.quantidades @ duais["demanda"]
+            - tabela.comprimento_enfesto * duais["comprimento"]
+            - tabela.tempo_enfesto_por_camada * duais["enfesto"]
+            - tabela.tempo_corte_por_camada * duais["corte"]
+        )
+
+    def _precificar_catalogo(self, duais):
+        t = self.tabela
+        custos = self._custos_reduzidos(t, duais)
+        candidatas = [
+            (c, g)
+            for g, c in zip(t.nomes, custos.tolist())
+            if g not in self.pool and c < -TOLERANCIA_CUSTO_REDUZIDO
+        ]
+        return [(c, g, t.grade(g), "catalogo") for c, g in candidatas]
+
+    def _grupos(self):
+        """Índices das grades do catálogo agrupados por dados da mochila."""
+        if self._grupos_mochila is None:
+            t = self.tabela
+            grupos = {}
+            for i in range(len(t)):
+                chave = tuple(
+                    np.asarray(getattr(t, campo)[i]).tobytes() for campo in CAMPOS_MOCHILA
+                )
+                grupos.setdefault(chave, []).append(i)
+            self._grupos_mochila = list(grupos.values())
+        return self._grupos_mochila
+
+    def _precificar_mochila(self, duais):
+        """Compõe, para cada grade modelo, a grade gerada de menor custo reduzido.
+
+        O custo reduzido de uma grade é linear nas quantidades por tamanho
+        (área, perímetro e comprimento do enfesto são somas por peça), então
+        o pricing é uma mochila inteira limitada pela largura do tecido. A
+        mochila só depende de CAMPOS_MOCHILA: é resolvida uma vez por grupo de
+        grades com os mesmos dados, e cada grade do grupo soma a ela o
+        próprio custo fixo, de modo que o número de MIPs por iteração cresce
+        com a variedade de tecidos e peças, não com o tamanho do catálogo.
+        """
+        t = self.tabela
+        colunas = []
+        vistas = set()
+        for grupo in self._grupos():
+            i = grupo[0]
+            aproveitamento = t.aproveitamento[i]
+            largura_tecido = t.largura_tecido[i]
+            # Comprimento do enfesto por peça de cada tamanho
+            comprimento = t.areas[i] / (largura_tecido * aproveitamento)
+            custo_peca = (
+                t.areas[i] / aproveitamento * t.custo_tecido[i]
+                + t.perimetros[i] * t.custo_corte[i]
+                + comprimento * t.custo_enfesto_variavel[i]
+            )
+            reduzido_peca = (
+                custo_peca
+                - duais["demanda"]
+                - comprimento * duais["comprimento"]
+                - comprimento * t.tempo_enfesto_por_metro[i] * duais["enfesto"]
+                - t.perimetros[i] * t.tempo_corte_por_metro[i] * duais["corte"]
+            )
+            solver = pywraplp.Solver.CreateSolver("SCIP")
+            a = [
+                solver.IntVar(0, self.max_pecas_por_grade, f"a_{tam}")
+                for tam in t.tamanhos
+            ]
+            solver.Add(
+                solver.Sum(w * aj for w, aj in zip(t.larguras[i].tolist(), a))
+                <= largura_tecido * (1 + t.tolerancia_largura)
+            )
+            solver.Add(solver.Sum(a) >= 1)
+            solver.Minimize(
+                solver.Sum(r * aj for r, aj in zip(reduzido_peca.tolist(), a))
+            )
+            if solver.Solve() != pywraplp.Solver.OPTIMAL:
+                continue
+
+            quantidades = [int(round(aj.solution_value())) for aj in a]
+            valor_mochila = solver.Objective().Value()
+            iguais = (t.quantidades == quantidades).all(axis=1)
+            for i in grupo:
+                modelo = t.nomes[i]
+                fixo = t.custo_enfesto_fixo[i] + t.custo_setup[i] / self.max_camadas_por_grade
+                reduzido = fixo + valor_mochila
+                if reduzido >= -TOLERANCIA_CUSTO_REDUZIDO:
+                    continue
+                # Uma composição igual à de uma grade do catálogo é a própria grade
+                if iguais[i]:
+                    nome, grade, origem = modelo, t.grade(modelo), "catalogo"
+                else:
+                    nome = nome_grade_gerada(modelo, t.tamanhos, quantidades)
+                    grade = t.grade(modelo)
+                    grade["quantidades"] = dict(zip(t.tamanhos, quantidades))
+                    grade["custo_setup"] = t.custo_setup[i].item()
+                    grade["modelo"] = modelo
+                    origem = "gerada"
+                if nome in self.pool or nome in vistas:
+                    continue
+                vistas.add(nome)
+                colunas.append((reduzido, nome, grade, origem))
+        return colunas
+
+    def gerar_colunas(self, demandas, fator_relaxacao):
+        """Expande o pool até o LP mestre não ter colunas atrativas.
+
+        Retorna um resumo com o número de iterações, colunas adicionadas e o
+        limite inferior do LP, ou None se o LP só fecha a demanda com as
+        variáveis artificiais (pedido inviável para o fator dado). Se o LP
+        falhar ou as iterações se esgotarem, o resultado não é conclusivo:
+        o pool pode não ter as colunas que tornariam o pedido viável.
+        """
+        comprimento_enfesto_maximo = (
+            self.comprimento_mesa_enfesto * fator_relaxacao * self.max_camadas_por_grade
+        )
+        adicionadas = []
+        iteracao = 0
+        while True:
+            iteracao += 1
+            mestre = self._resolver_mestre(
+                self._tabela(), demandas, comprimento_enfesto_maximo
+            )
+            if mestre is None:
+                logging.warning("LP mestre da geração de colunas sem solução ótima")
+                self._conclusivo = False
+                return None
+            valor, artificial, duais = mestre
+            if iteracao > self.max_iteracoes:
+                logging.warning(
+                    f"Geração de colunas interrompida após {self.max_iteracoes} iterações"
+                )
+                self._conclusivo = False
+                break
+
+            candidatas = self._precificar_catalogo(duais)
+            if self.gerar_grades:
+                candidatas += self._precificar_mochila(duais)
+            if not candidatas:
+                break
+            candidatas.sort(key=lambda c: c[0])
+            for _, nome, grade, origem in candidatas[: self.colunas_por_iteracao]:
+                self._adicionar(nome, grade, origem)
+                adicionadas.append(nome)
+
+        if artificial > TOLERANCIA_CUSTO_REDUZIDO:
+            return None
+        return {
+            "iteracoes": iteracao,
+            "colunas_adicionadas": adicionadas,
+            "limite_inferior_lp": valor,
+            "tamanho_pool": len(self.pool),
+        }
+
+    def colunas(self):
+        """Pool atual: {nome: {origem, modelo, quantidades}}."""
+        return {
+            nome: {
+                "origem": self.origem[nome],
+                "modelo": grade.get("modelo", nome),
+                "quantidades": dict(grade["quantidades"]),
+            }
+            for nome, grade in self.pool.items()
+        }
+
+    @property
+    def conclusivo(self):
+        """Se o último solve terminou sem limite de iterações, tempo ou prazo."""
+        return self._conclusivo
+
+    def solve(self, demandas, fator_relaxacao, dica=None, opcoes_solver=None):
+        self._reiniciar_pool()
+        self._conclusivo = True
+        resumo = self.gerar_colunas(demandas, fator_relaxacao)
+        if resumo is None:
+            return None
+
+        if self._modelo_pool is None:
+            self._modelo_pool = self._classe_modelo(
+                self._tabela(),
+                self.comprimento_mesa_enfesto,
+                self.recursos,
+                self.percentual_superproducao,
+                self.max_camadas_por_grade,
+                self.horas_producao,
+                self.penalizacao_superproducao,
+                opcoes_solver=self.opcoes_solver,
+            )
+        resultado = self._modelo_pool.solve(
+            demandas, fator_relaxacao, dica=dica, opcoes_solver=opcoes_solver
+        )
+        self._conclusivo = self._conclusivo and self._modelo_pool.conclusivo
+        if resultado is None:
+            return None
+
+        resumo["colunas"] = self.colunas()
+        resultado["geracao_colunas"] = resumo
+        return resultado
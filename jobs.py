@@ -0,0 +1,311 @@
+import datetime
+import logging
+import multiprocessing
+import os
+import threading
+import uuid
+from concurrent.futures import InvalidStateError, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from cache_solucoes import obter_cache_padrao
+from metricas import coletar_tempos, registro
+from min_cost_production import main, OtimizacaoCancelada
+
+
+# Número máximo de otimizações executando simultaneamente (processos do pool)
+MAX_WORKERS = int(os.getenv("OTIMIZACAO_MAX_WORKERS", os.cpu_count() or 1))
+# Processos de solver que um job pode abrir (num_workers de /otimizar); o
+# total fica limitado a MAX_WORKERS × MAX_WORKERS_POR_JOB
+MAX_WORKERS_POR_JOB = int(
+    os.getenv("OTIMIZACAO_MAX_WORKERS_POR_JOB", max(1, (os.cpu_count() or 1) // MAX_WORKERS))
+)
+# Quantidade de jobs finalizados mantidos em memória para consulta
+MAX_JOBS_RETIDOS = int(os.getenv("OTIMIZACAO_MAX_JOBS_RETIDOS", 1000))
+
+PENDENTE = "pendente"
+EXECUTANDO = "executando"
+CONCLUIDO = "concluido"
+ERRO = "erro"
+CANCELADO = "cancelado"
+
+STATUS_FINAIS = (CONCLUIDO, ERRO, CANCELADO)
+
+
+def _agora():
+    return datetime.datetime.now().isoformat()
+
+
+def _resumo_parcial(resultado):
+    return {
+        "custo_total": float(resultado["custo_total"]),
+        "custo_setup": float(resultado["custo_setup"]),
+        "tempo_total": float(resultado["tempo_total"]),
+        "relaxacao_aplicada": float(resultado["relaxacao_aplicada"]),
+        "camadas": {
+            g: int(camadas)
+            for g, camadas in resultado["camadas"].items()
+            if camadas > 0
+        },
+    }
+
+
+class FalhaJob(Exception):
+    """Erro de um job acompanhado dos spans executados até a falha."""
+
+    def __init__(self, erro, spans):
+        super().__init__(erro, spans)
+        self.erro = erro
+        self.spans = spans
+
+
+def _executar_job(executar, parametros, estado, parciais, evento_cancelamento):
+    """Executa o job no processo do pool e retorna (retorno, spans).
+
+    Os spans voltam para alimentar o /metrics da API com qualquer desfecho:
+    se executar falha ou é cancelada, o erro vai embrulhado em FalhaJob.
+    """
+    estado["status"] = EXECUTANDO
+    estado["iniciado_em"] = _agora()
+    with coletar_tempos() as tempos:
+        try:
+            retorno = executar(parametros, estado, parciais, evento_cancelamento)
+        except Exception as erro:
+            raise FalhaJob(erro, tempos.spans)
+    return retorno, tempos.spans
+
+
+def _executar_otimizacao(parametros, estado, parciais, evento_cancelamento):
+    """Executa main dentro de um processo do pool.
+
+    O progresso é publicado nos proxies do Manager (estado e parciais) para
+    que o processo da API consulte o job sem esperar o término.
+    """
+
+    def registrar_parcial(p, resultado):
+        parciais[str(p)] = _resumo_parcial(resultado)
+
+    # O cache vive no processo do pool e é reaproveitado entre jobs
+    parametros = dict(parametros)
+    if parametros.pop("usar_cache", False):
+        parametros["cache"] = obter_cache_padrao()
+
+    return main(
+        **parametros,
+        callback_pedido=registrar_parcial,
+        evento_cancelamento=evento_cancelamento,
+    )
+
+
+class Job:
+    def __init__(
+        self, id, usuario, future, estado, parciais, evento_cancelamento, ao_finalizar=None
+    ):
+        self.id = id
+        self.usuario = usuario
+        self.future = future
+        self.estado = estado
+        self.parciais = parciais
+        self.evento_cancelamento = evento_cancelamento
+        self.ao_finalizar = ao_finalizar
+        # Pool em que o job roda, para identificar os afetados se ele quebrar
+        self.executor = None
+        self.criado_em = _agora()
+        self.finalizado_em = None
+        self.status = PENDENTE
+        self.resultado = None
+        self.erro = None
+
+
+class GerenciadorJobs:
+    """Fila de otimizações executadas em um pool limitado de processos.
+
+    O pool e o Manager são criados sob demanda no primeiro job, de modo que
+    importar a API não inicia processos. Se um processo do pool morre (falta
+    de memória, falha nativa do solver), o pool fica inutilizável: os jobs
+    que estavam nele terminam com erro e o próximo submeter cria outro pool.
+    """
+
+    def __init__(self, max_workers=MAX_WORKERS, max_jobs_retidos=MAX_JOBS_RETIDOS):
+        self.max_workers = max_workers
+        self.max_jobs_retidos = max_jobs_retidos
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._executor = None
+        self._manager = None
+
+    def _iniciar(self):
+        if self._executor is not None and self._executor._broken:
+            self._reiniciar_pool()
+        contexto = multiprocessing.get_context("spawn")
+        if self._manager is None or not self._manager._process.is_alive():
+            self._manager = contexto.Manager()
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers, mp_context=contexto
+            )
+            logging.info(f"Pool de otimização iniciado com {self.max_workers} processos")
+
+    def _reiniciar_pool(self):
+        """Descarta o pool quebrado; seus jobs não finalizados viram ERRO."""
+        logging.error("Pool de otimização quebrado (processo encerrado); recriando")
+        executor = self._executor
+        self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+        for job in self._jobs.values():
+            if job.executor is not executor or job.future.done():
+                continue
+            # Normalmente o próprio pool já falhou os futures; este é o caso
+            # de um job que ficou sem resposta
+            try:
+                job.future.set_exception(
+                    BrokenProcessPool("Processo do pool encerrado durante o job")
+                )
+            except InvalidStateError:
+                pass
+
+    def submeter(
+        self, usuario, parametros, executar=_executar_otimizacao, ao_finalizar=None, job_id=None
+    ):
+        """Enfileira executar(parametros, estado, parciais, evento_cancelamento).
+
+        executar deve ser uma função de módulo (é enviada ao processo do pool)
+        e retornar o resultado; os spans executados nela são coletados por
+        _executar_job e registrados no /metrics com qualquer status. ao_finalizar(status, retorno), se dado, é
+        chamada no processo da API quando o job termina, com qualquer status,
+        e o que ela retorna vira o resultado público do job; ela pode rodar
+        antes de submeter retornar, se o job terminar logo. job_id, se dado,
+        permite ao chamador conhecer o id antes disso.
+        """
+        with self._lock:
+            self._iniciar()
+            job_id = job_id or uuid.uuid4().hex
+            estado = self._manager.dict({"status": PENDENTE})
+            parciais = self._manager.dict()
+            evento_cancelamento = self._manager.Event()
+            argumentos = (_executar_job, executar, parametros, estado, parciais, evento_cancelamento)
+            try:
+                future = self._executor.submit(*argumentos)
+            except BrokenProcessPool:
+                # O pool quebrou depois da verificação de _iniciar
+                self._reiniciar_pool()
+                self._iniciar()
+                future = self._executor.submit(*argumentos)
+            job = Job(
+                job_id, usuario, future, estado, parciais, evento_cancelamento, ao_finalizar
+            )
+            job.executor = self._executor
+            self._jobs[job_id] = job
+            self._descartar_antigos()
+
+        future.add_done_callback(lambda f: self._finalizar(job, f))
+        logging.info(f"Job {job_id} submetido por {usuario}")
+        return job_id
+
+    def _finalizar(self, job, future):
+        resultado = None
+        if future.cancelled():
+            status = CANCELADO
+        else:
+            erro = future.exception()
+            if isinstance(erro, FalhaJob):
+                registro.registrar_spans(erro.spans)
+                erro = erro.erro
+            if erro is None:
+                resultado, spans = future.result()
+                registro.registrar_spans(spans)
+                status = CONCLUIDO
+            elif isinstance(erro, OtimizacaoCancelada):
+                status = CANCELADO
+                job.erro = str(erro)
+            else:
+                status = ERRO
+                job.erro = str(erro)
+                logging.error(f"Job {job.id} falhou: {erro}")
+        if job.ao_finalizar is not None:
+            try:
+                resultado = job.ao_finalizar(status, resultado)
+            except Exception as e:
+                status = ERRO
+                resultado = None
+                job.erro = str(e)
+                logging.error(f"Job {job.id} falhou ao finalizar: {e}")
+        # O status vem por último: consultar só lê o resultado de jobs finalizados
+        job.resultado = resultado
+        job.status = status
+        job.finalizado_em = _agora()
+        registro.incrementar(
+            "otimizacao_jobs_total", ajuda="Jobs finalizados por status", status=job.status
+        )
+        # Copia os parciais antes de descartar os proxies do Manager
+        try:
+            job.parciais = dict(job.parciais)
+            job.estado = dict(job.estado)
+        except Exception as e:
+            logging.warning(f"Não foi possível copiar o estado do job {job.id}: {e}")
+            job.parciais = {}
+            job.estado = {}
+        logging.info(f"Job {job.id} finalizado com status {job.status}")
+
+    def _descartar_antigos(self):
+        finalizados = [j for j in self._jobs.values() if j.status in STATUS_FINAIS]
+        excesso = len(finalizados) - self.max_jobs_retidos
+        for job in finalizados[:max(0, excesso)]:
+            del self._jobs[job.id]
+
+    def _obter(self, job_id, usuario):
+        job = self._jobs.get(job_id)
+        if job is None or job.usuario != usuario:
+            return None
+        return job
+
+    def consultar(self, job_id, usuario):
+        job = self._obter(job_id, usuario)
+        if job is None:
+            return None
+
+        status = job.status
+        iniciado_em = None
+        parciais = {}
+        try:
+            if status not in STATUS_FINAIS:
+                status = job.estado.get("status", PENDENTE)
+            iniciado_em = job.estado.get("iniciado_em")
+            parciais = dict(job.parciais)
+        except Exception as e:
+            logging.warning(f"Falha ao ler o progresso do job {job.id}: {e}")
+
+        return {
+            "job_id": job.id,
+            "status": status,
+            "criado_em": job.criado_em,
+            "iniciado_em": iniciado_em,
+            "finalizado_em": job.finalizado_em,
+            "pedidos_resolvidos": len(parciais),
+            "resultados_parciais": parciais,
+            "resultado": job.resultado,
+            "erro": job.erro,
+        }
+
+    def cancelar(self, job_id, usuario):
+        job = self._obter(job_id, usuario)
+        if job is None:
+            return None
+        if job.status not in STATUS_FINAIS:
+            # Pendentes saem da fila; em execução param no próximo pedido
+            if not job.future.cancel():
+                job.evento_cancelamento.set()
+        return self.consultar(job_id, usuario)
+
+    def encerrar(self):
+        with self._lock:
+            if self._executor is not None:
+                for job in self._jobs.values():
+                    if job.status not in STATUS_FINAIS:
+                        job.evento_cancelamento.set()
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._manager.shutdown()
+                self._executor = None
+                self._manager = None
+
+
+gerenciador_jobs = GerenciadorJobs()
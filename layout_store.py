@@ -0,0 +1,364 @@
+import json
+import weakref
+from array import array
+
+import numpy as np
+
+
+# Characters read from the input file per refill
+CHUNK_SIZE = 1 << 20
+
+# Numeric layout fields kept as columns
+LAYOUT_COLUMNS = (
+    "utilization",
+    "fabric_width",
+    "layout_length",
+    "total_perimeter",
+    "utilized_area",
+    "waste_area",
+    "total_area",
+)
+
+# Top-level arrays of the input file whose items are yielded one at a time
+STREAMED_SECTIONS = ("layouts", "fabrics", "production_orders")
+# Sections load_streaming reads before the first production order
+SETUP_SECTIONS = ("general_configuration", "layouts", "fabrics")
+
+
+class JsonStreamReader:
+    """Incremental reader for a JSON document made of one top-level object.
+
+    Values are decoded with json.JSONDecoder.raw_decode over a sliding text
+    buffer that is refilled from the file on demand, so only the value being
+    decoded has to be in memory. Items of the arrays named in
+    STREAMED_SECTIONS are yielded one by one instead of as a whole list.
+    """
+
+    def __init__(self, file, chunk_size=CHUNK_SIZE):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        chunk = self.file.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def _peek(self):
+        """Next non-whitespace character (not consumed), or '' at EOF."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ""
+
+    def _expect(self, chars):
+        char = self._peek()
+        if char == "" or char not in chars:
+            raise ValueError(
+                f"Invalid JSON input: expected one of {chars!r}, found {char!r}"
+            )
+        self.pos += 1
+        return char
+
+    def _value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # A number touching the end of the buffer may continue in the
+            # next chunk
+            if end == len(self.buffer) and not self.eof and self._fill():
+                continue
+            self.pos = end
+            return value
+
+    def _items(self):
+        self._expect("[")
+        if self._peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self._value()
+            if self._expect(",]") == "]":
+                return
+
+    def sections(self):
+        """Yield (key, value) for scalar sections and (key, item) per array item."""
+        self._expect("{")
+        if self._peek() == "}":
+            return
+        while True:
+            key = self._value()
+            self._expect(":")
+            if key in STREAMED_SECTIONS and self._peek() == "[":
+                for item in self._items():
+                    yield key, item
+            else:
+                yield key, self._value()
+            if self._expect(",}") == "}":
+                return
+
+
+class LayoutStore:
+    """Columnar, read-only store of layouts.
+
+    Numeric fields are NumPy columns indexed by layout position; pieces are
+    kept in CSR form (piece_start[i]:piece_start[i + 1] are the pieces of
+    layout i) with interned pattern ids and a pieces × sizes count matrix.
+    Layout dicts are rebuilt on demand by layout(i) and iteration.
+    """
+
+    def __init__(self, sizes):
+        self.sizes = list(sizes)
+        self._size_index = {s: j for j, s in enumerate(self.sizes)}
+        self.patterns = []
+        self.pattern_index = {}
+        self.fabric_names = []
+        self.fabric_index = {}
+        self.extras = {}
+        # Key order of the first layout, reused when rebuilding dicts
+        self.key_order = None
+        self._ids = []
+        self._fabric = array("i")
+        self._columns = {name: array("d") for name in LAYOUT_COLUMNS}
+        self._piece_start = array("q", [0])
+        self._piece_pattern = array("i")
+        self._piece_sizes = array("i")
+        self.frozen = False
+
+    @classmethod
+    def from_dicts(cls, layouts, sizes):
+        store = cls(sizes)
+        for layout in layouts:
+            store.append(layout)
+        return store.freeze()
+
+    @staticmethod
+    def _intern(value, values, index):
+        if value not in index:
+            index[value] = len(values)
+            values.append(value)
+        return index[value]
+
+    def append(self, layout):
+        if self.frozen:
+            raise ValueError("LayoutStore is read-only after freeze()")
+        i = len(self._ids)
+        if self.key_order is None:
+            self.key_order = list(layout)
+        self._ids.append(layout["id"])
+        self._fabric.append(
+            self._intern(layout["fabric"], self.fabric_names, self.fabric_index)
+        )
+        for name in LAYOUT_COLUMNS:
+            self._columns[name].append(layout.get(name, 0))
+        for piece in layout["pieces"]:
+            self._piece_pattern.append(
+                self._intern(piece["pattern"], self.patterns, self.pattern_index)
+            )
+            counts = [0] * len(self.sizes)
+            for size, count in piece["size_grade"].items():
+                if size in self._size_index:
+                    counts[self._size_index[size]] = count
+            self._piece_sizes.extend(counts)
+        self._piece_start.append(len(self._piece_pattern))
+        extras = {
+            k: v
+            for k, v in layout.items()
+            if k not in LAYOUT_COLUMNS and k not in ("id", "fabric", "pieces")
+        }
+        if extras:
+            self.extras[i] = extras
+
+    def freeze(self):
+        """Convert the append buffers into NumPy arrays."""
+        self.ids = np.array(self._ids, dtype=object)
+        self.id_index = {layout_id: i for i, layout_id in enumerate(self._ids)}
+        self.fabric = np.frombuffer(self._fabric, dtype=np.int32)
+        for name in LAYOUT_COLUMNS:
+            setattr(self, name, np.frombuffer(self._columns[name], dtype=np.float64))
+        self.piece_start = np.frombuffer(self._piece_start, dtype=np.int64)
+        self.piece_pattern = np.frombuffer(self._piece_pattern, dtype=np.int32)
+        self.piece_sizes = np.frombuffer(self._piece_sizes, dtype=np.int32).reshape(
+            -1, len(self.sizes)
+        )
+        self.frozen = True
+        return self
+
+    def __len__(self):
+        return len(self._ids)
+
+    def position(self, layout_id):
+        """Position of the layout with this id (KeyError if unknown)."""
+        return self.id_index[layout_id]
+
+    def _number(self, name, i):
+        value = getattr(self, name)[i].item()
+        return int(value) if value.is_integer() else value
+
+    def layout(self, i):
+        """Layout i rebuilt as a dict in the input format."""
+        layout = {"id": self._ids[i]}
+        for name in LAYOUT_COLUMNS:
+            layout[name] = self._number(name, i)
+        layout["fabric"] = self.fabric_names[self.fabric[i]]
+        layout["pieces"] = [
+            {
+                "pattern": self.patterns[self.piece_pattern[k]],
+                "size_grade": dict(zip(self.sizes, self.piece_sizes[k].tolist())),
+            }
+            for k in range(self.piece_start[i], self.piece_start[i + 1])
+        ]
+        layout.update(self.extras.get(i, {}))
+        ordered = {k: layout.pop(k) for k in self.key_order if k in layout}
+        ordered.update(layout)
+        return ordered
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.layout(i)
+
+    def pattern_size_counts(self, positions, patterns):
+        """Piece counts as a positions × patterns × sizes array.
+
+        Entry [r, k, s] is the number of pieces of patterns[k] in size s
+        laid out in layout positions[r]; pieces of other patterns are ignored.
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        counts = np.zeros((len(positions), len(patterns), len(self.sizes)), dtype=np.int64)
+        if not len(positions):
+            return counts
+        starts = self.piece_start[positions]
+        lengths = self.piece_start[positions + 1] - starts
+        rows = np.repeat(np.arange(len(positions)), lengths)
+        # Positions of the pieces of every selected layout, concatenated
+        offsets = np.repeat(np.cumsum(lengths) - lengths, lengths)
+        pieces = np.arange(lengths.sum()) - offsets + np.repeat(starts, lengths)
+        # Pattern id -> column in patterns (-1 for patterns not requested)
+        column = np.full(len(self.patterns), -1, dtype=np.int64)
+        for k, pattern in enumerate(patterns):
+            if pattern in self.pattern_index:
+                column[self.pattern_index[pattern]] = k
+        columns = column[self.piece_pattern[pieces]]
+        selected = columns >= 0
+        np.add.at(
+            counts,
+            (rows[selected], columns[selected]),
+            self.piece_sizes[pieces[selected]],
+        )
+        return counts
+
+
+class LayoutIndex:
+    """Candidate lookup over a frozen LayoutStore.
+
+    Built once: layout positions grouped by fabric_width, an inverted index
+    pattern id -> layout positions, and the layouts × sizes piece counts and
+    efficiencies. Candidates for a (width, pattern set) are the intersection
+    of the posting sets, smallest first, and are cached per key.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.by_width = {}
+        for i, width in enumerate(store.fabric_width.tolist()):
+            self.by_width.setdefault(width, set()).add(i)
+        # Layout position of each piece
+        piece_layout = np.repeat(np.arange(len(store)), np.diff(store.piece_start))
+        self.by_pattern = {}
+        for i, pattern in zip(piece_layout.tolist(), store.piece_pattern.tolist()):
+            self.by_pattern.setdefault(pattern, set()).add(i)
+        self.size_counts = np.zeros((len(store), len(store.sizes)), dtype=np.int64)
+        np.add.at(self.size_counts, piece_layout, store.piece_sizes)
+        # Pieces per meter of layout weighted by utilization, per size
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.efficiency = (
+                self.size_counts / (store.layout_length / 1000)[:, None]
+            ) * store.utilization[:, None]
+        self._candidates = {}
+
+    def candidates(self, fabric_width, patterns):
+        """Sorted positions of the layouts with this width containing all patterns."""
+        key = (fabric_width, frozenset(patterns))
+        if key not in self._candidates:
+            postings = [self.by_width.get(fabric_width, set())]
+            for pattern in key[1]:
+                pattern_id = self.store.pattern_index.get(pattern)
+                postings.append(self.by_pattern.get(pattern_id, set()))
+            postings.sort(key=len)
+            found = set(postings[0])
+            for posting in postings[1:]:
+                if not found:
+                    break
+                found &= posting
+            self._candidates[key] = sorted(found)
+        return self._candidates[key]
+
+
+def load_streaming(path, sizes):
+    """Stream an input file into (config, fabrics, LayoutStore, orders iterator).
+
+    Reading stops at the first production order: the returned iterator
+    continues parsing the file and yields orders one at a time, so solving
+    can start before the file is fully read. general_configuration, layouts
+    and fabrics must therefore come before production_orders; the iterator
+    raises ValueError if one of them shows up after the orders.
+
+    The file stays open until the iterator is exhausted, closed or garbage
+    collected, even if it is never iterated.
+    """
+    f = open(path, "r", encoding="utf-8")
+    try:
+        sections = JsonStreamReader(f).sections()
+        config = {}
+        fabrics = []
+        store = LayoutStore(sizes)
+        first_order = None
+        for key, value in sections:
+            if key == "general_configuration":
+                config = value
+            elif key == "layouts":
+                store.append(value)
+            elif key == "fabrics":
+                fabrics.append(value)
+            elif key == "production_orders":
+                first_order = value
+                break
+        store.freeze()
+    except BaseException:
+        f.close()
+        raise
+
+    def orders():
+        try:
+            if first_order is not None:
+                yield first_order
+                for key, value in sections:
+                    if key == "production_orders":
+                        yield value
+                    elif key in SETUP_SECTIONS:
+                        raise ValueError(
+                            f"{path}: section '{key}' comes after production_orders; "
+                            f"streaming requires {', '.join(SETUP_SECTIONS)} first"
+                        )
+        finally:
+            f.close()
+
+    iterator = orders()
+    # A generator that never started does not run its finally block
+    weakref.finalize(iterator, f.close)
+    return config, fabrics, store, iterator
@@ -0,0 +1,247 @@
+import contextlib
+import contextvars
+import functools
+import threading
+import time
+
+
+# Limites dos buckets dos histogramas, no formato do Prometheus
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+BUCKETS_TAMANHO = (10, 100, 1_000, 10_000, 100_000, 1_000_000)
+BUCKETS_GAP = (0, 0.0001, 0.001, 0.005, 0.01, 0.05, 0.1, 1)
+
+FASE_SOLVE = "solve"
+
+_coletor = contextvars.ContextVar("coletor_tempos", default=None)
+
+
+class Tempos:
+    """Spans coletados durante uma execução.
+
+    Cada span é um dicionário {"fase", "segundos", ...atributos}; a lista é
+    picklable, para voltar dos processos de trabalho junto com os resultados.
+    """
+
+    def __init__(self):
+        self.spans = []
+
+    def mesclar(self, spans):
+        self.spans.extend(spans)
+
+    def resumo(self):
+        """Bloco timings: tempo por fase e estatísticas dos solves."""
+        fases = {}
+        for s in self.spans:
+            fase = fases.setdefault(
+                s["fase"], {"chamadas": 0, "segundos": 0.0, "max_segundos": 0.0}
+            )
+            fase["chamadas"] += 1
+            fase["segundos"] += s["segundos"]
+            fase["max_segundos"] = max(fase["max_segundos"], s["segundos"])
+
+        solves = [s for s in self.spans if s["fase"] == FASE_SOLVE]
+        status = {}
+        for s in solves:
+            status[s.get("status")] = status.get(s.get("status"), 0) + 1
+        gaps = [s["gap"] for s in solves if s.get("gap") is not None]
+        return {
+            "fases": fases,
+            "solver": {
+                "solves": len(solves),
+                "segundos": sum(s["segundos"] for s in solves),
+                "status": status,
+                "nos": sum(s.get("nos") or 0 for s in solves),
+                "max_variaveis": max((s.get("variaveis", 0) for s in solves), default=0),
+                "max_restricoes": max((s.get("restricoes", 0) for s in solves), default=0),
+                "gap_maximo": max(gaps, default=None),
+            },
+        }
+
+
+def coletor_ativo():
+    return _coletor.get()
+
+
+@contextlib.contextmanager
+def coletar_tempos():
+    """Coleta os spans executados no bloco (na mesma thread/contexto).
+
+    Se já houver um coletor ativo ele é reaproveitado, então funções
+    instrumentadas podem abrir o próprio coletor sem roubar os spans de quem
+    as chamou.
+    """
+    ativo = _coletor.get()
+    if ativo is not None:
+        yield ativo
+        return
+    tempos = Tempos()
+    token = _coletor.set(tempos)
+    try:
+        yield tempos
+    finally:
+        _coletor.reset(token)
+
+
+def mesclar_tempos(spans):
+    """Adiciona ao coletor ativo spans vindos de outro processo."""
+    tempos = _coletor.get()
+    if tempos is not None and spans:
+        tempos.mesclar(spans)
+
+
+@contextlib.contextmanager
+def span(fase, **atributos):
+    """Mede o bloco e o registra como um span da fase no coletor ativo.
+
+    Retorna o dicionário de atributos, que o bloco pode completar (status,
+    tamanho do modelo etc.). Sem coletor ativo o custo é só o do relógio.
+    """
+    inicio = time.perf_counter()
+    try:
+        yield atributos
+    finally:
+        tempos = _coletor.get()
+        if tempos is not None:
+            tempos.spans.append(
+                {"fase": fase, "segundos": time.perf_counter() - inicio, **atributos}
+            )
+
+
+def medir(fase):
+    """Decorador: executa a função dentro de um coletor e de um span da fase."""
+
+    def decorador(funcao):
+        @functools.wraps(funcao)
+        def medida(*args, **kwargs):
+            with coletar_tempos(), span(fase):
+                return funcao(*args, **kwargs)
+
+        return medida
+
+    return decorador
+
+
+def _rotulos(rotulos):
+    return tuple(sorted((k, str(v)) for k, v in rotulos.items()))
+
+
+def _formatar_rotulos(rotulos, extra=()):
+    pares = list(rotulos) + list(extra)
+    if not pares:
+        return ""
+    texto = ",".join(f'{k}="{_escapar(v)}"' for k, v in pares)
+    return "{" + texto + "}"
+
+
+def _escapar(valor):
+    return valor.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class RegistroMetricas:
+    """Contadores e histogramas em memória, exportados no formato texto do Prometheus."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # nome -> (tipo, ajuda, buckets)
+        self._definicoes = {}
+        # nome -> {rótulos: valor} (contadores) ou {rótulos: [contagens, soma, total]}
+        self._series = {}
+
+    def _definir(self, nome, tipo, ajuda, buckets=None):
+        if nome not in self._definicoes:
+            self._definicoes[nome] = (tipo, ajuda, buckets)
+            self._series[nome] = {}
+
+    def incrementar(self, nome, valor=1, ajuda="", **rotulos):
+        with self._lock:
+            self._definir(nome, "counter", ajuda)
+            chave = _rotulos(rotulos)
+            self._series[nome][chave] = self._series[nome].get(chave, 0) + valor
+
+    def observar(self, nome, valor, ajuda="", buckets=BUCKETS_SEGUNDOS, **rotulos):
+        with self._lock:
+            self._definir(nome, "histogram", ajuda, buckets)
+            buckets = self._definicoes[nome][2]
+            serie = self._series[nome].setdefault(
+                _rotulos(rotulos), [[0] * len(buckets), 0.0, 0]
+            )
+            for i, limite in enumerate(buckets):
+                if valor <= limite:
+                    serie[0][i] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    def registrar_spans(self, spans):
+        """Alimenta as métricas de fases e de solves a partir de spans coletados."""
+        for s in spans:
+            self.observar(
+                "otimizacao_fase_segundos",
+                s["segundos"],
+                "Duração de cada fase da otimização",
+                fase=s["fase"],
+            )
+            if s["fase"] != FASE_SOLVE:
+                continue
+            solver = s.get("solver", "")
+            self.incrementar(
+                "otimizacao_solves_total",
+                ajuda="Solves por solver e status",
+                solver=solver,
+                status=s.get("status", ""),
+            )
+            self.observar(
+                "otimizacao_solve_segundos",
+                s["segundos"],
+                "Tempo de parede de cada solve",
+                solver=solver,
+            )
+            self.incrementar(
+                "otimizacao_solve_nos_total",
+                s.get("nos") or 0,
+                "Nós de branch-and-bound explorados",
+                solver=solver,
+            )
+            self.observar(
+                "otimizacao_modelo_variaveis",
+                s.get("variaveis", 0),
+                "Variáveis do modelo resolvido",
+                BUCKETS_TAMANHO,
+            )
+            self.observar(
+                "otimizacao_modelo_restricoes",
+                s.get("restricoes", 0),
+                "Restrições do modelo resolvido",
+                BUCKETS_TAMANHO,
+            )
+            if s.get("gap") is not None:
+                self.observar(
+                    "otimizacao_solve_gap",
+                    s["gap"],
+                    "Gap relativo atingido em cada solve",
+                    BUCKETS_GAP,
+                    solver=solver,
+                )
+
+    def texto_prometheus(self):
+        linhas = []
+        with self._lock:
+            for nome, (tipo, ajuda, buckets) in self._definicoes.items():
+                linhas.append(f"# HELP {nome} {ajuda}")
+                linhas.append(f"# TYPE {nome} {tipo}")
+                for rotulos, valor in self._series[nome].items():
+                    if tipo == "counter":
+                        linhas.append(f"{nome}{_formatar_rotulos(rotulos)} {valor}")
+                        continue
+                    contagens, soma, total = valor
+                    for limite, contagem in zip(buckets, contagens):
+                        le = _formatar_rotulos(rotulos, [("le", f"{limite}")])
+                        linhas.append(f"{nome}_bucket{le} {contagem}")
+                    le = _formatar_rotulos(rotulos, [("le", "+Inf")])
+                    linhas.append(f"{nome}_bucket{le} {total}")
+                    linhas.append(f"{nome}_sum{_formatar_rotulos(rotulos)} {soma}")
+                    linhas.append(f"{nome}_count{_formatar_rotulos(rotulos)} {total}")
+        return "\n".join(linhas) + "\n"
+
+
+# Registro do processo; na API é alimentado com os spans de cada job
+registro = RegistroMetricas()
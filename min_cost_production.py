@@ -1,8 +1,8 @@
 import logging
 from ortools.linear_solver import pywraplp
+from ortools.linear_solver import linear_solver_pb2
 import random
 import datetime
-import plotly.figure_factory as ff
 import numpy as np
 
 
@@ -12,6 +12,31 @@ from openpyxl.styles import Font, Alignment, PatternFill
 from openpyxl.utils import get_column_letter
 import plotly.io as pio
 import os
+import json
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from artefatos import normalizar_saidas, obter_gerenciador_artefatos
+from calendario_turnos import ShiftCalendar
+from escalonamento import escalonar
+from exportacao import Cabecalho, Secao, exportar_linhas
+from gantt import figura_gantt, linha_do_tempo, salvar_linha_do_tempo
+from geracao_colunas import ModeloGeracaoColunas
+from metricas import coletar_tempos, coletor_ativo, medir, mesclar_tempos, span
+from solvers import (
+    GAP_RELATIVO_PADRAO,
+    LIMITE_DE_TEMPO,
+    NUM_SEARCH_WORKERS_PADRAO,
+    TEMPO_LIMITE_PADRAO_S,
+    gap_resposta,
+    resolver_modelo,
+    resolver_solver,
+    resposta_conclusiva,
+    status_resposta,
+    validar_solver,
+)
+from tabela_grades import obter_tabela_grades
 
 
 logging.basicConfig(
@@ -21,6 +46,21 @@ logging.basicConfig(
 )
 
 
+class OtimizacaoCancelada(Exception):
+    """Levantada por main quando o evento de cancelamento é sinalizado."""
+
+
+class SemSolucaoNoTempo:
+    """Resultado de um pedido cujo tempo limite ou prazo acabou sem solução.
+
+    É falso como None, então quem só testa se há resultado o trata como sem
+    solução, mas permite distinguir o pedido interrompido de um inviável.
+    """
+
+    def __bool__(self):
+        return False
+
+
 class Recurso:
     def __init__(self, id, eficiencia):
         self.id = id
@@ -34,14 +74,97 @@ class Turno:
         self.eficiencia = eficiencia
 
 
-def salvar_figura_html(fig, caminho_arquivo="gantt_chart.html"):
+def salvar_figura_html(fig, caminho_arquivo="gantt_chart.html", include_plotlyjs="cdn"):
+    # Com "cdn" o plotly.js (~3.5 MB) é carregado do CDN em vez de embutido
     try:
-        fig.write_html(caminho_arquivo)
+        fig.write_html(caminho_arquivo, include_plotlyjs=include_plotlyjs)
         logging.info(f"Figura HTML salva em {caminho_arquivo}")
     except Exception as e:
         logging.error(f"Erro ao salvar a figura HTML: {e}")
 
 
+def _linhas_relatorio_producao(
+    cronograma, pedidos_ordenados, resultados, pedidos, tamanhos
+):
+    """Gera as linhas do relatório de produção, seção por seção."""
+    # Cronograma
+    yield Secao("Cronograma de Produção")
+    yield []
+    yield Cabecalho(["Pedido", "Operação", "Início", "Fim", "Recurso"])
+    for p in pedidos_ordenados:
+        yield [
+            f"Pedido {p}",
+            "Enfestamento",
+            cronograma[p]["inicio_enfestamento"],
+            cronograma[p]["fim_enfestamento"],
+            f"Enfestadeira {cronograma[p]['enfestadeira']}",
+        ]
+        yield [
+            f"Pedido {p}",
+            "Corte",
+            cronograma[p]["inicio_corte"],
+            cronograma[p]["fim_corte"],
+            f"Máquina de Corte {cronograma[p]['maquina_corte']}",
+        ]
+
+    # Detalhes dos pedidos
+    yield []
+    yield []
+    yield Secao("Detalhes dos Pedidos")
+    yield Cabecalho(
+        [
+            "Pedido",
+            "Prazo",
+            "Custo Total",
+            "Custo de Setup",
+            "Metros de Tecido",
+            "Perímetro Cortado",
+            "Desperdício",
+            "Comprimento Enfesto real",
+            "Comprimento Enfesto Máximo",
+            "Relaxação",
+        ]
+    )
+    for p in pedidos_ordenados:
+        resultado = resultados[p]
+        yield [
+            f"Pedido {p}",
+            pedidos[p]["prazo"],
+            resultado["custo_total"],
+            resultado["custo_setup"],
+            resultado["metros_tecido"],
+            resultado["perimetro_cortado"],
+            resultado["desperdicio"],
+            # resultado['comprimento_enfesto_real']
+            resultado["comprimento_enfesto_maximo"],
+            resultado["relaxacao_aplicada"],
+        ]
+
+    # Produção por tamanho
+    yield []
+    yield []
+    yield Secao("Produção por Tamanho")
+    yield Cabecalho(["Pedido"] + tamanhos + ["Grade", "Camadas"])
+    for p in pedidos_ordenados:
+        resultado = resultados[p]
+        producao = [
+            f"{int(resultado['producao'][t])} ({pedidos[p]['demandas'][t]})"
+            for t in tamanhos
+        ]
+        # Grades e camadas: a primeira na linha do pedido, as demais abaixo
+        primeira = True
+        for g, camadas in resultado["camadas"].items():
+            if camadas > 0:
+                if primeira:
+                    yield [f"Pedido {p}"] + producao + [g, int(camadas)]
+                    primeira = False
+                else:
+                    yield [None] * (len(tamanhos) + 1) + [g, int(camadas)]
+        if primeira:
+            yield [f"Pedido {p}"] + producao
+        yield []
+
+
 def exportar_para_excel(
     cronograma,
     pedidos_ordenados,
@@ -52,137 +175,90 @@ def exportar_para_excel(
     fig,
     nome_arquivo=r"G:\Meu Drive\senai_sc\resultados_producao.xlsx",
 ):
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Cronograma de Produção"
-
-    # Estilo para cabeçalhos
-    header_font = Font(bold=True)
-    header_fill = PatternFill(
-        start_color="DDDDDD", end_color="DDDDDD", fill_type="solid"
+    """Exporta o relatório de produção em streaming (xlsx ou csv, pela extensão)."""
+    exportar_linhas(
+        _linhas_relatorio_producao(
+            cronograma, pedidos_ordenados, resultados, pedidos, tamanhos
+        ),
+        nome_arquivo,
+        titulo_planilha="Cronograma de Produção",
     )
+    print(f"Resultados exportados para {nome_arquivo}")
 
-    # Cronograma
-    ws.cell(row=1, column=1, value="Cronograma de Produção").font = Font(
-        bold=True, size=14
-    )
-    headers = ["Pedido", "Operação", "Início", "Fim", "Recurso"]
-    for col, header in enumerate(headers, start=1):
-        cell = ws.cell(row=3, column=col, value=header)
-        cell.font = header_font
-        cell.fill = header_fill
-
-    row = 4
-    for p in pedidos_ordenados:
-        ws.cell(row=row, column=1, value=f"Pedido {p}")
-        ws.cell(row=row, column=2, value="Enfestamento")
-        ws.cell(row=row, column=3, value=cronograma[p]["inicio_enfestamento"])
-        ws.cell(row=row, column=4, value=cronograma[p]["fim_enfestamento"])
-        ws.cell(
-            row=row, column=5, value=f"Enfestadeira {cronograma[p]['enfestadeira']}"
-        )
-        row += 1
-
-        ws.cell(row=row, column=1, value=f"Pedido {p}")
-        ws.cell(row=row, column=2, value="Corte")
-        ws.cell(row=row, column=3, value=cronograma[p]["inicio_corte"])
-        ws.cell(row=row, column=4, value=cronograma[p]["fim_corte"])
-        ws.cell(
-            row=row,
-            column=5,
-            value=f"Máquina de Corte {cronograma[p]['maquina_corte']}",
-        )
-        row += 1
 
-    # Detalhes dos pedidos
-    row += 2
-    ws.cell(row=row, column=1, value="Detalhes dos Pedidos").font = Font(
-        bold=True, size=14
+def colunas_resultados_planos(tamanhos):
+    return (
+        [
+            "pedido",
+            "prazo",
+            "enfestadeira",
+            "inicio_enfestamento",
+            "fim_enfestamento",
+            "maquina_corte",
+            "inicio_corte",
+            "fim_corte",
+            "custo_total",
+            "custo_setup",
+            "metros_tecido",
+            "perimetro_cortado",
+            "desperdicio",
+            "relaxacao_aplicada",
+            "grade",
+            "camadas",
+        ]
+        + [f"producao_{t}" for t in tamanhos]
+        + [f"demanda_{t}" for t in tamanhos]
     )
-    row += 1
-    headers = [
-        "Pedido",
-        "Prazo",
-        "Custo Total",
-        "Custo de Setup",
-        "Metros de Tecido",
-        "Perímetro Cortado",
-        "Desperdício",
-        "Comprimento Enfesto real",
-        "Comprimento Enfesto Máximo",
-        "Relaxação",
-    ]
-    for col, header in enumerate(headers, start=1):
-        cell = ws.cell(row=row, column=col, value=header)
-        cell.font = header_font
-        cell.fill = header_fill
-    row += 1
 
-    for p in pedidos_ordenados:
-        resultado = resultados[p]
-        ws.cell(row=row, column=1, value=f"Pedido {p}")
-        ws.cell(row=row, column=2, value=pedidos[p]["prazo"])
-        ws.cell(row=row, column=3, value=resultado["custo_total"])
-        ws.cell(row=row, column=4, value=resultado["custo_setup"])
-        ws.cell(row=row, column=5, value=resultado["metros_tecido"])
-        ws.cell(row=row, column=6, value=resultado["perimetro_cortado"])
-        ws.cell(row=row, column=7, value=resultado["desperdicio"])
-        # ws.cell(row=row, column=8, value=resultado['comprimento_enfesto_real'])
-        ws.cell(row=row, column=8, value=resultado["comprimento_enfesto_maximo"])
-        ws.cell(row=row, column=9, value=resultado["relaxacao_aplicada"])
-        row += 1
-
-    # Produção por tamanho
-    row += 2
-    ws.cell(row=row, column=1, value="Produção por Tamanho").font = Font(
-        bold=True, size=14
-    )
-    row += 1
-    headers = ["Pedido"] + tamanhos + ["Grade", "Camadas"]
-    for col, header in enumerate(headers, start=1):
-        cell = ws.cell(row=row, column=col, value=header)
-        cell.font = header_font
-        cell.fill = header_fill
-    row += 1
 
+def linhas_resultados_planos(
+    cronograma, pedidos_ordenados, resultados, pedidos, tamanhos
+):
+    """Gera uma linha por pedido e grade usada, no formato de colunas_resultados_planos."""
     for p in pedidos_ordenados:
         resultado = resultados[p]
-        ws.cell(row=row, column=1, value=f"Pedido {p}")
-        for col, t in enumerate(tamanhos, start=2):
-            ws.cell(
-                row=row,
-                column=col,
-                value=f"{int(resultado['producao'][t])} ({pedidos[p]['demandas'][t]})",
-            )
-
-        # Adicionar informações das grades e camadas
+        etapas = cronograma[p]
+        comum = [
+            str(p),
+            pedidos[p]["prazo"],
+            etapas["enfestadeira"],
+            etapas["inicio_enfestamento"],
+            etapas["fim_enfestamento"],
+            etapas["maquina_corte"],
+            etapas["inicio_corte"],
+            etapas["fim_corte"],
+            float(resultado["custo_total"]),
+            float(resultado["custo_setup"]),
+            float(resultado["metros_tecido"]),
+            float(resultado["perimetro_cortado"]),
+            float(resultado["desperdicio"]),
+            float(resultado["relaxacao_aplicada"]),
+        ]
+        producao = [int(resultado["producao"][t]) for t in tamanhos] + [
+            int(pedidos[p]["demandas"][t]) for t in tamanhos
+        ]
         for g, camadas in resultado["camadas"].items():
             if camadas > 0:
-                ws.cell(row=row, column=len(tamanhos) + 2, value=g)
-                ws.cell(row=row, column=len(tamanhos) + 3, value=int(camadas))
-                row += 1
+                yield comum + [g, int(camadas)] + producao
 
-        row += 1
 
-    # Ajustar largura das colunas
-    for col in range(1, ws.max_column + 1):
-        ws.column_dimensions[get_column_letter(col)].auto_size = True
-
-    # Exportar e inserir o gráfico de Gantt
-    # pio.write_image(fig, "gantt_chart.png", scale=2)
-    # pio.write_image(fig, "gantt_chart.svg", format="svg")
-    # img = Image("gantt_chart.svg")
-    # ws.add_image(img, f"A{row + 2}")
-
-    wb.save(nome_arquivo)
-    print(f"Resultados exportados para {nome_arquivo}")
-    # os.remove("gantt_chart.svg")
+def exportar_resultados_planos(
+    cronograma, pedidos_ordenados, resultados, pedidos, tamanhos, nome_arquivo
+):
+    """Exporta uma tabela plana (csv, parquet ou xlsx) em streaming."""
+    total = exportar_linhas(
+        linhas_resultados_planos(
+            cronograma, pedidos_ordenados, resultados, pedidos, tamanhos
+        ),
+        nome_arquivo,
+        colunas=colunas_resultados_planos(tamanhos),
+    )
+    logging.info(f"{total} linhas exportadas para {nome_arquivo}")
 
 
 def otimizar_pedido_com_relaxacao(
     pedido,
-    grades,
-    tamanhos,
+    tabela,
     comprimento_mesa_enfesto,
     recursos,
     percentual_superproducao,
@@ -190,69 +266,365 @@ def otimizar_pedido_com_relaxacao(
     horas_producao,
     penalizacao_superproducao,
     relaxacao,
+    cache=None,
+    modelo=None,
+    opcoes_solver=None,
 ):
-
+    """Resolve o pedido com o menor fator de relaxação viável entre 1.0 e 2.0.
+
+    A restrição de comprimento do enfesto só afrouxa com o fator, então a
+    viabilidade é monotônica: em vez de varrer os 11 fatores em sequência,
+    testa 1.0, depois 2.0, e faz busca binária entre eles. O último resultado
+    viável é usado como dica (warm start) para os fatores seguintes.
+
+    Com um PedidoModel em modelo, todos os solves reaproveitam o mesmo modelo.
+    pedido["opcoes_solver"], se houver, dá o orçamento deste pedido (tempo
+    limite, gaps), sobrepondo o do modelo. Só resultados conclusivos, sem
+    orçamento próprio do pedido, são guardados no cache.
+
+    Um fator que termina sem solução por tempo ou prazo não prova que ele é
+    inviável: a busca para ali. Com algum fator viável já encontrado, ele é
+    retornado com status_solver limite_de_tempo; sem nenhum, o retorno é
+    SemSolucaoNoTempo em vez de None.
+    """
     if relaxacao == True:
-
         num_pontos = int((2 - 1) / 0.1) + 1
-        print(num_pontos)
-
         relaxacao_list = np.linspace(2, 1, num=num_pontos)[::-1].tolist()
-        print(relaxacao_list)
     else:
         relaxacao_list = [1.0]
 
-    for relaxacao in relaxacao_list:
-        resultado = otimizar_pedido(
-            pedido,
-            grades,
-            tamanhos,
+    if modelo is None:
+        with span("construcao_modelo", motor="direto"):
+            modelo = PedidoModel(
+                tabela,
+                comprimento_mesa_enfesto,
+                recursos,
+                percentual_superproducao,
+                max_camadas_por_grade,
+                horas_producao,
+                penalizacao_superproducao,
+                opcoes_solver=opcoes_solver,
+            )
+
+    opcoes_pedido = pedido.get("opcoes_solver")
+    # O orçamento do pedido não faz parte da chave do cache
+    if opcoes_pedido:
+        cache = None
+
+    def resolver(fator, dica=None):
+        # Cada fator testado é uma tentativa; o span separa as da relaxação
+        with span("tentativa_relaxacao", fator=fator) as atributos:
+            encontrado = False
+            if cache is not None:
+                encontrado, resultado = cache.obter(pedido["demandas"], fator)
+            if not encontrado:
+                resultado = modelo.solve(
+                    pedido["demandas"], fator, dica=dica, opcoes_solver=opcoes_pedido
+                )
+                # Resultados interrompidos por tempo ou prazo não são reproduzíveis
+                if cache is not None and modelo.conclusivo:
+                    cache.armazenar(pedido["demandas"], fator, resultado)
+            # Do cache só saem resultados conclusivos
+            conclusivo = encontrado or modelo.conclusivo
+            atributos.update(cache=encontrado, viavel=bool(resultado), conclusivo=conclusivo)
+        return resultado, conclusivo
+
+    def sem_solucao(conclusivo):
+        if conclusivo:
+            return None
+        logging.warning("Tempo limite ou prazo esgotado antes de uma solução para o pedido")
+        return SemSolucaoNoTempo()
+
+    # Caso comum: viável sem relaxação
+    resultado, conclusivo_inicial = resolver(relaxacao_list[0])
+    if resultado:
+        resultado["relaxacao_aplicada"] = relaxacao_list[0]
+        return resultado
+    if len(relaxacao_list) == 1:
+        return sem_solucao(conclusivo_inicial)
+
+    # Se nem a relaxação máxima é viável, nenhum fator intermediário será
+    baixo, alto = 0, len(relaxacao_list) - 1
+    melhor, conclusivo = resolver(relaxacao_list[alto])
+    if not melhor:
+        return sem_solucao(conclusivo)
+
+    # Invariante: relaxacao_list[baixo] inviável, relaxacao_list[alto] viável.
+    # Um fator sem resposta por tempo interrompe a busca com o melhor viável
+    interrompida = not conclusivo_inicial
+    while alto - baixo > 1 and not interrompida:
+        meio = (baixo + alto) // 2
+        resultado, conclusivo = resolver(relaxacao_list[meio], dica=melhor)
+        if resultado:
+            alto, melhor = meio, resultado
+        elif conclusivo:
+            baixo = meio
+        else:
+            interrompida = True
+
+    if interrompida:
+        logging.warning(
+            f"Busca da relaxação interrompida por tempo; usando o fator {relaxacao_list[alto]:.2f}"
+        )
+        melhor["status_solver"] = LIMITE_DE_TEMPO
+    melhor["relaxacao_aplicada"] = relaxacao_list[alto]
+    return melhor
+
+
+# Contexto compartilhado pelos processos de resolver_pedidos, enviado uma única
+# vez por processo pelo initializer em vez de a cada pedido
+_contexto_worker = {}
+
+
+def criar_modelo_pedido(
+    motor,
+    tabela,
+    comprimento_mesa_enfesto,
+    recursos,
+    percentual_superproducao,
+    max_camadas_por_grade,
+    horas_producao,
+    penalizacao_superproducao,
+    opcoes_solver=None,
+    **opcoes_motor,
+):
+    """Cria o modelo de um pedido para o motor escolhido.
+
+    "direto" cria uma variável por grade do catálogo (PedidoModel);
+    "geracao_colunas" parte de um pool pequeno e gera colunas sob demanda
+    (ModeloGeracaoColunas), com opcoes_motor repassadas ao motor.
+    opcoes_solver escolhe o solver dos MIPs (ver solvers.resolver_modelo).
+    """
+    if motor == "direto":
+        classe = PedidoModel
+    elif motor == "geracao_colunas":
+        classe = ModeloGeracaoColunas
+    else:
+        raise ValueError(f"Motor de otimização inválido: {motor}")
+    return classe(
+        tabela,
+        comprimento_mesa_enfesto,
+        recursos,
+        percentual_superproducao,
+        max_camadas_por_grade,
+        horas_producao,
+        penalizacao_superproducao,
+        opcoes_solver=opcoes_solver,
+        **opcoes_motor,
+    )
+
+
+def _inicializar_worker_pedidos(
+    tabela,
+    comprimento_mesa_enfesto,
+    recursos,
+    parametros,
+    motor="direto",
+    opcoes_motor=None,
+    opcoes_solver=None,
+):
+    ativo = coletor_ativo()
+    with coletar_tempos() as tempos, span("construcao_modelo", motor=motor):
+        # Um único modelo por processo, reaproveitado por todos os pedidos
+        modelo = criar_modelo_pedido(
+            motor,
+            tabela,
             comprimento_mesa_enfesto,
             recursos,
-            percentual_superproducao,
-            max_camadas_por_grade,
-            fator_relaxacao=relaxacao,
-            horas_producao=horas_producao,
-            penalizacao_superproducao=penalizacao_superproducao,
+            parametros["percentual_superproducao"],
+            parametros["max_camadas_por_grade"],
+            parametros["horas_producao"],
+            parametros["penalizacao_superproducao"],
+            opcoes_solver=opcoes_solver,
+            **(opcoes_motor or {}),
         )
-        if resultado:
-            resultado["relaxacao_aplicada"] = relaxacao
-            return resultado
-    return None
+    _contexto_worker.update(
+        tabela=tabela,
+        comprimento_mesa_enfesto=comprimento_mesa_enfesto,
+        recursos=recursos,
+        parametros=parametros,
+        opcoes_solver=opcoes_solver,
+        modelo=modelo,
+        # Nos processos do pool não há coletor ativo: os spans da construção
+        # do modelo seguem com o primeiro lote resolvido
+        spans=[] if ativo is not None else tempos.spans,
+    )
 
 
-def criar_grafico_gantt(cronograma, pedidos_ordenados, criterio_prioridade):
-    df = []
-    for p in pedidos_ordenados:
-        df.append(
-            dict(
-                Task=f"Pedido {p} - Enfestamento",
-                Start=cronograma[p]["inicio_enfestamento"],
-                Finish=cronograma[p]["fim_enfestamento"],
-                Resource=f"Enfestadeira {cronograma[p]['enfestadeira']}",
-            )
+def _otimizar_pedido_worker(p, pedido):
+    logging.info(f"Otimizando pedido {p}")
+    logging.info(f"Demandas: {pedido['demandas']}")
+    cache = _contexto_worker["parametros"].get("cache")
+    antes = dict(cache.cache.contadores) if cache is not None else {}
+    with span("pedido"):
+        resultado = otimizar_pedido_com_relaxacao(
+            pedido,
+            _contexto_worker["tabela"],
+            _contexto_worker["comprimento_mesa_enfesto"],
+            _contexto_worker["recursos"],
+            modelo=_contexto_worker["modelo"],
+            **_contexto_worker["parametros"],
         )
-        df.append(
-            dict(
-                Task=f"Pedido {p} - Corte",
-                Start=cronograma[p]["inicio_corte"],
-                Finish=cronograma[p]["fim_corte"],
-                Resource=f"Máquina de Corte {cronograma[p]['maquina_corte']}",
-            )
+    # Contadores do cache deste pedido, somados no processo principal
+    contadores = {
+        nome: cache.cache.contadores[nome] - valor for nome, valor in antes.items()
+    }
+    return p, resultado, contadores
+
+
+def _otimizar_lote_worker(lote):
+    """Resolve um lote [(pedido, dados)] e retorna ([(pedido, resultado)], contadores)."""
+    if len(lote) == 1:
+        p, resultado, contadores = _otimizar_pedido_worker(*lote[0])
+        return [(p, resultado)], contadores
+
+    parametros = _contexto_worker["parametros"]
+    pedidos_lote = dict(lote)
+    logging.info(f"Otimizando lote {list(pedidos_lote)}")
+    with span("lote", pedidos=len(pedidos_lote)):
+        resultados = otimizar_lote(
+            pedidos_lote,
+            _contexto_worker["tabela"],
+            _contexto_worker["comprimento_mesa_enfesto"],
+            _contexto_worker["recursos"],
+            parametros["percentual_superproducao"],
+            parametros["max_camadas_por_grade"],
+            parametros["horas_producao"],
+            parametros["penalizacao_superproducao"],
+            opcoes_solver=_contexto_worker["opcoes_solver"],
+        )
+    if resultados is not None:
+        return list(resultados.items()), {}
+
+    # Lote inviável sem relaxação: cada pedido segue o fluxo individual
+    logging.info(f"Lote {list(pedidos_lote)} inviável; resolvendo pedidos separadamente")
+    itens = []
+    contadores = {}
+    for p, pedido in lote:
+        p, resultado, contadores_pedido = _otimizar_pedido_worker(p, pedido)
+        itens.append((p, resultado))
+        for nome, valor in contadores_pedido.items():
+            contadores[nome] = contadores.get(nome, 0) + valor
+    return itens, contadores
+
+
+def _otimizar_lote_processo(lote):
+    """_otimizar_lote_worker no pool, devolvendo também as gravações do cache e os spans."""
+    with coletar_tempos() as tempos:
+        itens, contadores = _otimizar_lote_worker(lote)
+    cache = _contexto_worker["parametros"].get("cache")
+    gravacoes = cache.cache.retirar_gravacoes() if cache is not None else []
+    spans = _contexto_worker.pop("spans", []) + tempos.spans
+    return itens, contadores, gravacoes, spans
+
+
+def resolver_pedidos(
+    pedidos,
+    tabela,
+    comprimento_mesa_enfesto,
+    recursos,
+    num_workers=1,
+    evento_cancelamento=None,
+    tamanho_lote=1,
+    janela_lote_dias=1,
+    motor="direto",
+    opcoes_motor=None,
+    opcoes_solver=None,
+    **parametros,
+):
+    """Resolve cada pedido com otimizar_pedido_com_relaxacao.
+
+    Gera pares (pedido, resultado) à medida que terminam. Com num_workers > 1
+    os modelos, que são independentes entre pedidos, são distribuídos em um
+    pool de processos; num_workers=None ou 0 usa todos os núcleos.
+
+    Com tamanho_lote > 1, pedidos com prazos a até janela_lote_dias dias
+    entre si são resolvidos juntos por otimizar_lote, compartilhando o
+    setup das grades; lotes inviáveis voltam ao fluxo individual.
+
+    motor e opcoes_motor escolhem o modelo de cada pedido (ver
+    criar_modelo_pedido); opcoes_solver escolhe o solver e seus parâmetros.
+    """
+    if not num_workers:
+        num_workers = os.cpu_count() or 1
+
+    if motor != "direto" and tamanho_lote > 1:
+        logging.warning(
+            f"Lotes não são suportados pelo motor {motor}; resolvendo pedidos individualmente"
         )
+        tamanho_lote = 1
+
+    if tamanho_lote > 1:
+        lotes = [
+            [(p, pedidos[p]) for p in lote]
+            for lote in agrupar_pedidos_em_lotes(pedidos, tamanho_lote, janela_lote_dias)
+        ]
+    else:
+        lotes = [[(p, pedido)] for p, pedido in pedidos.items()]
 
-    fig = ff.create_gantt(
-        df, index_col="Resource", show_colorbar=True, group_tasks=True
+    def verificar_cancelamento(p):
+        if evento_cancelamento is not None and evento_cancelamento.is_set():
+            raise OtimizacaoCancelada(
+                f"Otimização cancelada antes do pedido {p}"
+            )
+
+    if num_workers == 1 or len(lotes) <= 1:
+        _inicializar_worker_pedidos(
+            tabela,
+            comprimento_mesa_enfesto,
+            recursos,
+            parametros,
+            motor,
+            opcoes_motor,
+            opcoes_solver,
+        )
+        for lote in lotes:
+            verificar_cancelamento(lote[0][0])
+            itens, _ = _otimizar_lote_worker(lote)
+            yield from itens
+        return
+
+    # spawn: o processo pode ser um worker da API, com threads e um Manager ativos
+    executor = ProcessPoolExecutor(
+        max_workers=min(num_workers, len(lotes)),
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_inicializar_worker_pedidos,
+        initargs=(
+            tabela,
+            comprimento_mesa_enfesto,
+            recursos,
+            parametros,
+            motor,
+            opcoes_motor,
+            opcoes_solver,
+        ),
     )
-    fig.update_layout(
-        title=f"Cronograma de Produção - {criterio_prioridade}",
-        xaxis_title="Data",
-        yaxis_title="Recursos e Pedidos",
+    try:
+        futures = [executor.submit(_otimizar_lote_processo, lote) for lote in lotes]
+        for future in as_completed(futures):
+            itens, contadores, gravacoes, spans = future.result()
+            if contadores:
+                parametros["cache"].cache.acumular(contadores)
+            if gravacoes:
+                parametros["cache"].cache.incorporar(gravacoes)
+            mesclar_tempos(spans)
+            verificar_cancelamento(itens[0][0])
+            yield from itens
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def criar_grafico_gantt(cronograma, pedidos_ordenados, criterio_prioridade):
+    return figura_gantt(
+        linha_do_tempo(
+            cronograma,
+            pedidos_ordenados,
+            f"Cronograma de Produção - {criterio_prioridade}",
+        )
     )
-    return fig
 
 
-def calcular_tempo_producao(resultado, grades, recursos):
+def calcular_tempo_producao(resultado, tabela, recursos):
     tempo_enfesto = resultado["tempo_enfesto"]
     tempo_corte = resultado["tempo_corte"]
 
@@ -274,65 +646,38 @@ def calcular_tempo_producao(resultado, grades, recursos):
 
 
 def gerar_cronograma(
-    pedidos_ordenados, resultados, grades, data_inicio, recursos, turnos
+    pedidos_ordenados,
+    resultados,
+    tabela,
+    data_inicio,
+    recursos,
+    turnos,
+    pedidos=None,
+    regra_despacho="ordem",
+    regra_corte=None,
 ):
-    cronograma = {}
-    tempo_atual_enfestamento = {r.id: data_inicio for r in recursos["enfestadeiras"]}
-    tempo_atual_corte = {r.id: data_inicio for r in recursos["maquinas_corte"]}
-
-    for p in pedidos_ordenados:
-        resultado = resultados[p]
-
-        # Enfestamento
-        enfestadeira = min(tempo_atual_enfestamento, key=tempo_atual_enfestamento.get)
-        inicio_enfestamento = tempo_atual_enfestamento[enfestadeira]
-        fim_enfestamento = calcular_fim_operacao(
-            inicio_enfestamento, resultado["tempo_enfesto"], turnos
-        )
-        tempo_atual_enfestamento[enfestadeira] = fim_enfestamento
-
-        # Corte
-        maquina_corte = min(tempo_atual_corte, key=tempo_atual_corte.get)
-        inicio_corte = max(fim_enfestamento, tempo_atual_corte[maquina_corte])
-        fim_corte = calcular_fim_operacao(
-            inicio_corte, resultado["tempo_corte"], turnos
-        )
-        tempo_atual_corte[maquina_corte] = fim_corte
-
-        cronograma[p] = {
-            "inicio_enfestamento": inicio_enfestamento,
-            "fim_enfestamento": fim_enfestamento,
-            "enfestadeira": enfestadeira,
-            "inicio_corte": inicio_corte,
-            "fim_corte": fim_corte,
-            "maquina_corte": maquina_corte,
-        }
-
-    return cronograma
+    """Cronograma de enfesto e corte; ver escalonamento.escalonar."""
+    return escalonar(
+        pedidos_ordenados,
+        resultados,
+        data_inicio,
+        recursos,
+        turnos,
+        pedidos=pedidos,
+        regra_enfesto=regra_despacho,
+        regra_corte=regra_corte,
+    )
 
 
 def calcular_fim_operacao(inicio, duracao, turnos):
-    tempo_atual = inicio
-    tempo_restante = duracao
+    """Fim de uma operação de duracao horas iniciada em inicio.
 
-    while tempo_restante > 0:
-        turno_atual = next(
-            (t for t in turnos if t.inicio <= tempo_atual.time() < t.fim), None
-        )
-        if turno_atual:
-            tempo_turno = min(
-                (turno_atual.fim.hour - tempo_atual.time().hour) * 3600,
-                tempo_restante * 3600,
-            )
-            tempo_restante -= tempo_turno / 3600 / turno_atual.eficiencia
-            tempo_atual += datetime.timedelta(seconds=tempo_turno)
-        else:
-            tempo_atual += datetime.timedelta(days=1)
-            tempo_atual = tempo_atual.replace(
-                hour=turnos[0].inicio.hour, minute=0, second=0
-            )
-
-    return tempo_atual
+    turnos pode ser a lista de Turno ou um ShiftCalendar já montado; passar o
+    calendário evita reconstruí-lo a cada chamada.
+    """
+    if not isinstance(turnos, ShiftCalendar):
+        turnos = ShiftCalendar(turnos, inicio)
+    return turnos.fim_operacao(inicio, duracao)
 
 
 def ajustar_grade(grade, tolerancia_largura):
@@ -374,10 +719,275 @@ def gerar_demanda_flutuante(demanda_base, variacao=0.05):
     return int(demanda_base * (1 + random.uniform(-variacao, variacao)))
 
 
+def _montar_resultado(tabela, camadas, **campos):
+    """Monta o dicionário de resultado de um pedido a partir das camadas.
+
+    camadas é o vetor de camadas por grade, na ordem de tabela.nomes. Os
+    campos que dependem só das camadas (tempos, produção, metros, perímetro
+    e desperdício) são calculados aqui; custos, grades e recursos usados vêm
+    do modelo em campos.
+    """
+    c = np.asarray(camadas, dtype=float)
+
+    # Cálculo dos tempos reais de enfesto e corte
+    tempo_enfesto_real = float(c @ tabela.tempo_enfesto_por_camada)
+    tempo_corte_real = float(c @ tabela.tempo_corte_por_camada)
+    resultado = {
+        "custo_total": campos["custo_total"],
+        "custo_producao": campos["custo_producao"],
+        "custo_setup": campos["custo_setup"],
+        "camadas": dict(zip(tabela.nomes, c.tolist())),
+        "grades_usadas": campos["grades_usadas"],
+        "producao": dict(zip(tabela.tamanhos, (c @ tabela.quantidades).tolist())),
+        "metros_tecido": float(c @ tabela.comprimento_enfesto),
+        "perimetro_cortado": float(c @ tabela.perimetro_total),
+        "superproducao": campos["superproducao"],
+        "desperdicio": float(c @ tabela.desperdicio),
+        "enfestadeiras_usadas": campos["enfestadeiras_usadas"],
+        "maquinas_corte_usadas": campos["maquinas_corte_usadas"],
+        "tempo_enfesto": tempo_enfesto_real,
+        "tempo_corte": tempo_corte_real,
+        "tempo_total": tempo_enfesto_real + tempo_corte_real,
+        "fator_relaxacao": campos["fator_relaxacao"],
+        "comprimento_enfesto_maximo": campos["comprimento_enfesto_maximo"],
+    }
+    for chave, valor in campos.items():
+        resultado.setdefault(chave, valor)
+    return resultado
+
+
+class PedidoModel:
+    """Modelo MIP de um pedido, construído uma vez e reaproveitado.
+
+    Entre pedidos só mudam os lados direitos das restrições de demanda e o
+    fator de relaxação do comprimento do enfesto. O modelo é montado uma vez
+    a partir dos vetores da GradeTable e exportado para um MPModelProto;
+    solve altera só esses limites em uma cópia do proto e a resolve com
+    solvers.resolver_modelo (SCIP, CBC ou CP-SAT, conforme opcoes_solver),
+    usando a última solução encontrada como dica. Cada solve parte de uma
+    instância limpa do solver, sem estado acumulado de solves anteriores.
+    """
+
+    def __init__(
+        self,
+        tabela,
+        comprimento_mesa_enfesto,
+        recursos,
+        percentual_superproducao,
+        max_camadas_por_grade,
+        horas_producao,
+        penalizacao_superproducao,
+        opcoes_solver=None,
+    ):
+        self.tabela = tabela
+        self.recursos = recursos
+        self.opcoes_solver = opcoes_solver or {}
+        self.comprimento_mesa_enfesto = comprimento_mesa_enfesto
+        self.percentual_superproducao = percentual_superproducao
+        self.max_camadas_por_grade = max_camadas_por_grade
+
+        # Solver usado para montar o modelo; a resolução é feita via proto
+        solver = pywraplp.Solver.CreateSolver("SCIP")
+        infinito = solver.infinity()
+
+        # Variáveis de decisão, na ordem de tabela.nomes e tabela.tamanhos
+        use_grade = [solver.BoolVar(f"use_{g}") for g in tabela.nomes]
+        x = [solver.IntVar(0, max_camadas_por_grade, f"x_{g}") for g in tabela.nomes]
+        superproducao = [
+            solver.NumVar(0, infinito, f"super_{t}") for t in tabela.tamanhos
+        ]
+        enfestadeiras = [
+            solver.BoolVar(f"enfestadeira_{r.id}") for r in recursos["enfestadeiras"]
+        ]
+        maquinas_corte = [
+            solver.BoolVar(f"maquina_corte_{r.id}") for r in recursos["maquinas_corte"]
+        ]
+
+        def restricao(lb, ub, coeficientes, nome=""):
+            ct = solver.Constraint(lb, ub, nome)
+            for variaveis, valores in coeficientes:
+                for var, valor in zip(variaveis, valores):
+                    ct.SetCoefficient(var, valor)
+            return ct
+
+        # Restrições para o uso das grades: x[g] <= max_camadas * use_grade[g]
+        for xg, ug in zip(x, use_grade):
+            restricao(-infinito, 0, [([xg, ug], [1, -max_camadas_por_grade])])
+
+        # Restrições de demanda, com lados direitos definidos em solve
+        quantidades_por_tamanho = tabela.quantidades.T.tolist()
+        demanda_minima = []
+        demanda_maxima = []
+        for t, quantidades, super_t in zip(
+            tabela.tamanhos, quantidades_por_tamanho, superproducao
+        ):
+            demanda_minima.append(
+                restricao(0, infinito, [(x, quantidades)], f"demanda_min_{t}")
+            )
+            demanda_maxima.append(
+                restricao(
+                    -infinito,
+                    0,
+                    [(x, quantidades), ([super_t], [-1])],
+                    f"demanda_max_{t}",
+                )
+            )
+
+        # Restrição de comprimento do enfesto, com limite definido em solve
+        comprimento = restricao(
+            -infinito,
+            0,
+            [(x, tabela.comprimento_enfesto.tolist())],
+            "comprimento_enfesto",
+        )
+
+        # Capacidade de enfestamento e corte: tempo <= soma(eficiência * horas)
+        restricao(
+            -infinito,
+            0,
+            [
+                (x, tabela.tempo_enfesto_por_camada.tolist()),
+                (
+                    enfestadeiras,
+                    [-r.eficiencia * horas_producao for r in recursos["enfestadeiras"]],
+                ),
+            ],
+        )
+        restricao(
+            -infinito,
+            0,
+            [
+                (x, tabela.tempo_corte_por_camada.tolist()),
+                (
+                    maquinas_corte,
+                    [-r.eficiencia * horas_producao for r in recursos["maquinas_corte"]],
+                ),
+            ],
+        )
+
+        # Função objetivo: produção + setup + penalização da superprodução
+        objetivo = solver.Objective()
+        for variaveis, custos in (
+            (x, tabela.custo_por_camada.tolist()),
+            (use_grade, tabela.custo_setup.tolist()),
+            (superproducao, [penalizacao_superproducao] * len(superproducao)),
+        ):
+            for var, custo in zip(variaveis, custos):
+                objetivo.SetCoefficient(var, custo)
+        objetivo.SetMinimization()
+
+        self.modelo_proto = linear_solver_pb2.MPModelProto()
+        solver.ExportModelToProto(self.modelo_proto)
+
+        # Posições das restrições e das variáveis no proto; os objetos do
+        # pywraplp deixam de ser válidos junto com o solver de construção
+        self.indices_demanda_minima = [ct.index() for ct in demanda_minima]
+        self.indices_demanda_maxima = [ct.index() for ct in demanda_maxima]
+        self.indice_comprimento = comprimento.index()
+        self.indices_x = [v.index() for v in x]
+        self.indices_use = [v.index() for v in use_grade]
+        self.indices_super = [v.index() for v in superproducao]
+        self.indices_enfestadeiras = [v.index() for v in enfestadeiras]
+        self.indices_maquinas_corte = [v.index() for v in maquinas_corte]
+        self.dica = None
+        # Se o último solve terminou sem ser interrompido por tempo ou prazo
+        self.conclusivo = True
+
+    def _valores_dica(self, dica):
+        return [dica["camadas"].get(g, 0) for g in self.tabela.nomes] + [
+            1.0 if g in dica["grades_usadas"] else 0.0 for g in self.tabela.nomes
+        ]
+
+    def solve(self, demandas, fator_relaxacao, dica=None, opcoes_solver=None):
+        """Resolve o modelo para as demandas e o fator de relaxação dados.
+
+        Retorna o mesmo dicionário de resultado de otimizar_pedido, ou None
+        se não houver solução viável. Sem dica explícita, a solução do solve
+        anterior (se houver) é usada como warm start. opcoes_solver
+        sobrepõe, só neste solve, as opções do modelo (ex.: o orçamento de
+        tempo e gap de um pedido).
+        """
+        tabela = self.tabela
+
+        modelo = linear_solver_pb2.MPModelProto()
+        modelo.CopyFrom(self.modelo_proto)
+
+        for t, minima, maxima in zip(
+            tabela.tamanhos, self.indices_demanda_minima, self.indices_demanda_maxima
+        ):
+            modelo.constraint[minima].lower_bound = demandas[t]
+            modelo.constraint[maxima].upper_bound = demandas[t] * (
+                1 + self.percentual_superproducao
+            )
+        comprimento_enfesto_maximo = (
+            self.comprimento_mesa_enfesto * fator_relaxacao * self.max_camadas_por_grade
+        )
+        modelo.constraint[self.indice_comprimento].upper_bound = (
+            comprimento_enfesto_maximo
+        )
+
+        dica = dica if dica is not None else self.dica
+        if dica is not None:
+            modelo.solution_hint.var_index.extend(self.indices_x + self.indices_use)
+            modelo.solution_hint.var_value.extend(self._valores_dica(dica))
+
+        # Resolve o problema
+        resposta = resolver_modelo(modelo, **{**self.opcoes_solver, **(opcoes_solver or {})})
+        status = resposta.status
+        self.conclusivo = resposta_conclusiva(resposta)
+
+        # Verifica se uma solução viável foi encontrada
+        if status == pywraplp.Solver.OPTIMAL or status == pywraplp.Solver.FEASIBLE:
+            valores = np.array(resposta.variable_value)
+            camadas = valores[self.indices_x]
+            use_grade = valores[self.indices_use]
+            resultado = _montar_resultado(
+                tabela,
+                camadas,
+                custo_total=resposta.objective_value,
+                custo_producao=float(camadas @ tabela.custo_por_camada),
+                custo_setup=float(use_grade @ tabela.custo_setup),
+                grades_usadas=[
+                    g for g, uso in zip(tabela.nomes, use_grade) if uso > 0.5
+                ],
+                superproducao=dict(
+                    zip(tabela.tamanhos, valores[self.indices_super].tolist())
+                ),
+                enfestadeiras_usadas=[
+                    r.id
+                    for r, uso in zip(
+                        self.recursos["enfestadeiras"],
+                        valores[self.indices_enfestadeiras],
+                    )
+                    if uso > 0.5
+                ],
+                maquinas_corte_usadas=[
+                    r.id
+                    for r, uso in zip(
+                        self.recursos["maquinas_corte"],
+                        valores[self.indices_maquinas_corte],
+                    )
+                    if uso > 0.5
+                ],
+                fator_relaxacao=fator_relaxacao,
+                comprimento_enfesto_maximo=comprimento_enfesto_maximo,
+                status_solver=status_resposta(resposta),
+                gap=gap_resposta(resposta),
+            )
+            # Incumbente vira dica para o próximo solve deste modelo
+            self.dica = resultado
+            return resultado
+        else:
+            logging.warning(
+                f"Não foi possível encontrar uma solução ótima. Status: "
+                f"{status_resposta(resposta)} ({resposta.status_str or status})"
+            )
+            return None
+
+
 def otimizar_pedido(
     pedido,
-    grades,
-    tamanhos,
+    tabela,
     comprimento_mesa_enfesto,
     recursos,
     percentual_superproducao,
@@ -385,165 +995,214 @@ def otimizar_pedido(
     fator_relaxacao,
     horas_producao,
     penalizacao_superproducao,
+    dica=None,
+    opcoes_solver=None,
 ):
-    # Cria um solver usando o SCIP
+    modelo = PedidoModel(
+        tabela,
+        comprimento_mesa_enfesto,
+        recursos,
+        percentual_superproducao,
+        max_camadas_por_grade,
+        horas_producao,
+        penalizacao_superproducao,
+        opcoes_solver=opcoes_solver,
+    )
+    return modelo.solve(pedido["demandas"], fator_relaxacao, dica=dica)
+
+
+def agrupar_pedidos_em_lotes(pedidos, tamanho_lote, janela_lote_dias):
+    """Agrupa pedidos em ordem de prazo em lotes de até tamanho_lote pedidos.
+
+    Um lote só recebe pedidos cujo prazo esteja a no máximo janela_lote_dias
+    do prazo do primeiro pedido do lote.
+    """
+    janela = datetime.timedelta(days=janela_lote_dias)
+    lotes = []
+    lote = []
+    for p in sorted(pedidos, key=lambda p: pedidos[p]["prazo"]):
+        if lote and (
+            len(lote) >= tamanho_lote
+            or pedidos[p]["prazo"] - pedidos[lote[0]]["prazo"] > janela
+        ):
+            lotes.append(lote)
+            lote = []
+        lote.append(p)
+    if lote:
+        lotes.append(lote)
+    return lotes
+
+
+def otimizar_lote(
+    pedidos_lote,
+    tabela,
+    comprimento_mesa_enfesto,
+    recursos,
+    percentual_superproducao,
+    max_camadas_por_grade,
+    horas_producao,
+    penalizacao_superproducao,
+    fator_relaxacao=1.0,
+    opcoes_solver=None,
+):
+    """Otimiza um lote de pedidos em um único modelo.
+
+    O setup de cada grade (use_grade) é pago uma vez e pode atender vários
+    pedidos do lote; as camadas são alocadas por pedido, com as mesmas
+    restrições de demanda, comprimento e capacidade de otimizar_pedido.
+    Retorna {pedido: resultado} no formato de otimizar_pedido, com o custo de
+    setup rateado entre os pedidos proporcionalmente às camadas de cada grade,
+    ou None se o lote for inviável.
+    """
+    # O SCIP só monta o modelo; resolver_solver resolve com o solver escolhido
     solver = pywraplp.Solver.CreateSolver("SCIP")
-    solver.SetTimeLimit(
-        600_000
-    )  # Define um limite de tempo de 10 minutos para a solução
-
-    # Variáveis de decisão
-    use_grade = {
-        g: solver.BoolVar(f"use_{g}") for g in grades
-    }  # Variável booleana para indicar se uma grade é usada
-    x = {
-        g: solver.IntVar(0, max_camadas_por_grade, f"x_{g}") for g in grades
-    }  # Variável inteira para o número de camadas de cada grade
-    superproducao = {
-        t: solver.NumVar(0, solver.infinity(), f"super_{t}") for t in tamanhos
-    }  # Variável para controlar a superprodução
-
-    # Variáveis para recursos
-    enfestadeiras = {
-        r.id: solver.BoolVar(f"enfestadeira_{r.id}") for r in recursos["enfestadeiras"]
-    }  # Variáveis para enfestadeiras
-    maquinas_corte = {
-        r.id: solver.BoolVar(f"maquina_corte_{r.id}")
-        for r in recursos["maquinas_corte"]
-    }  # Variáveis para máquinas de corte
-
-    # Restrições para o uso das grades
-    for g in grades:
-        solver.Add(
-            x[g] <= max_camadas_por_grade * use_grade[g]
-        )  # Limita o número de camadas pela grade utilizada
+    infinito = solver.infinity()
+
+    quantidades_por_tamanho = tabela.quantidades.T.tolist()
+    comprimento_enfesto = tabela.comprimento_enfesto.tolist()
+    tempo_enfesto_por_camada = tabela.tempo_enfesto_por_camada.tolist()
+    tempo_corte_por_camada = tabela.tempo_corte_por_camada.tolist()
+    custo_por_camada = tabela.custo_por_camada.tolist()
+
+    # Setup compartilhado pelo lote
+    use_grade = [solver.BoolVar(f"use_{g}") for g in tabela.nomes]
+
+    x = {}
+    superproducao = {}
+    enfestadeiras = {}
+    maquinas_corte = {}
+    custo_producao = {}
+    custo_superproducao = {}
+    comprimento_enfesto_maximo = (
+        comprimento_mesa_enfesto * fator_relaxacao * max_camadas_por_grade
+    )
+    for p, pedido in pedidos_lote.items():
+        x[p] = [
+            solver.IntVar(0, max_camadas_por_grade, f"x_{p}_{g}") for g in tabela.nomes
+        ]
+        superproducao[p] = [
+            solver.NumVar(0, infinito, f"super_{p}_{t}") for t in tabela.tamanhos
+        ]
+        enfestadeiras[p] = [
+            solver.BoolVar(f"enfestadeira_{p}_{r.id}") for r in recursos["enfestadeiras"]
+        ]
+        maquinas_corte[p] = [
+            solver.BoolVar(f"maquina_corte_{p}_{r.id}")
+            for r in recursos["maquinas_corte"]
+        ]
+
+        for xg, ug in zip(x[p], use_grade):
+            solver.Add(xg <= max_camadas_por_grade * ug)
+
+        # Restrições de demanda do pedido
+        for t, quantidades, super_t in zip(
+            tabela.tamanhos, quantidades_por_tamanho, superproducao[p]
+        ):
+            producao = solver.Sum(q * xg for q, xg in zip(quantidades, x[p]))
+            solver.Add(producao >= pedido["demandas"][t])
+            solver.Add(
+                producao
+                <= pedido["demandas"][t] * (1 + percentual_superproducao) + super_t
+            )
 
-    M_numero_de_grades = 10000  # Um número grande para garantir que a restrição não seja muito restritiva
-    for g in grades:
+        # Comprimento do enfesto do pedido
         solver.Add(
-            x[g] <= M_numero_de_grades * use_grade[g]
-        )  # Restrições adicionais para o uso das grades
+            solver.Sum(l * xg for l, xg in zip(comprimento_enfesto, x[p]))
+            <= comprimento_enfesto_maximo
+        )
 
-    # Restrições de demanda
-    for t in tamanhos:
+        # Capacidade de enfestamento e corte do pedido
         solver.Add(
-            solver.Sum(grades[g]["quantidades"][t] * x[g] for g in grades)
-            >= pedido["demandas"][t]
-        )  # Atende a demanda mínima
+            solver.Sum(te * xg for te, xg in zip(tempo_enfesto_por_camada, x[p]))
+            <= solver.Sum(
+                e * r.eficiencia * horas_producao
+                for e, r in zip(enfestadeiras[p], recursos["enfestadeiras"])
+            )
+        )
         solver.Add(
-            solver.Sum(grades[g]["quantidades"][t] * x[g] for g in grades)
-            <= pedido["demandas"][t] * (1 + percentual_superproducao) + superproducao[t]
-        )  # Limita a superprodução
-
-    # Restrições de comprimento do enfesto
-    solver.Add(
-        solver.Sum(grades[g]["comprimento_enfesto"] * x[g] for g in grades)
-        <= comprimento_mesa_enfesto * fator_relaxacao * max_camadas_por_grade
-    )
+            solver.Sum(tc * xg for tc, xg in zip(tempo_corte_por_camada, x[p]))
+            <= solver.Sum(
+                m * r.eficiencia * horas_producao
+                for m, r in zip(maquinas_corte[p], recursos["maquinas_corte"])
+            )
+        )
+
+        custo_producao[p] = solver.Sum(
+            c * xg for c, xg in zip(custo_por_camada, x[p])
+        )
+        custo_superproducao[p] = solver.Sum(
+            s * penalizacao_superproducao for s in superproducao[p]
+        )
 
-    # Cálculo do tempo de enfesto e corte
-    tempo_enfesto = solver.Sum(
-        grades[g]["tempo_enfesto_por_metro"] * grades[g]["comprimento_enfesto"] * x[g]
-        for g in grades
+    custo_setup_total = solver.Sum(
+        c * ug for c, ug in zip(tabela.custo_setup.tolist(), use_grade)
     )
-    tempo_corte = solver.Sum(
-        grades[g]["tempo_corte_por_metro"] * grades[g]["perimetro_total"] * x[g]
-        for g in grades
+    solver.Minimize(
+        solver.Sum(custo_producao.values())
+        + custo_setup_total
+        + solver.Sum(custo_superproducao.values())
     )
 
-    # Capacidade total de enfestamento e corte
-    capacidade_enfestamento = solver.Sum(
-        enfestadeiras[r.id] * r.eficiencia * horas_producao
-        for r in recursos["enfestadeiras"]
+    resposta = resolver_solver(solver, **(opcoes_solver or {}))
+    status = resposta.status
+    if status != pywraplp.Solver.OPTIMAL and status != pywraplp.Solver.FEASIBLE:
+        logging.warning(
+            f"Não foi possível resolver o lote {list(pedidos_lote)}. Status: "
+            f"{status_resposta(resposta)}"
+        )
+        return None
+
+    # Camadas (pedidos × grades) e rateio do setup compartilhado pelas
+    # camadas de cada pedido em cada grade ativa
+    camadas = np.array(
+        [[xg.solution_value() for xg in x[p]] for p in pedidos_lote]
     )
-    capacidade_corte = solver.Sum(
-        maquinas_corte[r.id] * r.eficiencia * horas_producao
-        for r in recursos["maquinas_corte"]
+    ativas = np.array([ug.solution_value() > 0.5 for ug in use_grade])
+    camadas_por_grade = camadas.sum(axis=0)
+    participacao = np.divide(
+        camadas,
+        camadas_por_grade,
+        out=np.zeros_like(camadas),
+        where=camadas_por_grade > 0,
     )
+    custo_setup = participacao @ (tabela.custo_setup * ativas)
 
-    # Restrições de capacidade
-    solver.Add(
-        tempo_enfesto <= capacidade_enfestamento
-    )  # Restrições para o tempo de enfesto
-    solver.Add(tempo_corte <= capacidade_corte)  # Restrições para o tempo de corte
-
-    # Cálculo dos custos
-    custo_producao = solver.Sum(
-        grades[g]["custo_por_camada"] * x[g] for g in grades
-    )  # Custo total de produção
-    custo_setup_total = solver.Sum(
-        grades[g]["custo_setup"] * use_grade[g] for g in grades
-    )  # Custo total de setup
-    custo_superproducao = solver.Sum(
-        superproducao[t] * penalizacao_superproducao for t in tamanhos
-    )  # Custo da superprodução
-
-    # Função objetivo: minimizar o custo total
-    objetivo = custo_producao + custo_setup_total + custo_superproducao
-    solver.Minimize(objetivo)
-
-    # Resolve o problema
-    status = solver.Solve()
-
-    # Verifica se uma solução viável foi encontrada
-    if status == pywraplp.Solver.OPTIMAL or status == pywraplp.Solver.FEASIBLE:
-        # Cálculo dos tempos reais de enfesto e corte
-        tempo_enfesto_real = sum(
-            grades[g]["tempo_enfesto_por_camada"] * x[g].solution_value()
-            for g in grades
-        )
-        tempo_corte_real = sum(
-            grades[g]["tempo_corte_por_camada"] * x[g].solution_value() for g in grades
-        )
-        tempo_total_real = tempo_enfesto_real + tempo_corte_real
-
-        # Monta o resultado com as informações relevantes
-        resultado = {
-            "custo_total": solver.Objective().Value(),
-            "custo_producao": custo_producao.solution_value(),
-            "custo_setup": custo_setup_total.solution_value(),
-            "camadas": {g: x[g].solution_value() for g in grades},
-            "grades_usadas": [g for g in grades if use_grade[g].solution_value() > 0.5],
-            "producao": {
-                t: sum(
-                    grades[g]["quantidades"][t] * x[g].solution_value() for g in grades
-                )
-                for t in tamanhos
+    resultados = {}
+    for i, p in enumerate(pedidos_lote):
+        resultados[p] = _montar_resultado(
+            tabela,
+            camadas[i],
+            custo_total=custo_producao[p].solution_value()
+            + float(custo_setup[i])
+            + custo_superproducao[p].solution_value(),
+            custo_producao=custo_producao[p].solution_value(),
+            custo_setup=float(custo_setup[i]),
+            grades_usadas=[
+                g
+                for g, ativa, c in zip(tabela.nomes, ativas, camadas[i])
+                if ativa and c > 0.5
+            ],
+            superproducao={
+                t: s.solution_value() for t, s in zip(tabela.tamanhos, superproducao[p])
             },
-            "metros_tecido": sum(
-                grades[g]["comprimento_enfesto"] * x[g].solution_value() for g in grades
-            ),
-            "perimetro_cortado": sum(
-                grades[g]["perimetro_total"] * x[g].solution_value() for g in grades
-            ),
-            "superproducao": {t: superproducao[t].solution_value() for t in tamanhos},
-            "desperdicio": sum(
-                calcular_desperdicio(grades[g]) * x[g].solution_value() for g in grades
-            ),
-            "enfestadeiras_usadas": [
+            enfestadeiras_usadas=[
                 r.id
-                for r in recursos["enfestadeiras"]
-                if enfestadeiras[r.id].solution_value() > 0.5
+                for e, r in zip(enfestadeiras[p], recursos["enfestadeiras"])
+                if e.solution_value() > 0.5
             ],
-            "maquinas_corte_usadas": [
+            maquinas_corte_usadas=[
                 r.id
-                for r in recursos["maquinas_corte"]
-                if maquinas_corte[r.id].solution_value() > 0.5
+                for m, r in zip(maquinas_corte[p], recursos["maquinas_corte"])
+                if m.solution_value() > 0.5
             ],
-            "tempo_enfesto": tempo_enfesto_real,
-            "tempo_corte": tempo_corte_real,
-            "tempo_total": tempo_total_real,
-            "fator_relaxacao": fator_relaxacao,
-            "comprimento_enfesto_maximo": comprimento_mesa_enfesto
-            * fator_relaxacao
-            * max_camadas_por_grade,
-        }
-        return resultado
-    else:
-        logging.warning(
-            f"Não foi possível encontrar uma solução ótima. Status: {status}"
+            fator_relaxacao=fator_relaxacao,
+            comprimento_enfesto_maximo=comprimento_enfesto_maximo,
+            relaxacao_aplicada=fator_relaxacao,
+            status_solver=status_resposta(resposta),
+            gap=gap_resposta(resposta),
+            lote=list(pedidos_lote),
         )
-        return None
+    return resultados
 
 
 def ler_recursos():
@@ -735,6 +1394,152 @@ def exportar_informacoes_producao(
     print(f"Informações de produção exportadas para {nome_arquivo}")
 
 
+def renderizar_relatorios(diretorio, saidas, dados):
+    """Grava os relatórios pedidos em saidas no diretório e retorna os arquivos.
+
+    json: o retorno de main; xlsx: as planilhas de produção, grades, demanda
+    e informações de produção; csv e parquet: a tabela plana de resultados
+    por pedido e grade; gantt: a linha do tempo em JSON para o visualizador
+    static/gantt.html; html: o gráfico de Gantt.
+    """
+    criterio = dados["criterio_prioridade"]
+    arquivos = []
+
+    def caminho(nome):
+        arquivos.append(nome)
+        return os.path.join(diretorio, nome)
+
+    if "json" in saidas:
+        with open(caminho("resultado.json"), "w", encoding="utf-8") as f:
+            json.dump(dados["retorno"], f, default=str)
+
+    fig = None
+    if "gantt" in saidas or "html" in saidas:
+        linha = linha_do_tempo(
+            dados["cronograma"],
+            dados["pedidos_ordenados"],
+            f"Cronograma de Produção - {criterio}",
+        )
+        if "gantt" in saidas:
+            salvar_linha_do_tempo(linha, caminho(f"gantt-{criterio}.json"))
+        if "html" in saidas:
+            fig = figura_gantt(linha)
+            salvar_figura_html(fig, caminho(f"gantt_chart-{criterio}.html"))
+
+    for formato in ("csv", "parquet"):
+        if formato in saidas:
+            exportar_resultados_planos(
+                dados["cronograma"],
+                dados["pedidos_ordenados"],
+                dados["resultados"],
+                dados["pedidos"],
+                dados["tamanhos"],
+                caminho(f"resultados_producao-{criterio}.{formato}"),
+            )
+
+    if "xlsx" in saidas:
+        exportar_informacoes_producao(
+            dados["custos"],
+            dados["tamanhos"],
+            dados["larguras"],
+            dados["areas"],
+            caminho("informacoes_producao.xlsx"),
+        )
+        exportar_grades_excel(dados["grades"], caminho("grades_disponiveis.xlsx"))
+        exportar_para_excel(
+            dados["cronograma"],
+            dados["pedidos_ordenados"],
+            dados["resultados"],
+            dados["pedidos"],
+            dados["tamanhos"],
+            dados["tabela"].como_dict(),
+            fig,
+            caminho(f"resultados_producao-{criterio}.xlsx"),
+        )
+        exportar_demanda_pedidos_excel(
+            dados["pedidos"], caminho(f"demanda_pedidos-{criterio}.xlsx")
+        )
+
+    return arquivos
+
+
+def calcular_prioridade(pedido, resultado, criterio, data_inicio, tabela, recursos):
+    """Chave de priorização do pedido (menor primeiro) pelo critério dado."""
+    if criterio == "prazo":
+        return (pedido["prazo"] - data_inicio).days
+    elif criterio == "custo_total":
+        return resultado["custo_total"]
+    elif criterio == "tempo_producao":
+        return calcular_tempo_producao(resultado, tabela, recursos)
+    else:
+        raise ValueError(f"Critério de prioridade inválido: {criterio}")
+
+
+def resumir_plano(
+    pedidos_ordenados, cronograma, resultados, pedidos, tamanhos, pedidos_limite_tempo=0
+):
+    """Cronograma, resultados detalhados e métricas globais em tipos JSON.
+
+    É o núcleo do retorno de main, também usado pelas sessões de planejamento.
+    pedidos_limite_tempo conta os pedidos sem solução por tempo ou prazo.
+    """
+    # Preparar resultados detalhados
+    resultados_detalhados = {}
+    for p in pedidos_ordenados:
+        resultado = resultados[p]
+        resultados_detalhados[p] = {
+            "prazo": pedidos[p]["prazo"].isoformat(),
+            "custo_total": float(resultado["custo_total"]),
+            "metros_tecido": float(resultado["metros_tecido"]),
+            "perimetro_cortado": float(resultado["perimetro_cortado"]),
+            "desperdicio": float(resultado["desperdicio"]),
+            "tempo_enfesto": float(resultado["tempo_enfesto"]),
+            "tempo_corte": float(resultado["tempo_corte"]),
+            "tempo_total": float(resultado["tempo_total"]),
+            "producao": {t: int(resultado["producao"][t]) for t in tamanhos},
+            "demandas": pedidos[p]["demandas"],
+            "camadas": {g: int(camadas) for g, camadas in resultado["camadas"].items() if camadas > 0},
+            "custo_setup": float(resultado["custo_setup"]),
+            "status_solver": resultado.get("status_solver"),
+            "gap": resultado.get("gap"),
+        }
+
+    return {
+        "pedidos_ordenados": pedidos_ordenados,
+        "cronograma": {
+            str(k): {
+                "inicio_enfestamento": v["inicio_enfestamento"].isoformat(),
+                "fim_enfestamento": v["fim_enfestamento"].isoformat(),
+                "enfestadeira": v["enfestadeira"],
+                "inicio_corte": v["inicio_corte"].isoformat(),
+                "fim_corte": v["fim_corte"].isoformat(),
+                "maquina_corte": v["maquina_corte"],
+                "atraso_horas": v.get("atraso_horas", 0.0),
+            }
+            for k, v in cronograma.items()
+        },
+        "resultados": resultados_detalhados,
+        "metricas_globais": {
+            "custo_total": sum(r["custo_total"] for r in resultados_detalhados.values()),
+            "tempo_total": sum(r["tempo_total"] for r in resultados_detalhados.values()),
+            "desperdicio_total": sum(r["desperdicio"] for r in resultados_detalhados.values()),
+            "pedidos_atrasados": sum(
+                1 for v in cronograma.values() if v.get("atraso_horas", 0) > 0
+            ),
+            "atraso_total_horas": sum(
+                v.get("atraso_horas", 0.0) for v in cronograma.values()
+            ),
+            "pedidos_sem_solucao": len(pedidos) - len(resultados),
+            "pedidos_limite_tempo": pedidos_limite_tempo,
+            "gap_maximo": max(
+                (r["gap"] for r in resultados_detalhados.values() if r["gap"] is not None),
+                default=None,
+            ),
+        }
+    }
+
+
+@medir("main")
 def main(
     criterio_prioridade,
     data_inicio,
@@ -751,7 +1556,28 @@ def main(
     penalizacao_superproducao,
     relaxacao,
     pedidos_reais=None,
+    callback_pedido=None,
+    evento_cancelamento=None,
+    num_workers=1,
+    cache=None,
+    tamanho_lote=1,
+    janela_lote_dias=1,
+    motor="direto",
+    gerar_grades=False,
+    solver="scip",
+    num_search_workers=NUM_SEARCH_WORKERS_PADRAO,
+    tempo_limite_s=TEMPO_LIMITE_PADRAO_S,
+    gap_relativo=GAP_RELATIVO_PADRAO,
+    gap_absoluto=None,
+    prazo_total_s=None,
+    regra_despacho="ordem",
+    saidas=("xlsx", "html"),
+    mostrar_grafico=False,
+    gerenciador_artefatos=None,
+    dono_artefatos=None,
+    timings=False,
 ):
+    inicio = time.perf_counter()
 
     diretorio_atual = os.getcwd()
     logging.info(f"Diretório atual: {diretorio_atual}")
@@ -786,73 +1612,76 @@ def main(
         "Custo variável de enfestamento por metro de enfesto": 0.30,
     }
 
-    tamanhos = list(grades["Grade1"]["quantidades"].keys())
-    exportar_informacoes_producao(
-        custos, tamanhos, larguras, areas, "informacoes_producao.xlsx"
-    )
-
-    # Exportar grades disponíveis para Excel
-    exportar_grades_excel(grades, "grades_disponiveis.xlsx")
-
-    for g in grades:
-        grades[g] = ajustar_grade(grades[g], tolerancia_largura)
-        quantidades = grades[g]["quantidades"]
-        aproveitamento = grades[g]["aproveitamento"]
-
-        area_total = sum(quantidades[s] * grades[g]["areas"][s] for s in tamanhos)
-        L = area_total / (grades[g]["largura_tecido"] * aproveitamento)
-        P_total = sum(quantidades[s] * grades[g]["perimetros"][s] for s in tamanhos)
-
-        tempo_enfesto = L * grades[g]["tempo_enfesto_por_metro"]
-        tempo_corte = P_total * grades[g]["tempo_corte_por_metro"]
-        tempo_total_por_camada = tempo_enfesto + tempo_corte
-        grades[g]["tempo_producao"] = tempo_total_por_camada
-        tempo_por_camada = tempo_enfesto + tempo_corte
-        max_camadas = grades[g].get("max_camadas", 1)
-        tempo_total = tempo_por_camada * max_camadas
-
-        grades[g].update(
-            {
-                "area_total": area_total,
-                "comprimento_enfesto": L,
-                "perimetro_total": P_total,
-                "custo_por_camada": calcular_custo_por_camada(
-                    grades[g], area_total, P_total, L
-                ),
-                "desperdicio": calcular_desperdicio(grades[g]),
-                "tempo_enfesto_por_camada": tempo_enfesto,
-                "tempo_corte_por_camada": tempo_corte,
-                "tempo_por_camada": tempo_por_camada,
-                "tempo_total_maximo": tempo_total,
-                "max_camadas": max_camadas,
-            }
+    tamanhos = list(next(iter(grades.values()))["quantidades"].keys())
+    saidas = normalizar_saidas(saidas)
+
+    # Ajuste, custos e tempos por camada de todas as grades em arrays
+    # somente leitura, calculados uma vez por catálogo e tolerância e
+    # compartilhados entre execuções; o catálogo recebido não é alterado
+    with span("preprocessamento_grades", grades=len(grades)):
+        tabela = obter_tabela_grades(grades, tamanhos, tolerancia_largura)
+    for g in tabela.nomes:
+        i = tabela.indice[g]
+        logging.info(
+            f"Grade {g}: Área total = {tabela.area_total[i]:.2f} m², "
+            f"Comprimento do enfesto = {tabela.comprimento_enfesto[i]:.2f} m, "
+            f"Tempo por camada = {tabela.tempo_por_camada[i]:.2f} h, "
+            f"Tempo total máximo = {tabela.tempo_total_maximo[i]:.2f} h"
         )
 
-    logging.info(
-        f"Grade {g}: Área total = {area_total:.2f} m², Comprimento do enfesto = {L:.2f} m, "
-        f"Tempo por camada = {tempo_por_camada:.2f} h, Tempo total máximo = {tempo_total:.2f} h"
-    )
-
     # pedidos = gerar_pedidos_para_intervalo(data_inicio, num_dias, pedidos_reais)
 
-    resultados = {}
-    for p, pedido in pedidos.items():
-        logging.info(f"Otimizando pedido {p}")
-        logging.info(f"Demandas: {pedido['demandas']}")
-        # resultado = otimizar_pedido_com_relaxacao(pedido, grades, tamanhos, comprimento_maximo_enfesto, recursos_obj, percentual_superproducao=0.05, max_camadas_por_grade=30)
-        resultado = otimizar_pedido_com_relaxacao(
-            pedido,
-            grades,
-            tamanhos,
-            comprimento_mesa_enfesto,
+    opcoes_motor = {"gerar_grades": gerar_grades} if motor == "geracao_colunas" else {}
+    # Orçamento de cada solve; prazo_total_s vira um prazo comum a todos os
+    # pedidos da execução, inclusive nos processos do pool
+    opcoes_solver = {
+        "solver": validar_solver(solver),
+        "num_search_workers": num_search_workers,
+        "tempo_limite_s": tempo_limite_s,
+        "gap_relativo": gap_relativo,
+        "gap_absoluto": gap_absoluto,
+    }
+    opcoes_cache = dict(opcoes_solver)
+    if prazo_total_s is not None:
+        opcoes_solver["prazo"] = time.time() + prazo_total_s
+
+    contexto_cache = None
+    if cache is not None:
+        contexto_cache = cache.contexto(
+            tabela,
             recursos_obj,
-            percentual_superproducao=percentual_superproducao,
-            max_camadas_por_grade=max_camadas_por_grade,
-            horas_producao=horas_producao,
-            penalizacao_superproducao=penalizacao_superproducao,
-            relaxacao=relaxacao,
+            comprimento_mesa_enfesto,
+            percentual_superproducao,
+            max_camadas_por_grade,
+            horas_producao,
+            penalizacao_superproducao,
+            motor=motor,
+            opcoes_motor=opcoes_motor,
+            opcoes_solver=opcoes_cache,
         )
 
+    resultados = {}
+    pedidos_limite_tempo = 0
+    for p, resultado in resolver_pedidos(
+        pedidos,
+        tabela,
+        comprimento_mesa_enfesto,
+        recursos_obj,
+        num_workers=num_workers,
+        evento_cancelamento=evento_cancelamento,
+        tamanho_lote=tamanho_lote,
+        janela_lote_dias=janela_lote_dias,
+        motor=motor,
+        opcoes_motor=opcoes_motor,
+        opcoes_solver=opcoes_solver,
+        percentual_superproducao=percentual_superproducao,
+        max_camadas_por_grade=max_camadas_por_grade,
+        horas_producao=horas_producao,
+        penalizacao_superproducao=penalizacao_superproducao,
+        relaxacao=relaxacao,
+        cache=contexto_cache,
+    ):
+        pedido = pedidos[p]
         if resultado:
             # Verificar se a produção atende à demanda
             demanda_atendida = all(
@@ -863,37 +1692,46 @@ def main(
                 logging.info(
                     f"Solução encontrada para o pedido {p} com relaxação de {resultado['relaxacao_aplicada']:.2f}"
                 )
+                if callback_pedido is not None:
+                    callback_pedido(p, resultado)
             else:
                 logging.warning(
                     f"Solução encontrada para o pedido {p}, mas não atende completamente à demanda. Relaxação aplicada: {resultado['relaxacao_aplicada']:.2f}"
                 )
+        elif isinstance(resultado, SemSolucaoNoTempo):
+            pedidos_limite_tempo += 1
+            logging.warning(
+                f"Tempo limite ou prazo esgotado antes de uma solução para o Pedido {p}"
+            )
         else:
             logging.warning(
                 f"Não foi possível encontrar uma solução viável para o Pedido {p}, mesmo com relaxação"
             )
-    
-        
-
-    def calcular_prioridade(pedido, resultado, criterio):
-        if criterio == "prazo":
-            return (pedido["prazo"] - data_inicio).days
-        elif criterio == "custo_total":
-            return resultado["custo_total"]
-        elif criterio == "tempo_producao":
-            return calcular_tempo_producao(resultado, grades, recursos_obj)
-        else:
-            raise ValueError(f"Critério de prioridade inválido: {criterio}")
+
+    # Os pedidos terminam fora de ordem quando resolvidos em paralelo;
+    # restaura a ordem de entrada para que o resultado seja determinístico
+    resultados = {p: resultados[p] for p in pedidos if p in resultados}
 
     prioridades = {
-        p: calcular_prioridade(pedidos[p], resultado, criterio_prioridade)
+        p: calcular_prioridade(
+            pedidos[p], resultado, criterio_prioridade, data_inicio, tabela, recursos_obj
+        )
         for p, resultado in resultados.items()
     }
 
     pedidos_ordenados = sorted(prioridades, key=prioridades.get)
 
-    cronograma = gerar_cronograma(
-        pedidos_ordenados, resultados, grades, data_inicio, recursos_obj, turnos
-    )
+    with span("cronograma", pedidos=len(pedidos_ordenados)):
+        cronograma = gerar_cronograma(
+            pedidos_ordenados,
+            resultados,
+            tabela,
+            data_inicio,
+            recursos_obj,
+            turnos,
+            pedidos=pedidos,
+            regra_despacho=regra_despacho,
+        )
 
     # Exibir resultados e gráfico
     print(f"\nPriorização dos pedidos ({criterio_prioridade}):")
@@ -938,59 +1776,61 @@ def main(
 
         print(f"  Custo de setup: R$ {resultado['custo_setup']:.2f}")
 
-    fig = criar_grafico_gantt(cronograma, pedidos_ordenados, criterio_prioridade)
-    pio.show(fig)
+    if mostrar_grafico:
+        pio.show(
+            criar_grafico_gantt(cronograma, pedidos_ordenados, criterio_prioridade)
+        )
 
-    exportar_para_excel(
-        cronograma, pedidos_ordenados, resultados, pedidos, tamanhos, grades, fig
-    )
-    # Exportar a demanda dos pedidos para Excel
-    exportar_demanda_pedidos_excel(
-        pedidos, f"demanda_pedidos-{criterio_prioridade}.xlsx"
+    retorno = resumir_plano(
+        pedidos_ordenados, cronograma, resultados, pedidos, tamanhos, pedidos_limite_tempo
     )
-    salvar_figura_html(fig, f"gantt_chart-{criterio_prioridade}.html")
-
-
-    # Preparar resultados detalhados
-    resultados_detalhados = {}
-    for p in pedidos_ordenados:
-        resultado = resultados[p]
-        resultados_detalhados[p] = {
-            "prazo": pedidos[p]["prazo"].isoformat(),
-            "custo_total": float(resultado["custo_total"]),
-            "metros_tecido": float(resultado["metros_tecido"]),
-            "perimetro_cortado": float(resultado["perimetro_cortado"]),
-            "desperdicio": float(resultado["desperdicio"]),
-            "tempo_enfesto": float(resultado["tempo_enfesto"]),
-            "tempo_corte": float(resultado["tempo_corte"]),
-            "tempo_total": float(resultado["tempo_total"]),
-            "producao": {t: int(resultado["producao"][t]) for t in tamanhos},
-            "demandas": pedidos[p]["demandas"],
-            "camadas": {g: int(camadas) for g, camadas in resultado["camadas"].items() if camadas > 0},
-            "custo_setup": float(resultado["custo_setup"])
+    resultados_detalhados = retorno["resultados"]
+    if cache is not None:
+        retorno["cache"] = cache.estatisticas()
+    if motor == "geracao_colunas":
+        # Pool final de colunas: união dos pools de cada processo
+        pool_colunas = {}
+        for p in pedidos_ordenados:
+            geracao = resultados[p].get("geracao_colunas")
+            if geracao:
+                pool_colunas.update(geracao["colunas"])
+                resultados_detalhados[p]["geracao_colunas"] = {
+                    "iteracoes": geracao["iteracoes"],
+                    "colunas_adicionadas": geracao["colunas_adicionadas"],
+                    "limite_inferior_lp": float(geracao["limite_inferior_lp"]),
+                }
+        retorno["pool_colunas"] = pool_colunas
+    if timings:
+        # Tempos por fase desta execução, inclusive dos processos do pool
+        retorno["timings"] = {
+            "total_segundos": time.perf_counter() - inicio,
+            **coletor_ativo().resumo(),
         }
 
-    # Retornar resultados
-    return {
-        "pedidos_ordenados": pedidos_ordenados,
-        "cronograma": {
-            str(k): {
-                "inicio_enfestamento": v["inicio_enfestamento"].isoformat(),
-                "fim_enfestamento": v["fim_enfestamento"].isoformat(),
-                "enfestadeira": v["enfestadeira"],
-                "inicio_corte": v["inicio_corte"].isoformat(),
-                "fim_corte": v["fim_corte"].isoformat(),
-                "maquina_corte": v["maquina_corte"]
-            }
-            for k, v in cronograma.items()
-        },
-        "resultados": resultados_detalhados,
-        "metricas_globais": {
-            "custo_total": sum(r["custo_total"] for r in resultados_detalhados.values()),
-            "tempo_total": sum(r["tempo_total"] for r in resultados_detalhados.values()),
-            "desperdicio_total": sum(r["desperdicio"] for r in resultados_detalhados.values())
-        }
-    }
+    # Relatórios são renderizados em segundo plano; main retorna sem esperar
+    if saidas:
+        gerenciador_artefatos = gerenciador_artefatos or obter_gerenciador_artefatos()
+        artefato_id = gerenciador_artefatos.agendar(
+            renderizar_relatorios,
+            saidas,
+            {
+                "criterio_prioridade": criterio_prioridade,
+                "cronograma": cronograma,
+                "pedidos_ordenados": pedidos_ordenados,
+                "resultados": resultados,
+                "pedidos": pedidos,
+                "tamanhos": tamanhos,
+                "grades": grades,
+                "tabela": tabela,
+                "custos": custos,
+                "larguras": larguras,
+                "areas": areas,
+                "retorno": dict(retorno),
+            },
+            dono=dono_artefatos,
+        )
+        retorno["artefatos"] = {"id": artefato_id, "saidas": list(saidas)}
+    return retorno
 
 
 if __name__ == "__main__":
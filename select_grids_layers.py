@@ -1,7 +1,22 @@
 import json
 import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
 from ortools.linear_solver import pywraplp
-from openpyxl import Workbook
+
+from exportacao import exportar_linhas
+from layout_store import LayoutIndex, LayoutStore, load_streaming
+from metricas import span
+from solvers import (
+    DENTRO_DO_GAP,
+    LIMITE_DE_TEMPO,
+    gap_resposta,
+    resolver_solver,
+    status_resposta,
+    validar_solver,
+)
 
 # Logging Configuration
 logging.basicConfig(
@@ -10,16 +25,93 @@ logging.basicConfig(
     handlers=[logging.FileHandler("debug.log"), logging.StreamHandler()],
 )
 
+SIZES = ["P", "M", "G", "GG"]
+
+# general_configuration keys that set the solver options (see solvers.resolver_modelo)
+SOLVER_CONFIG_KEYS = {
+    'solver': 'solver',
+    'num_search_workers': 'num_search_workers',
+    'time_limit': 'tempo_limite_s',
+    'relative_gap': 'gap_relativo',
+    'absolute_gap': 'gap_absoluto',
+}
+
+# Result status for each solver status with a solution
+RESULT_STATUS = {DENTRO_DO_GAP: "within_gap", LIMITE_DE_TEMPO: "time_limit"}
+
+# Optimizer of each optimize_all worker process, built once by the
+# initializer from the layout store instead of being sent with every order
+_worker_optimizer = None
+
+
+def _init_worker(config, fabrics, layouts, solver_options):
+    global _worker_optimizer
+    _worker_optimizer = LayoutOptimizer({
+        'general_configuration': config,
+        'layouts': layouts,
+        'fabrics': fabrics,
+    }, solver_options)
+
+
+def _optimize_order_worker(order):
+    logging.info(f"Optimizing order {order['id']}")
+    return order['id'], _worker_optimizer.optimize_order(order)
+
+
 class LayoutOptimizer:
-    def __init__(self, input_data):
+    def __init__(self, input_data, solver_options=None):
         self.config = input_data['general_configuration']
-        self.layouts = input_data['layouts']
+        # Solver backend (scip, cbc or cp_sat) and its budget; defaults come
+        # from general_configuration and can be overridden per optimizer
+        self.solver_options = {
+            option: self.config[key]
+            for key, option in SOLVER_CONFIG_KEYS.items()
+            if key in self.config
+        }
+        self.solver_options.update(solver_options or {})
+        validar_solver(self.solver_options.get('solver', 'scip'))
+        self.sizes = list(SIZES)
+        # Layouts are kept in a columnar LayoutStore; lists of dicts are converted
+        layouts = input_data['layouts']
+        if not isinstance(layouts, LayoutStore):
+            layouts = LayoutStore.from_dicts(layouts, self.sizes)
+        self.layouts = layouts
+        # Width/pattern index, size counts and efficiencies, built once
+        self.layout_index = LayoutIndex(layouts)
         self.fabrics = {f['fabric']: f for f in input_data['fabrics']}
-        self.orders = input_data['production_orders']
-        self.sizes = ["P", "M", "G", "GG"]
+        self.orders = []
+        self.orders_by_id = {}
+        for order in input_data.get('production_orders', []):
+            self.add_order(order)
         self.overproduction_penalty = self.config.get('overproduction_percentage', 0.05)
         self.unit_waste_cost = self.config.get('waste_cost', 0.1)  # Ensure 'waste_cost' exists in JSON
 
+    @classmethod
+    def from_json_stream(cls, path, solver_options=None):
+        """Build an optimizer from an input file without loading it whole.
+
+        Returns (optimizer, orders): layouts are streamed into a LayoutStore
+        and orders is an iterator that keeps parsing the file, yielding one
+        order at a time. Orders are not added to optimizer.orders.
+        general_configuration, layouts and fabrics must come before
+        production_orders in the file (see layout_store.load_streaming).
+        """
+        config, fabrics, store, orders = load_streaming(path, SIZES)
+        optimizer = cls({
+            'general_configuration': config,
+            'layouts': store,
+            'fabrics': fabrics,
+        }, solver_options)
+        return optimizer, orders
+
+    def add_order(self, order):
+        self.orders.append(order)
+        self.orders_by_id[order['id']] = order
+
+    def layout_by_id(self, layout_id):
+        """Layout rebuilt from the store by id (a new dict on every call)."""
+        return self.layouts.layout(self.layouts.position(layout_id))
+
     def calculate_layout_costs(self, layout, num_layers, used):
         fabric = self.fabrics[layout['fabric']]
         
@@ -55,34 +147,23 @@ class LayoutOptimizer:
         }
 
     def preprocess_layouts(self, demand, fabric_width):
-        """Preprocess and filter layouts compatible with the demand and fabric width"""
-        filtered_layouts = []
-        for layout in self.layouts:
-            # Filter by fabric width
-            if layout['fabric_width'] != fabric_width:
-                continue
-            
-            # Check if the layout contains the necessary patterns
-            layout_patterns = [p['pattern'] for p in layout['pieces']]
-            order_patterns = [p['pattern'] for p in demand['pieces']]
-            if not set(order_patterns).issubset(set(layout_patterns)):
-                continue
-            
-            # Calculate efficiency per size
-            layout['efficiency'] = {}
-            for size in self.sizes:
-                total_pieces_size = sum(
-                    p['size_grade'].get(size, 0) for p in layout['pieces']
-                )
-                pieces_per_meter = total_pieces_size / (layout['layout_length'] / 1000)
-                efficiency = pieces_per_meter * layout['utilization']
-                layout['efficiency'][size] = efficiency
+        """Layouts compatible with the demand and fabric width.
 
+        Candidates come from the prebuilt LayoutIndex; each layout is returned
+        as a new dict with its per-size efficiency, so the store is not mutated.
+        """
+        order_patterns = [p['pattern'] for p in demand['pieces']]
+        filtered_layouts = []
+        for i in self.layout_index.candidates(fabric_width, order_patterns):
+            layout = self.layouts.layout(i)
+            layout['efficiency'] = dict(
+                zip(self.sizes, self.layout_index.efficiency[i].tolist())
+            )
             filtered_layouts.append(layout)
-                
         return filtered_layouts
 
     def optimize_order(self, order):
+        """Optimize one order; order['solver_options'] overrides the solver budget."""
         demand = order['demand'][0]
         order_pieces = demand['pieces']
         demand_quantity = {}
@@ -96,17 +177,25 @@ class LayoutOptimizer:
         fabric_width = demand['fabric_width']
         
         # Preprocessing
-        filtered_layouts = self.preprocess_layouts(demand, fabric_width)
+        with span("preprocess_layouts", order=order['id']):
+            filtered_layouts = self.preprocess_layouts(demand, fabric_width)
         if not filtered_layouts:
             logging.warning(f"No compatible layouts found for order {order['id']}")
             return None
 
-        # Create solver
+        # Pieces of each order pattern per layout and size, built once and
+        # reused by the model, the metrics and the exports
+        order_patterns = list(dict.fromkeys(piece['pattern'] for piece in order_pieces))
+        pattern_production = self.layouts.pattern_size_counts(
+            self.layout_index.candidates(fabric_width, order_patterns), order_patterns
+        )
+        production_coef = pattern_production.sum(axis=1).tolist()
+        layout_row = {layout['id']: row for row, layout in enumerate(filtered_layouts)}
+
+        # Build the model (SCIP is only the builder; see solver_options)
         solver = pywraplp.Solver.CreateSolver("SCIP")
         if not solver:
             return None
-                
-        solver.SetTimeLimit(600_000)  # 10 minutes
         
         # Decision Variables
         x = {}  # number of layers per layout
@@ -122,11 +211,10 @@ class LayoutOptimizer:
         production = {}
         overproduction = {}
         for size in self.sizes:
+            s = self.sizes.index(size)
             production[size] = solver.Sum([
-                x[layout['id']] * sum(
-                    p['size_grade'].get(size, 0) for p in layout['pieces'] if p['pattern'] in [piece['pattern'] for piece in order_pieces]
-                )
-                for layout in filtered_layouts
+                x[layout['id']] * production_coef[row][s]
+                for row, layout in enumerate(filtered_layouts)
             ])
                 
             # Minimum Demand
@@ -161,8 +249,11 @@ class LayoutOptimizer:
         # Objective: minimize total cost + penalties
         solver.Minimize(total_cost + overproduction_penalty)
             
-        # Solve
-        status = solver.Solve()
+        # Solve with the configured backend
+        response = resolver_solver(
+            solver, **{**self.solver_options, **order.get('solver_options', {})}
+        )
+        status = response.status
             
         if status == pywraplp.Solver.OPTIMAL or status == pywraplp.Solver.FEASIBLE:
             solution = {
@@ -182,14 +273,16 @@ class LayoutOptimizer:
             total_fabric_meters = 0
             total_cut_perimeter = 0
                 
+            layout_production = {}
             for layout_id, layers in solution.items():
-                layout = next(l for l in filtered_layouts if l['id'] == layout_id)
+                layout = filtered_layouts[layout_row[layout_id]]
                     
+                layout_production[layout_id] = {
+                    size: count * layers
+                    for size, count in zip(self.sizes, production_coef[layout_row[layout_id]])
+                }
                 for size in self.sizes:
-                    total_pieces_size = sum(
-                        p['size_grade'].get(size, 0) for p in layout['pieces'] if p['pattern'] in [piece['pattern'] for piece in order_pieces]
-                    )
-                    actual_production[size] += total_pieces_size * layers
+                    actual_production[size] += layout_production[layout_id][size]
                         
                 used = y[layout_id].solution_value()
                 costs = self.calculate_layout_costs(layout, layers, used)
@@ -212,17 +305,14 @@ class LayoutOptimizer:
                 fabrics = piece['fabrics']
                 quantity = piece['quantity']
                 production_piece = {size: 0 for size in self.sizes}
-                used_layout_ids = []
+                k = order_patterns.index(pattern)
 
+                # Every candidate layout contains all order patterns
+                used_layout_ids = list(solution)
                 for layout_id, layers in solution.items():
-                    layout = next(l for l in filtered_layouts if l['id'] == layout_id)
-                    for p in layout['pieces']:
-                        if p['pattern'] == pattern:
-                            for size in self.sizes:
-                                qty = p['size_grade'].get(size, 0) * layers
-                                production_piece[size] += qty
-                            if layout_id not in used_layout_ids:
-                                used_layout_ids.append(layout_id)
+                    counts = pattern_production[layout_row[layout_id], k].tolist()
+                    for size, count in zip(self.sizes, counts):
+                        production_piece[size] += count * layers
                 production_pieces.append({
                     "pattern": pattern,
                     "fabrics": fabrics,
@@ -234,8 +324,7 @@ class LayoutOptimizer:
             # Collect Used Layouts
             used_layouts = []
             for layout_id, layers in solution.items():
-                layout = next(l for l in self.layouts if l['id'] == layout_id)
-                layout_copy = layout.copy()
+                layout_copy = filtered_layouts[layout_row[layout_id]].copy()
                 layout_copy['layers'] = layers
                 layout_copy['order_ids'] = [order['id']]
                 used_layouts.append(layout_copy)
@@ -252,7 +341,8 @@ class LayoutOptimizer:
             }
 
             return {
-                "status": "optimal",
+                "status": RESULT_STATUS.get(status_resposta(response), "optimal"),
+                "gap": gap_resposta(response),
                 "solution": solution,
                 "production": actual_production,
                 "overproduction": actual_overproduction,
@@ -271,81 +361,111 @@ class LayoutOptimizer:
                 },
                 "kpis": kpis,
                 "production_pieces": production_pieces,
+                "layout_production": layout_production,
                 "used_layouts": used_layouts
             }
                 
+        logging.warning(f"Solver stopped without a solution for order {order['id']}: {status_resposta(response)}")
         return None
 
-    def export_results(self, results):
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Results"
-            
-        # Headers
-        headers = [
-            "Order", "Layout", "Layers", "P", "M", "G", "GG",
-            "Total Length (m)", "Cut Perimeter (m)", "Waste Area (m²)",
-            "Cutting Cost (R$)", "Layout Cost (R$)", "Waste Cost (R$)", "Total Cost (R$)"
-        ]
-        for col, header in enumerate(headers, 1):
-            ws.cell(row=1, column=col, value=header)
-            
-        row = 2
+    def optimize_all(self, orders=None, workers=1):
+        """Optimize orders, yielding (order_id, result) as each one finishes.
+
+        orders defaults to self.orders; orders given here (a list or the
+        iterator from from_json_stream) are added to the optimizer as they
+        are read. With workers > 1 the orders are solved in a process pool
+        and results come in completion order; the layout store is sent to
+        each process once by the pool initializer. workers=None or 0 uses
+        all cores.
+        """
+        if orders is None:
+            orders = list(self.orders)
+        else:
+            orders = self._add_orders(orders)
+        if not workers:
+            workers = os.cpu_count() or 1
+
+        if workers == 1:
+            for order in orders:
+                logging.info(f"Optimizing order {order['id']}")
+                yield order['id'], self.optimize_order(order)
+            return
+
+        executor = ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(
+                self.config, list(self.fabrics.values()), self.layouts, self.solver_options
+            ),
+        )
+        try:
+            futures = [executor.submit(_optimize_order_worker, order) for order in orders]
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def _add_orders(self, orders):
+        for order in orders:
+            self.add_order(order)
+            yield order
+
+    RESULT_HEADERS = [
+        "Order", "Layout", "Layers", "P", "M", "G", "GG",
+        "Total Length (m)", "Cut Perimeter (m)", "Waste Area (m²)",
+        "Cutting Cost (R$)", "Layout Cost (R$)", "Waste Cost (R$)", "Total Cost (R$)"
+    ]
+
+    def iter_result_rows(self, results):
+        """Yield the export rows one at a time (header excluded)."""
         for order_id, result in results.items():
             if result:
                 for layout_id, layers in result['solution'].items():
-                    layout = next(l for l in self.layouts if l['id'] == layout_id)
-                        
+                    layout = self.layout_by_id(layout_id)
+
                     used = 1  # Layout was used
                     costs = self.calculate_layout_costs(layout, layers, used)
-                    
-                    ws.cell(row=row, column=1, value=order_id)
-                    ws.cell(row=row, column=2, value=layout_id)
-                    ws.cell(row=row, column=3, value=layers)
-                        
-                    for i, size in enumerate(self.sizes, 4):
-                        piece_quantity = sum(
-                            p['size_grade'].get(size, 0) for p in layout['pieces']
-                            if p['pattern'] in [piece['pattern'] for piece in self.orders[int(order_id)-1]['demand'][0]['pieces']]
-                        ) * layers
-                        ws.cell(row=row, column=i, value=piece_quantity)
-                        
-                    length_meters = costs['fabric_meters']
-                    perimeter_meters = costs['cut_perimeter']
-                    fabric_waste_m2 = costs['fabric_waste']  # Updated key
-                    
-                    ws.cell(row=row, column=8, value=round(length_meters, 2))
-                    ws.cell(row=row, column=9, value=round(perimeter_meters, 2))
-                    ws.cell(row=row, column=10, value=round(fabric_waste_m2, 4))  # Updated key
-                    
-                    ws.cell(row=row, column=11, value=round(costs['cutting_cost'], 2))
-                    ws.cell(row=row, column=12, value=round(costs['layout_cost'], 2))
-                    ws.cell(row=row, column=13, value=round(costs['waste_cost'], 2))
-                    ws.cell(row=row, column=14, value=round(costs['total_cost'], 2))
-                        
-                    row += 1
-                
+
+                    piece_quantities = [
+                        result['layout_production'][layout_id][size] for size in self.sizes
+                    ]
+                    yield [order_id, layout_id, layers] + piece_quantities + [
+                        round(costs['fabric_meters'], 2),
+                        round(costs['cut_perimeter'], 2),
+                        round(costs['fabric_waste'], 4),
+                        round(costs['cutting_cost'], 2),
+                        round(costs['layout_cost'], 2),
+                        round(costs['waste_cost'], 2),
+                        round(costs['total_cost'], 2),
+                    ]
+
                 # Add overall order metrics
-                row += 1
-                ws.cell(row=row, column=1, value="Order Totals")
-                ws.cell(row=row, column=3, value="Total")
-                for i, size in enumerate(self.sizes, 4):
-                    ws.cell(row=row, column=i, value=result['production'][size])
-                ws.cell(row=row, column=8, value=round(result['metrics']['fabric_meters'], 2))
-                ws.cell(row=row, column=9, value=round(result['metrics']['cut_perimeter'], 2))
-                ws.cell(row=row, column=10, value=round(result['metrics']['fabric_waste'], 4))  # Updated key
-                ws.cell(row=row, column=11, value=round(result['metrics']['cutting_cost'], 2))
-                ws.cell(row=row, column=12, value=round(result['metrics']['layout_cost'], 2))
-                ws.cell(row=row, column=13, value=round(result['metrics']['waste_cost'], 2))
-                ws.cell(row=row, column=14, value=round(result['metrics']['total_cost'], 2))
-                row += 2  # Space between orders
+                metrics = result['metrics']
+                yield []
+                yield ["Order Totals", None, "Total"] + [
+                    result['production'][size] for size in self.sizes
+                ] + [
+                    round(metrics['fabric_meters'], 2),
+                    round(metrics['cut_perimeter'], 2),
+                    round(metrics['fabric_waste'], 4),
+                    round(metrics['cutting_cost'], 2),
+                    round(metrics['layout_cost'], 2),
+                    round(metrics['waste_cost'], 2),
+                    round(metrics['total_cost'], 2),
+                ]
+                yield []  # Space between orders
             else:
-                # If no solution, log in Excel
-                ws.cell(row=row, column=1, value=order_id)
-                ws.cell(row=row, column=2, value="No solution")
-                row += 1
-        
-        wb.save("results.xlsx")
+                # If no solution, log in the export
+                yield [order_id, "No solution"]
+
+    def export_results(self, results, filename="results.xlsx"):
+        """Stream the results to xlsx or csv (chosen by the file extension)."""
+        exportar_linhas(
+            self.iter_result_rows(results),
+            filename,
+            titulo_planilha="Results",
+            colunas=self.RESULT_HEADERS,
+        )
 
     def export_results_json(self, results):
         results_json = []
@@ -360,23 +480,21 @@ class LayoutOptimizer:
         with open('results.json', 'w', encoding='utf-8') as f:
             json.dump(results_json, f, ensure_ascii=False, indent=4)
 
-def main():
-    # Load data
-    with open('dados_entrada.json', 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    
-    # Create optimizer
-    optimizer = LayoutOptimizer(data)
+def main(workers=1, solver_options=None, deadline_s=None):
+    # Overall deadline shared by every order of the run (also in the workers)
+    if deadline_s is not None:
+        solver_options = dict(solver_options or {}, prazo=time.time() + deadline_s)
+
+    # Load data: layouts into a columnar store, orders streamed one at a time
+    optimizer, orders = LayoutOptimizer.from_json_stream('dados_entrada.json', solver_options)
     
-    # Process orders
+    # Process orders (in parallel with workers > 1)
     results = {}
-    for order in optimizer.orders:
-        logging.info(f"Optimizing order {order['id']}")
-        result = optimizer.optimize_order(order)
-        results[order['id']] = result
+    for order_id, result in optimizer.optimize_all(orders, workers=workers):
+        results[order_id] = result
         
         if result:
-            logging.info(f"Solution found for order {order['id']}")
+            logging.info(f"Solution found for order {order_id}")
             # Production details...
             for size in optimizer.sizes:
                 logging.info(f"  {size}: {result['production'][size]} pieces (Excess: {result['overproduction'][size]})")
@@ -389,7 +507,10 @@ def main():
             logging.info(f"Fabric waste: {result['metrics']['fabric_waste'] / 1_000_000:.4f} m²")  # Updated key
             logging.info(f"Overproduction penalty: R$ {result['metrics']['overproduction_penalty']:.2f}")
         else:
-            logging.warning(f"Could not find a solution for order {order['id']}")
+            logging.warning(f"Could not find a solution for order {order_id}")
+
+    # Exports follow the input order, not the completion order
+    results = {order['id']: results[order['id']] for order in optimizer.orders}
     
     # Export results
     if any(results.values()):
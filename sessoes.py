@@ -0,0 +1,512 @@
+import datetime
+import logging
+import os
+import threading
+import uuid
+from collections import OrderedDict
+
+from calendario_turnos import ShiftCalendar
+from catalogos import como_datetime_local, normalizar_catalogo
+from escalonamento import escalonar, reparar_escalonamento
+from jobs import CONCLUIDO, gerenciador_jobs
+from metricas import span
+from min_cost_production import (
+    OtimizacaoCancelada,
+    Recurso,
+    SemSolucaoNoTempo,
+    calcular_prioridade,
+    criar_modelo_pedido,
+    otimizar_pedido_com_relaxacao,
+    resolver_pedidos,
+    resumir_plano,
+)
+from tabela_grades import obter_tabela_grades
+
+
+# Sessões mantidas em memória pela API; as menos usadas são descartadas
+MAX_SESSOES = int(os.getenv("OTIMIZACAO_MAX_SESSOES", 32))
+# Modelos de sessões mantidos por processo do pool de jobs
+MAX_MODELOS_POR_PROCESSO = int(os.getenv("OTIMIZACAO_MAX_MODELOS_SESSAO", 4))
+
+# Campos de um pedido que podem ser alterados por um delta
+CAMPOS_PEDIDO = ("demandas", "prazo", "opcoes_solver")
+
+# Modelo de cada sessão, pelo id, no processo que resolve seus pedidos
+_modelos = OrderedDict()
+
+
+def _agora():
+    return datetime.datetime.now().isoformat()
+
+
+class SessaoOcupada(Exception):
+    """Levantada ao enviar um delta enquanto a sessão ainda processa outro."""
+
+
+class SessaoPlanejamento:
+    """Plano de produção mantido entre edições da carteira de pedidos.
+
+    A sessão resolve a carteira uma vez e guarda os resultados, o cronograma
+    e o registro de despachos. Cada delta (pedidos incluídos, alterados ou
+    cancelados) resolve de novo só os pedidos incluídos ou com demanda
+    alterada, reaproveitando um único modelo por sessão, e repara o
+    cronograma a partir do primeiro despacho afetado (ver
+    escalonamento.reparar_escalonamento) em vez de refazê-lo.
+
+    Os parâmetros são os de min_cost_production.main. Ids de pedidos são
+    guardados como str, como no JSON da API. A sessão é enviada aos processos
+    do pool de jobs, que a devolvem atualizada (ver GerenciadorSessoes).
+    """
+
+    def __init__(
+        self,
+        pedidos,
+        grades,
+        recursos,
+        turnos,
+        data_inicio,
+        criterio_prioridade,
+        tolerancia_largura,
+        percentual_superproducao,
+        max_camadas_por_grade,
+        horas_producao,
+        comprimento_mesa_enfesto,
+        penalizacao_superproducao,
+        relaxacao,
+        regra_despacho="ordem",
+        motor="direto",
+        gerar_grades=False,
+        opcoes_solver=None,
+        num_workers=1,
+        id=None,
+        usuario=None,
+        evento_cancelamento=None,
+    ):
+        self.id = id or uuid.uuid4().hex
+        self.usuario = usuario
+        self.criado_em = _agora()
+        self.atualizado_em = self.criado_em
+        self.versao = 0
+        self._lock = threading.Lock()
+
+        self.data_inicio = data_inicio
+        self.criterio_prioridade = criterio_prioridade
+        self.regra_despacho = regra_despacho
+        self.comprimento_mesa_enfesto = comprimento_mesa_enfesto
+        self.motor = motor
+        self.opcoes_motor = {"gerar_grades": gerar_grades} if motor == "geracao_colunas" else {}
+        self.opcoes_solver = opcoes_solver or {}
+        self.num_workers = num_workers
+        self.parametros = {
+            "percentual_superproducao": percentual_superproducao,
+            "max_camadas_por_grade": max_camadas_por_grade,
+            "horas_producao": horas_producao,
+            "penalizacao_superproducao": penalizacao_superproducao,
+            "relaxacao": relaxacao,
+        }
+        self.recursos = {
+            tipo: [Recurso(r["id"], r["eficiencia"]) for r in recursos[tipo]]
+            for tipo in ("enfestadeiras", "maquinas_corte")
+        }
+        # O calendário é montado uma vez e reaproveitado em cada reparo
+        self.calendario = ShiftCalendar(turnos, data_inicio)
+        self.tamanhos = list(next(iter(grades.values()))["quantidades"].keys())
+
+        self.pedidos = {str(p): dict(pedido) for p, pedido in pedidos.items()}
+        self.resultados = {}
+        self.registro = {}
+        with span("preprocessamento_grades", grades=len(grades)):
+            self.tabela = obter_tabela_grades(grades, self.tamanhos, tolerancia_largura)
+        self._resolver(list(self.pedidos), self.pedidos, self.resultados, evento_cancelamento)
+        self.pedidos_ordenados = self._priorizar(self.pedidos, self.resultados)
+        with span("cronograma", pedidos=len(self.pedidos_ordenados)):
+            self.cronograma = escalonar(
+                self.pedidos_ordenados,
+                self.resultados,
+                self.data_inicio,
+                self.recursos,
+                self.calendario,
+                pedidos=self.pedidos,
+                regra_enfesto=self.regra_despacho,
+                registro=self.registro,
+            )
+
+    def __getstate__(self):
+        estado = dict(self.__dict__)
+        del estado["_lock"]
+        return estado
+
+    def __setstate__(self, estado):
+        self.__dict__.update(estado)
+        self._lock = threading.Lock()
+
+    @property
+    def modelo(self):
+        # Os deltas de uma sessão podem cair em processos diferentes do pool,
+        # então o modelo fica no processo, e não na sessão enviada a ele
+        if self.id not in _modelos:
+            with span("construcao_modelo", motor=self.motor):
+                _modelos[self.id] = criar_modelo_pedido(
+                    self.motor,
+                    self.tabela,
+                    self.comprimento_mesa_enfesto,
+                    self.recursos,
+                    self.parametros["percentual_superproducao"],
+                    self.parametros["max_camadas_por_grade"],
+                    self.parametros["horas_producao"],
+                    self.parametros["penalizacao_superproducao"],
+                    opcoes_solver=self.opcoes_solver,
+                    **self.opcoes_motor,
+                )
+            while len(_modelos) > MAX_MODELOS_POR_PROCESSO:
+                _modelos.popitem(last=False)
+        _modelos.move_to_end(self.id)
+        return _modelos[self.id]
+
+    def _resultados_pedidos(self, pedidos, evento_cancelamento=None):
+        if self.num_workers != 1 and len(pedidos) > 1:
+            # Carteira inicial: os pedidos são distribuídos no pool de processos
+            yield from resolver_pedidos(
+                pedidos,
+                self.tabela,
+                self.comprimento_mesa_enfesto,
+                self.recursos,
+                num_workers=self.num_workers,
+                evento_cancelamento=evento_cancelamento,
+                motor=self.motor,
+                opcoes_motor=self.opcoes_motor,
+                opcoes_solver=self.opcoes_solver,
+                **self.parametros,
+            )
+            return
+        for p, pedido in pedidos.items():
+            if evento_cancelamento is not None and evento_cancelamento.is_set():
+                raise OtimizacaoCancelada(f"Sessão {self.id} cancelada antes do pedido {p}")
+            with span("pedido"):
+                yield p, otimizar_pedido_com_relaxacao(
+                    pedido,
+                    self.tabela,
+                    self.comprimento_mesa_enfesto,
+                    self.recursos,
+                    modelo=self.modelo,
+                    opcoes_solver=self.opcoes_solver,
+                    **self.parametros,
+                )
+
+    def _resolver(self, ids, pedidos, resultados, evento_cancelamento=None):
+        """Resolve os pedidos ids e atualiza resultados; retorna os sem solução."""
+        sem_solucao = []
+        a_resolver = {p: pedidos[p] for p in ids}
+        for p, resultado in self._resultados_pedidos(a_resolver, evento_cancelamento):
+            demandas = pedidos[p]["demandas"]
+            if resultado and all(
+                resultado["producao"][t] >= demandas[t] for t in self.tamanhos
+            ):
+                resultados[p] = resultado
+            else:
+                if isinstance(resultado, SemSolucaoNoTempo):
+                    logging.warning(f"Sessão {self.id}: pedido {p} sem solução no tempo limite")
+                else:
+                    logging.warning(f"Sessão {self.id}: pedido {p} sem solução viável")
+                resultados.pop(p, None)
+                sem_solucao.append(p)
+        return sem_solucao
+
+    def _priorizar(self, pedidos, resultados):
+        # Mesma priorização de main, na ordem de inclusão dos pedidos
+        prioridades = {
+            p: calcular_prioridade(
+                pedidos[p],
+                resultados[p],
+                self.criterio_prioridade,
+                self.data_inicio,
+                self.tabela,
+                self.recursos,
+            )
+            for p in pedidos
+            if p in resultados
+        }
+        return sorted(prioridades, key=prioridades.get)
+
+    def validar_delta(self, adicionar=None, modificar=None, cancelar=None):
+        """Confere um delta contra a carteira atual, sem alterar a sessão.
+
+        Retorna (adicionar, modificar, cancelar) com ids como str e prazos
+        como datetime local sem fuso (ver catalogos.como_datetime_local).
+        Levanta ValueError se um id incluído já existir, um id alterado ou
+        cancelado não existir ou um pedido for inválido.
+        """
+        adicionar = {str(p): pedido for p, pedido in (adicionar or {}).items()}
+        modificar = {str(p): dict(campos) for p, campos in (modificar or {}).items()}
+        cancelar = [str(p) for p in (cancelar or [])]
+
+        repetidos = [p for p in adicionar if p in self.pedidos]
+        if repetidos:
+            raise ValueError(f"Pedidos já existem na sessão: {', '.join(repetidos)}")
+        inexistentes = [p for p in list(modificar) + cancelar if p not in self.pedidos]
+        if inexistentes:
+            raise ValueError(f"Pedidos não encontrados: {', '.join(inexistentes)}")
+        if adicionar:
+            adicionar = normalizar_catalogo("pedidos", adicionar)
+        for p, campos in modificar.items():
+            invalidos = set(campos) - set(CAMPOS_PEDIDO)
+            if invalidos:
+                raise ValueError(f"Campos inválidos no pedido {p}: {', '.join(sorted(invalidos))}")
+            if "prazo" in campos:
+                campos["prazo"] = como_datetime_local(campos["prazo"], f"Prazo do pedido {p}")
+        demandas = [(p, pedido["demandas"]) for p, pedido in adicionar.items()]
+        demandas += [(p, c["demandas"]) for p, c in modificar.items() if "demandas" in c]
+        for p, demanda in demandas:
+            faltantes = [t for t in self.tamanhos if t not in demanda]
+            if faltantes:
+                raise ValueError(f"Pedido {p} sem demanda para: {', '.join(faltantes)}")
+        return adicionar, modificar, cancelar
+
+    def aplicar(self, adicionar=None, modificar=None, cancelar=None, evento_cancelamento=None):
+        """Aplica um delta à carteira e atualiza o plano.
+
+        adicionar: {id: pedido}; modificar: {id: campos alterados} (demandas,
+        prazo, opcoes_solver); cancelar: [id]. O delta é aplicado a cópias da
+        carteira e dos resultados, que só substituem os da sessão depois do
+        reparo do cronograma: se validar_delta, um solve ou o reparo levantar
+        uma exceção, a sessão continua na versão anterior. Retorna o resumo
+        do delta.
+        """
+        with self._lock:
+            adicionar, modificar, cancelar = self.validar_delta(adicionar, modificar, cancelar)
+
+            pedidos = {p: dict(pedido) for p, pedido in self.pedidos.items()}
+            resultados = dict(self.resultados)
+            a_resolver = list(adicionar)
+            pedidos.update(adicionar)
+            for p, campos in modificar.items():
+                pedido = pedidos[p]
+                # Só demanda e orçamento do solver mudam a solução do pedido
+                if any(k != "prazo" and campos[k] != pedido.get(k) for k in campos):
+                    a_resolver.append(p)
+                pedido.update(campos)
+            for p in cancelar:
+                del pedidos[p]
+                resultados.pop(p, None)
+
+            with span("sessao_delta", pedidos=len(a_resolver)):
+                sem_solucao = self._resolver(
+                    a_resolver, pedidos, resultados, evento_cancelamento
+                )
+            pedidos_ordenados = self._priorizar(pedidos, resultados)
+
+            afetados = set(adicionar) | set(modificar) | set(cancelar)
+            registro_reparo = {}
+            with span("cronograma", pedidos=len(pedidos_ordenados)):
+                cronograma = reparar_escalonamento(
+                    self.cronograma,
+                    self.registro,
+                    pedidos_ordenados,
+                    resultados,
+                    self.data_inicio,
+                    self.recursos,
+                    self.calendario,
+                    afetados,
+                    pedidos=pedidos,
+                    regra_enfesto=self.regra_despacho,
+                    registro=registro_reparo,
+                )
+
+            self.pedidos = pedidos
+            self.resultados = resultados
+            self.pedidos_ordenados = pedidos_ordenados
+            self.cronograma = cronograma
+            self.registro = registro_reparo
+            self.versao += 1
+            self.atualizado_em = _agora()
+
+        logging.info(
+            f"Sessão {self.id} versão {self.versao}: {len(a_resolver)} pedidos resolvidos, "
+            f"{registro_reparo['enfesto_mantidos']} de {len(pedidos_ordenados)} "
+            f"enfestos mantidos"
+        )
+        return {
+            "versao": self.versao,
+            "resolvidos": a_resolver,
+            "sem_solucao": sem_solucao,
+            "reparo": {
+                "pedidos": len(pedidos_ordenados),
+                "enfestos_mantidos": registro_reparo["enfesto_mantidos"],
+                "cortes_mantidos": registro_reparo["corte_mantidos"],
+            },
+        }
+
+    def plano(self):
+        """Plano atual no formato do retorno de main, com id e versão da sessão."""
+        with self._lock:
+            plano = resumir_plano(
+                self.pedidos_ordenados,
+                self.cronograma,
+                self.resultados,
+                self.pedidos,
+                self.tamanhos,
+            )
+            plano.update(
+                sessao=self.id,
+                versao=self.versao,
+                criado_em=self.criado_em,
+                atualizado_em=self.atualizado_em,
+                pedidos_sem_solucao=[p for p in self.pedidos if p not in self.resultados],
+            )
+        return plano
+
+
+def _executar_sessao(parametros, estado, parciais, evento_cancelamento):
+    """Cria a sessão ou aplica um delta dentro de um processo do pool de jobs.
+
+    Retorna (sessao, resumo do delta); a sessão recebida é uma cópia, então
+    um job que falha ou é cancelado não altera a do processo da API.
+    """
+    sessao = parametros.get("sessao")
+    if sessao is None:
+        sessao = SessaoPlanejamento(
+            **parametros["criar"], evento_cancelamento=evento_cancelamento
+        )
+        resumo = None
+    else:
+        resumo = sessao.aplicar(
+            **parametros["delta"], evento_cancelamento=evento_cancelamento
+        )
+    return sessao, resumo
+
+
+class _EntradaSessao:
+    def __init__(self, id, usuario):
+        self.id = id
+        self.usuario = usuario
+        # Última versão concluída e job em andamento (criação ou delta)
+        self.sessao = None
+        self.job_id = None
+
+
+class GerenciadorSessoes:
+    """Sessões de planejamento por id, restritas ao usuário que as criou.
+
+    A criação e cada delta rodam como jobs de gerenciador_jobs, dividindo o
+    mesmo pool limitado de processos de /otimizar e podendo ser cancelados
+    em /jobs/{job_id}. A sessão é copiada para o processo do job e a versão
+    devolvida só substitui a atual quando o job conclui; enquanto houver um
+    job da sessão em andamento, novos deltas são recusados (SessaoOcupada).
+    """
+
+    def __init__(self, max_sessoes=MAX_SESSOES, jobs=gerenciador_jobs):
+        self.max_sessoes = max_sessoes
+        self.jobs = jobs
+        self._sessoes = {}
+        # Reentrante: ao_finalizar pode rodar na própria chamada a submeter
+        self._lock = threading.RLock()
+
+    def criar(self, usuario, **parametros):
+        """Enfileira a criação de uma sessão; retorna (sessao_id, job_id)."""
+        entrada = _EntradaSessao(uuid.uuid4().hex, usuario)
+        with self._lock:
+            self._sessoes[entrada.id] = entrada
+            try:
+                job_id = self._submeter(
+                    entrada, {"criar": dict(parametros, id=entrada.id, usuario=usuario)}
+                )
+            except Exception:
+                del self._sessoes[entrada.id]
+                raise
+            self._descartar_antigas()
+        logging.info(f"Sessão {entrada.id} criada por {usuario} (job {job_id})")
+        return entrada.id, job_id
+
+    def obter(self, sessao_id, usuario):
+        """(sessão concluída ou None se ainda em criação, job em andamento)."""
+        with self._lock:
+            entrada = self._sessoes.get(sessao_id)
+            if entrada is None or entrada.usuario != usuario:
+                return None
+            return entrada.sessao, entrada.job_id
+
+    def aplicar(self, sessao_id, usuario, adicionar=None, modificar=None, cancelar=None):
+        """Valida e enfileira um delta; retorna o job_id, ou None se a sessão não existir.
+
+        Levanta ValueError se o delta for inválido e SessaoOcupada se a sessão
+        ainda estiver sendo criada ou processando outro delta.
+        """
+        with self._lock:
+            entrada = self._sessoes.get(sessao_id)
+            if entrada is None or entrada.usuario != usuario:
+                return None
+            if entrada.job_id is not None:
+                raise SessaoOcupada(
+                    f"Sessão {sessao_id} ocupada com o job {entrada.job_id}"
+                )
+            adicionar, modificar, cancelar = entrada.sessao.validar_delta(
+                adicionar, modificar, cancelar
+            )
+            delta = {"adicionar": adicionar, "modificar": modificar, "cancelar": cancelar}
+            return self._submeter(entrada, {"sessao": entrada.sessao, "delta": delta})
+
+    def remover(self, sessao_id, usuario):
+        with self._lock:
+            entrada = self._sessoes.get(sessao_id)
+            if entrada is None or entrada.usuario != usuario:
+                return False
+            del self._sessoes[sessao_id]
+        if entrada.job_id is not None:
+            self.jobs.cancelar(entrada.job_id, usuario)
+        return True
+
+    def _submeter(self, entrada, parametros):
+        """Submete o job da sessão e retorna seu id.
+
+        entrada.job_id é definido antes da submissão: um job que termina
+        antes de submeter retornar já encontra o próprio id para liberar a
+        sessão.
+        """
+        job_id = uuid.uuid4().hex
+        entrada.job_id = job_id
+        try:
+            self.jobs.submeter(
+                entrada.usuario,
+                parametros,
+                executar=_executar_sessao,
+                ao_finalizar=lambda status, retorno: self._finalizar(
+                    entrada, job_id, status, retorno
+                ),
+                job_id=job_id,
+            )
+        except Exception:
+            entrada.job_id = None
+            raise
+        return job_id
+
+    def _finalizar(self, entrada, job_id, status, retorno):
+        """Publica a nova versão da sessão e retorna o resultado público do job."""
+        with self._lock:
+            if entrada.job_id == job_id:
+                entrada.job_id = None
+            ativa = self._sessoes.get(entrada.id) is entrada
+            if status != CONCLUIDO:
+                # Criação que não concluiu: não há versão a manter
+                if ativa and entrada.sessao is None:
+                    del self._sessoes[entrada.id]
+                return None
+            sessao, resumo = retorno
+            if ativa:
+                entrada.sessao = sessao
+        resultado = {"sessao": sessao.id, "versao": sessao.versao}
+        if resumo is not None:
+            resultado["delta"] = resumo
+        return resultado
+
+    def _descartar_antigas(self):
+        # Descarta as sessões atualizadas há mais tempo, sem job em andamento
+        ociosas = sorted(
+            (e for e in self._sessoes.values() if e.job_id is None),
+            key=lambda e: e.sessao.atualizado_em,
+        )
+        excesso = len(self._sessoes) - self.max_sessoes
+        for entrada in ociosas[:max(0, excesso)]:
+            del self._sessoes[entrada.id]
+
+
+gerenciador_sessoes = GerenciadorSessoes()
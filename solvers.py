@@ -0,0 +1,363 @@
+import logging
+import math
+import time
+
+from ortools.linear_solver import linear_solver_pb2, pywraplp
+from ortools.sat.python import cp_model
+
+from metricas import FASE_SOLVE, span
+
+
+SOLVERS = ("scip", "cbc", "cp_sat")
+SOLVER_PADRAO = "scip"
+
+# Limite de tempo padrão de cada solve (10 minutos)
+TEMPO_LIMITE_PADRAO_S = 600
+# Threads da busca do CP-SAT
+NUM_SEARCH_WORKERS_PADRAO = 8
+# Gap relativo aceito para encerrar a busca; o padrão do pywraplp (1e-4), que
+# era o usado antes de o gap ser configurável (0: provar a otimalidade)
+GAP_RELATIVO_PADRAO = pywraplp.MPSolverParameters.kDefaultRelativeMipGap
+# Gap abaixo do qual uma solução ótima é reportada como "otimo"
+TOLERANCIA_GAP = 1e-6
+
+# Variáveis contínuas viram inteiras no CP-SAT em unidades de 1/ESCALA_CONTINUAS
+ESCALA_CONTINUAS = 100
+# Limite usado no CP-SAT para variáveis sem limite no modelo
+LIMITE_VARIAVEIS = 10**7
+# Coeficientes são multiplicados por até 10**MAX_DIGITOS_COEFICIENTES e arredondados
+MAX_DIGITOS_COEFICIENTES = 6
+# Violação relativa das restrições originais aceita em uma solução do CP-SAT
+TOLERANCIA_VIOLACAO = 1e-6
+
+_NOMES_PYWRAPLP = {"scip": "SCIP", "cbc": "CBC"}
+
+# Status reportados nos resultados
+OTIMO = "otimo"
+DENTRO_DO_GAP = "dentro_do_gap"
+LIMITE_DE_TEMPO = "limite_de_tempo"
+INVIAVEL = "inviavel"
+NAO_RESOLVIDO = "nao_resolvido"
+
+_STATUS_CP_SAT = {
+    cp_model.OPTIMAL: linear_solver_pb2.MPSOLVER_OPTIMAL,
+    cp_model.FEASIBLE: linear_solver_pb2.MPSOLVER_FEASIBLE,
+    cp_model.INFEASIBLE: linear_solver_pb2.MPSOLVER_INFEASIBLE,
+    cp_model.MODEL_INVALID: linear_solver_pb2.MPSOLVER_MODEL_INVALID,
+    cp_model.UNKNOWN: linear_solver_pb2.MPSOLVER_NOT_SOLVED,
+}
+
+
+def validar_solver(solver):
+    if solver not in SOLVERS:
+        raise ValueError(f"Solver inválido: {solver}. Use {', '.join(SOLVERS)}")
+    return solver
+
+
+def resolver_modelo(
+    modelo_proto,
+    solver=SOLVER_PADRAO,
+    tempo_limite_s=TEMPO_LIMITE_PADRAO_S,
+    num_search_workers=NUM_SEARCH_WORKERS_PADRAO,
+    gap_relativo=GAP_RELATIVO_PADRAO,
+    gap_absoluto=None,
+    prazo=None,
+):
+    """Resolve um MPModelProto com o solver escolhido.
+
+    SCIP e CBC carregam o proto em um pywraplp.Solver; cp_sat resolve uma
+    cópia do modelo escalada para inteiros (ver _modelo_cp_sat) e, se a
+    solução dela violar o modelo original por causa de coeficientes
+    arredondados, o SCIP resolve o original no tempo restante. Em todos os
+    casos o retorno é um MPSolutionResponse, com status comparável às
+    constantes de pywraplp.Solver e valores das variáveis na escala original.
+
+    A busca para em tempo_limite_s ou ao atingir gap_relativo/gap_absoluto
+    (o CBC não aceita gap absoluto). prazo é um instante (time.time()) comum
+    a vários solves: o limite de tempo nunca passa dele, e depois dele o
+    modelo nem é resolvido (status NOT_SOLVED).
+
+    Cada chamada é registrada como um span "solve" com o tamanho do modelo,
+    status, nós explorados e gap (ver metricas.py).
+    """
+    validar_solver(solver)
+    with span(
+        FASE_SOLVE,
+        solver=solver,
+        variaveis=len(modelo_proto.variable),
+        restricoes=len(modelo_proto.constraint),
+    ) as atributos:
+        resposta, atributos["nos"] = _resolver(
+            modelo_proto, solver, tempo_limite_s, num_search_workers,
+            gap_relativo, gap_absoluto, prazo,
+        )
+        atributos["status"] = status_resposta(resposta)
+        atributos["gap"] = gap_resposta(resposta)
+    return resposta
+
+
+def _resolver(
+    modelo_proto, solver, tempo_limite_s, num_search_workers, gap_relativo,
+    gap_absoluto, prazo,
+):
+    """Resolve o modelo e retorna (MPSolutionResponse, nós explorados)."""
+    if prazo is not None:
+        tempo_limite_s = min(tempo_limite_s, prazo - time.time())
+        if tempo_limite_s <= 0:
+            return _nao_resolvido("Prazo esgotado antes do solve"), 0
+
+    if solver == "cp_sat":
+        inicio = time.time()
+        resposta, nos = _resolver_cp_sat(
+            modelo_proto, tempo_limite_s, num_search_workers, gap_relativo, gap_absoluto
+        )
+        if resposta.status != linear_solver_pb2.MPSOLVER_ABNORMAL:
+            return resposta, nos
+        # A solução do modelo arredondado viola o original: o SCIP resolve o
+        # modelo sem escala no tempo que sobrou
+        tempo_limite_s -= time.time() - inicio
+        if tempo_limite_s <= 0:
+            return _nao_resolvido(f"{resposta.status_str}; sem tempo para o SCIP"), nos
+        logging.warning(f"{resposta.status_str}; resolvendo com o SCIP")
+        resposta_scip, nos_scip = _resolver_pywraplp(
+            modelo_proto, "scip", tempo_limite_s, gap_relativo, gap_absoluto
+        )
+        resposta_scip.status_str = f"SCIP após CP-SAT descartado ({resposta.status_str})"
+        return resposta_scip, nos + nos_scip
+
+    return _resolver_pywraplp(modelo_proto, solver, tempo_limite_s, gap_relativo, gap_absoluto)
+
+
+def _nao_resolvido(motivo):
+    resposta = linear_solver_pb2.MPSolutionResponse()
+    resposta.status = linear_solver_pb2.MPSOLVER_NOT_SOLVED
+    resposta.status_str = motivo
+    return resposta
+
+
+def _resolver_pywraplp(modelo_proto, solver, tempo_limite_s, gap_relativo, gap_absoluto):
+    mp_solver = pywraplp.Solver.CreateSolver(_NOMES_PYWRAPLP[solver])
+    erro = mp_solver.LoadModelFromProto(modelo_proto)
+    if erro:
+        raise ValueError(f"Modelo inválido para o {solver}: {erro}")
+    mp_solver.SetTimeLimit(int(tempo_limite_s * 1000))
+    parametros = pywraplp.MPSolverParameters()
+    parametros.SetDoubleParam(parametros.RELATIVE_MIP_GAP, gap_relativo)
+    if gap_absoluto is not None:
+        if solver == "scip":
+            mp_solver.SetSolverSpecificParametersAsString(f"limits/absgap = {gap_absoluto}")
+        else:
+            logging.warning(f"Gap absoluto não é suportado pelo {solver}; ignorado")
+    mp_solver.Solve(parametros)
+    resposta = linear_solver_pb2.MPSolutionResponse()
+    mp_solver.FillSolutionResponseProto(resposta)
+    return resposta, mp_solver.nodes()
+
+
+def resolver_solver(solver_pywraplp, **opcoes_solver):
+    """Resolve o modelo montado em um pywraplp.Solver pelo solver escolhido.
+
+    A solução encontrada é carregada de volta no solver de origem, então
+    solution_value() das variáveis e expressões continua valendo. Retorna o
+    MPSolutionResponse.
+    """
+    modelo_proto = linear_solver_pb2.MPModelProto()
+    solver_pywraplp.ExportModelToProto(modelo_proto)
+    resposta = resolver_modelo(modelo_proto, **opcoes_solver)
+    if resposta.status in (pywraplp.Solver.OPTIMAL, pywraplp.Solver.FEASIBLE):
+        solver_pywraplp.LoadSolutionFromProto(resposta)
+    return resposta
+
+
+def gap_resposta(resposta):
+    """Gap relativo entre a solução e o limitante da resposta (None sem solução)."""
+    if resposta.status not in (pywraplp.Solver.OPTIMAL, pywraplp.Solver.FEASIBLE):
+        return None
+    if not resposta.HasField("best_objective_bound"):
+        return 0.0 if resposta.status == pywraplp.Solver.OPTIMAL else None
+    diferenca = abs(resposta.objective_value - resposta.best_objective_bound)
+    return diferenca / max(abs(resposta.objective_value), 1e-9)
+
+
+def status_resposta(resposta):
+    """Status da resposta: otimo, dentro_do_gap, limite_de_tempo, inviavel ou nao_resolvido."""
+    if resposta.status == pywraplp.Solver.OPTIMAL:
+        gap = gap_resposta(resposta)
+        return OTIMO if gap is None or gap <= TOLERANCIA_GAP else DENTRO_DO_GAP
+    if resposta.status == pywraplp.Solver.FEASIBLE:
+        return LIMITE_DE_TEMPO
+    if resposta.status == pywraplp.Solver.INFEASIBLE:
+        return INVIAVEL
+    return NAO_RESOLVIDO
+
+
+def resposta_conclusiva(resposta):
+    """Se o solve terminou pelos próprios critérios, e não por tempo ou prazo.
+
+    Só respostas conclusivas são reproduzíveis e podem ir para o cache.
+    """
+    return status_resposta(resposta) in (OTIMO, DENTRO_DO_GAP, INVIAVEL)
+
+
+def _inteiro(valor):
+    return abs(valor - round(valor)) <= 1e-9 * max(1, abs(valor))
+
+
+def _escala_inteira(valores):
+    """(escala, exata): menor potência de 10 que torna os valores inteiros.
+
+    Limitada a 10**MAX_DIGITOS_COEFICIENTES; exata é False se nem ela
+    basta, ou seja, se os valores escalados precisarão ser arredondados.
+    """
+    for digitos in range(MAX_DIGITOS_COEFICIENTES + 1):
+        escala = 10**digitos
+        if all(_inteiro(v * escala) for v in valores):
+            return escala, True
+    return escala, False
+
+
+def _limite(valor, arredondar):
+    if math.isinf(valor):
+        return None
+    # Tolerância para limites que já são inteiros a menos de erro de ponto flutuante
+    return arredondar(valor - 1e-9 if arredondar is math.ceil else valor + 1e-9)
+
+
+def _modelo_cp_sat(modelo_proto):
+    """Formulação inteira do MPModelProto para o CP-SAT.
+
+    Variáveis inteiras são mantidas; cada variável contínua v é trocada por
+    uma inteira w = v * ESCALA_CONTINUAS. Cada restrição e o objetivo são
+    multiplicados pela menor potência de 10 que torna seus coeficientes
+    inteiros (arredondando a partir de 10**MAX_DIGITOS_COEFICIENTES).
+
+    Retorna (modelo, variaveis, escalas, escala_objetivo, arredondadas), com
+    arredondadas os nomes das restrições (e "objetivo") cujos coeficientes
+    ou limites não couberam na escala e foram arredondados: nelas o modelo
+    do CP-SAT é só uma aproximação do original.
+    """
+    modelo = cp_model.CpModel()
+    variaveis = []
+    escalas = []
+    arredondadas = []
+    for var in modelo_proto.variable:
+        escala = 1 if var.is_integer else ESCALA_CONTINUAS
+        inferior = _limite(var.lower_bound * escala, math.ceil)
+        superior = _limite(var.upper_bound * escala, math.floor)
+        variaveis.append(
+            modelo.NewIntVar(
+                -LIMITE_VARIAVEIS * escala if inferior is None else inferior,
+                LIMITE_VARIAVEIS * escala if superior is None else superior,
+                var.name,
+            )
+        )
+        escalas.append(escala)
+
+    def expressao(indices, coeficientes):
+        coeficientes = [c / escalas[j] for j, c in zip(indices, coeficientes)]
+        fator, exata = _escala_inteira(coeficientes)
+        return fator, exata, cp_model.LinearExpr.WeightedSum(
+            [variaveis[j] for j in indices], [round(c * fator) for c in coeficientes]
+        )
+
+    for i, ct in enumerate(modelo_proto.constraint):
+        fator, exata, soma = expressao(ct.var_index, ct.coefficient)
+        limites = [v * fator for v in (ct.lower_bound, ct.upper_bound) if not math.isinf(v)]
+        if not exata or not all(_inteiro(v) for v in limites):
+            arredondadas.append(ct.name or f"restricao_{i}")
+        inferior = _limite(ct.lower_bound * fator, math.ceil)
+        superior = _limite(ct.upper_bound * fator, math.floor)
+        if inferior is not None:
+            modelo.Add(soma >= inferior)
+        if superior is not None:
+            modelo.Add(soma <= superior)
+
+    indices = [j for j, var in enumerate(modelo_proto.variable) if var.objective_coefficient]
+    escala_objetivo, exata, objetivo = expressao(
+        indices, [modelo_proto.variable[j].objective_coefficient for j in indices]
+    )
+    if not exata:
+        arredondadas.append("objetivo")
+    if modelo_proto.maximize:
+        modelo.Maximize(objetivo)
+    else:
+        modelo.Minimize(objetivo)
+
+    dica = modelo_proto.solution_hint
+    for j, valor in zip(dica.var_index, dica.var_value):
+        modelo.AddHint(variaveis[j], round(valor * escalas[j]))
+
+    return modelo, variaveis, escalas, escala_objetivo, arredondadas
+
+
+def violacao_maxima(modelo_proto, valores):
+    """Maior violação relativa dos limites e restrições do modelo pelos valores.
+
+    Cada violação é dividida por max(1, |limite|, soma de |coeficiente × valor|),
+    de modo que o resultado é comparável a TOLERANCIA_VIOLACAO.
+    """
+    pior = 0.0
+    for var, valor in zip(modelo_proto.variable, valores):
+        excesso = max(var.lower_bound - valor, valor - var.upper_bound, 0.0)
+        pior = max(pior, excesso / max(1.0, abs(valor)))
+    for ct in modelo_proto.constraint:
+        termos = [c * valores[j] for j, c in zip(ct.var_index, ct.coefficient)]
+        atividade = sum(termos)
+        excesso = max(ct.lower_bound - atividade, atividade - ct.upper_bound, 0.0)
+        if excesso:
+            limite = ct.lower_bound if atividade < ct.lower_bound else ct.upper_bound
+            escala = max(1.0, abs(limite), sum(abs(t) for t in termos))
+            pior = max(pior, excesso / escala)
+    return pior
+
+
+def _resolver_cp_sat(
+    modelo_proto, tempo_limite_s, num_search_workers, gap_relativo, gap_absoluto
+):
+    modelo, variaveis, escalas, escala_objetivo, arredondadas = _modelo_cp_sat(modelo_proto)
+    if arredondadas:
+        logging.warning(
+            f"CP-SAT: coeficientes arredondados em {len(arredondadas)} linhas do modelo "
+            f"({', '.join(arredondadas[:5])}{', ...' if len(arredondadas) > 5 else ''}); "
+            f"a solução será conferida contra o modelo original"
+        )
+    solver = cp_model.CpSolver()
+    solver.parameters.max_time_in_seconds = tempo_limite_s
+    solver.parameters.num_search_workers = num_search_workers
+    solver.parameters.relative_gap_limit = gap_relativo
+    if gap_absoluto is not None:
+        # O objetivo do CP-SAT está multiplicado por escala_objetivo
+        solver.parameters.absolute_gap_limit = gap_absoluto * escala_objetivo
+    status = solver.Solve(modelo)
+
+    resposta = linear_solver_pb2.MPSolutionResponse()
+    resposta.status = _STATUS_CP_SAT[status]
+    resposta.status_str = solver.StatusName(status)
+    if status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+        valores = [solver.Value(v) / e for v, e in zip(variaveis, escalas)]
+        # O arredondamento pode afrouxar uma restrição: uma solução que viola
+        # o modelo original não é devolvida
+        violacao = violacao_maxima(modelo_proto, valores)
+        if violacao > TOLERANCIA_VIOLACAO:
+            logging.warning(
+                f"CP-SAT: solução descartada, viola o modelo original em {violacao:.2e} "
+                f"(coeficientes arredondados)"
+            )
+            resposta.status = linear_solver_pb2.MPSOLVER_ABNORMAL
+            resposta.status_str = (
+                f"Solução do CP-SAT viola o modelo original em {violacao:.2e}"
+            )
+            return resposta, solver.NumBranches()
+        if arredondadas:
+            resposta.status_str += f" (modelo aproximado: {len(arredondadas)} linhas arredondadas)"
+        resposta.variable_value.extend(valores)
+        # Objetivo recalculado com os coeficientes originais, sem arredondamento
+        resposta.objective_value = modelo_proto.objective_offset + sum(
+            var.objective_coefficient * valor
+            for var, valor in zip(modelo_proto.variable, valores)
+        )
+        resposta.best_objective_bound = (
+            modelo_proto.objective_offset
+            + solver.BestObjectiveBound() / escala_objetivo
+        )
+    return resposta, solver.NumBranches()
@@ -0,0 +1,198 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from cache_solucoes import hash_canonico
+
+
+# Tabelas derivadas mantidas por processo, por catálogo e tolerância
+TABELAS_MAX_ITENS = int(os.getenv("OTIMIZACAO_TABELAS_MAX_ITENS", 32))
+
+# Campos escalares de cada grade do catálogo, copiados para vetores (grades,)
+CAMPOS_GRADE = (
+    "aproveitamento",
+    "custo_setup",
+    "largura_tecido",
+    "custo_tecido",
+    "custo_corte",
+    "custo_enfesto_fixo",
+    "custo_enfesto_variavel",
+    "tempo_enfesto_por_metro",
+    "tempo_corte_por_metro",
+)
+
+# Campos por tamanho, copiados para matrizes (grades × tamanhos)
+CAMPOS_TAMANHO = ("larguras", "areas", "perimetros")
+
+# Campos derivados calculados pela tabela, um vetor (grades,) cada
+CAMPOS_DERIVADOS = (
+    "area_total",
+    "comprimento_enfesto",
+    "perimetro_total",
+    "custo_por_camada",
+    "desperdicio",
+    "tempo_enfesto_por_camada",
+    "tempo_corte_por_camada",
+    "tempo_por_camada",
+    "tempo_producao",
+    "tempo_total_maximo",
+    "max_camadas",
+)
+
+
+class GradeTable:
+    """Tabela de grades em arrays NumPy, calculada uma vez por catálogo.
+
+    Cada linha é uma grade (na ordem do catálogo) e cada coluna das matrizes
+    é um tamanho. Aplica ajustar_grade e os cálculos de área, comprimento do
+    enfesto, perímetro, custo por camada, desperdício e tempos de uma vez
+    para todas as grades, sem alterar o dicionário do catálogo recebido.
+    """
+
+    def __init__(self, grades, tamanhos, tolerancia_largura):
+        self.nomes = list(grades)
+        self.tamanhos = list(tamanhos)
+        self.indice = {g: i for i, g in enumerate(self.nomes)}
+        self.tolerancia_largura = tolerancia_largura
+
+        def matriz(campo):
+            return np.array(
+                [[grades[g][campo][t] for t in self.tamanhos] for g in self.nomes],
+                dtype=float,
+            ).reshape(len(self.nomes), len(self.tamanhos))
+
+        def vetor(campo, padrao=None):
+            return np.array(
+                [grades[g].get(campo, padrao) for g in self.nomes], dtype=float
+            )
+
+        for campo in CAMPOS_GRADE:
+            setattr(self, campo, vetor(campo))
+        for campo in CAMPOS_TAMANHO:
+            setattr(self, campo, matriz(campo))
+        quantidades = matriz("quantidades")
+
+        # ajustar_grade: reduz as quantidades das grades mais largas que o tecido
+        largura_total = (quantidades * self.larguras).sum(axis=1)
+        ajustar = largura_total > self.largura_tecido * (1 + tolerancia_largura)
+        fator_ajuste = np.divide(
+            self.largura_tecido,
+            largura_total,
+            out=np.ones_like(largura_total),
+            where=ajustar,
+        )
+        self.quantidades = np.where(
+            ajustar[:, None],
+            np.maximum(1, np.floor(quantidades * fator_ajuste[:, None])),
+            quantidades,
+        ).astype(np.int64)
+
+        q = self.quantidades
+        self.area_total = (q * self.areas).sum(axis=1)
+        self.comprimento_enfesto = self.area_total / (
+            self.largura_tecido * self.aproveitamento
+        )
+        self.perimetro_total = (q * self.perimetros).sum(axis=1)
+        # calcular_custo_por_camada
+        self.custo_por_camada = (
+            self.area_total / self.aproveitamento * self.custo_tecido
+            + self.perimetro_total * self.custo_corte
+            + self.custo_enfesto_fixo
+            + self.comprimento_enfesto * self.custo_enfesto_variavel
+        )
+        # calcular_desperdicio
+        self.desperdicio = np.maximum(
+            0, self.largura_tecido - (q * self.larguras).sum(axis=1)
+        )
+        self.tempo_enfesto_por_camada = (
+            self.comprimento_enfesto * self.tempo_enfesto_por_metro
+        )
+        self.tempo_corte_por_camada = self.perimetro_total * self.tempo_corte_por_metro
+        self.tempo_por_camada = self.tempo_enfesto_por_camada + self.tempo_corte_por_camada
+        self.tempo_producao = self.tempo_por_camada
+        self.max_camadas = vetor("max_camadas", 1)
+        self.tempo_total_maximo = self.tempo_por_camada * self.max_camadas
+
+        self.assinatura = self._calcular_assinatura()
+
+    def __len__(self):
+        return len(self.nomes)
+
+    def congelar(self):
+        """Torna os arrays somente leitura, para a tabela ser compartilhada."""
+        for valor in vars(self).values():
+            if isinstance(valor, np.ndarray):
+                valor.setflags(write=False)
+        return self
+
+    def _calcular_assinatura(self):
+        h = hashlib.sha256()
+        h.update(repr((self.nomes, self.tamanhos)).encode("utf-8"))
+        for campo in ("quantidades",) + CAMPOS_GRADE + CAMPOS_TAMANHO + CAMPOS_DERIVADOS:
+            h.update(np.ascontiguousarray(getattr(self, campo)).tobytes())
+        return h.hexdigest()
+
+    def grade(self, g):
+        """Dicionário de uma grade no formato do catálogo, com campos derivados."""
+        i = self.indice[g]
+        dados = {
+            "quantidades": dict(zip(self.tamanhos, self.quantidades[i].tolist())),
+        }
+        for campo in CAMPOS_TAMANHO:
+            dados[campo] = dict(zip(self.tamanhos, getattr(self, campo)[i].tolist()))
+        for campo in CAMPOS_GRADE + CAMPOS_DERIVADOS:
+            dados[campo] = getattr(self, campo)[i].item()
+        dados["max_camadas"] = int(dados["max_camadas"])
+        return dados
+
+    def como_dict(self):
+        """Visão {grade: dados} usada pelos relatórios."""
+        return {g: self.grade(g) for g in self.nomes}
+
+
+class CacheTabelas:
+    """GradeTables imutáveis compartilhadas por todas as execuções do processo.
+
+    A chave é a versão do catálogo (hash do conteúdo), os tamanhos e a
+    tolerância de largura; a tabela é calculada uma vez por chave, congelada
+    e devolvida a quem pedir o mesmo catálogo, inclusive de outras threads.
+    Um catálogo alterado tem outro hash e, portanto, outra tabela.
+    """
+
+    def __init__(self, max_itens=TABELAS_MAX_ITENS):
+        self.max_itens = max_itens
+        self._tabelas = OrderedDict()
+        self._lock = threading.Lock()
+        self.contadores = {"hits": 0, "misses": 0}
+
+    def obter(self, grades, tamanhos, tolerancia_largura):
+        versao = hash_canonico(grades)
+        chave = (versao, tuple(tamanhos), tolerancia_largura)
+        with self._lock:
+            tabela = self._tabelas.get(chave)
+            if tabela is not None:
+                self._tabelas.move_to_end(chave)
+                self.contadores["hits"] += 1
+                return tabela
+            self.contadores["misses"] += 1
+
+        # Calculada fora do lock; se outra thread terminar antes, vale a dela
+        tabela = GradeTable(grades, tamanhos, tolerancia_largura).congelar()
+        tabela.versao = versao
+        with self._lock:
+            tabela = self._tabelas.setdefault(chave, tabela)
+            self._tabelas.move_to_end(chave)
+            while len(self._tabelas) > self.max_itens:
+                self._tabelas.popitem(last=False)
+        return tabela
+
+
+cache_tabelas = CacheTabelas()
+
+
+def obter_tabela_grades(grades, tamanhos, tolerancia_largura):
+    """GradeTable do catálogo, reaproveitada do cache do processo."""
+    return cache_tabelas.obter(grades, tamanhos, tolerancia_largura)
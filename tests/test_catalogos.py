@@ -0,0 +1,40 @@
+import copy
+
+import pytest
+
+import config
+from catalogos import normalizar_catalogo
+
+
+def _grades():
+    return copy.deepcopy(config.grades)
+
+
+def test_catalogo_de_grades_padrao_e_valido():
+    assert normalizar_catalogo("grades", _grades()) == config.grades
+
+
+@pytest.mark.parametrize("campo", ["aproveitamento", "largura_tecido"])
+@pytest.mark.parametrize("valor", [0, -0.5])
+def test_divisores_da_tabela_devem_ser_positivos(campo, valor):
+    grades = _grades()
+    next(iter(grades.values()))[campo] = valor
+    with pytest.raises(ValueError, match=f"{campo} deve ser maior que zero"):
+        normalizar_catalogo("grades", grades)
+
+
+@pytest.mark.parametrize("campo", ["quantidades", "areas", "larguras", "perimetros"])
+def test_valores_por_tamanho_nao_podem_ser_negativos(campo):
+    grades = _grades()
+    grade = next(iter(grades.values()))
+    tamanho = next(iter(grade[campo]))
+    grade[campo][tamanho] = -1
+    with pytest.raises(ValueError, match=rf"{campo}\[{tamanho}\] não pode ser negativo"):
+        normalizar_catalogo("grades", grades)
+
+
+def test_custos_nao_podem_ser_negativos():
+    grades = _grades()
+    next(iter(grades.values()))["custo_tecido"] = -1
+    with pytest.raises(ValueError, match="custo_tecido não pode ser negativo"):
+        normalizar_catalogo("grades", grades)
@@ -0,0 +1,76 @@
+import os
+import time
+
+import pytest
+
+import jobs
+from metricas import registro, span
+from min_cost_production import OtimizacaoCancelada
+
+TEMPO_LIMITE_S = 60
+
+
+def _ecoar(parametros, estado, parciais, evento_cancelamento):
+    return parametros
+
+
+def _falhar_apos_fase(parametros, estado, parciais, evento_cancelamento):
+    with span("fase_do_teste"):
+        pass
+    raise parametros["erro"]
+
+
+def _derrubar_processo(parametros, estado, parciais, evento_cancelamento):
+    os._exit(1)
+
+
+def _esperar(gerenciador, job_id):
+    limite = time.monotonic() + TEMPO_LIMITE_S
+    while time.monotonic() < limite:
+        job = gerenciador.consultar(job_id, "teste")
+        if job["status"] in jobs.STATUS_FINAIS:
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"Job {job_id} não terminou em {TEMPO_LIMITE_S}s")
+
+
+@pytest.fixture
+def gerenciador():
+    gerenciador = jobs.GerenciadorJobs(max_workers=1)
+    yield gerenciador
+    gerenciador.encerrar()
+
+
+def test_job_concluido(gerenciador):
+    job = _esperar(gerenciador, gerenciador.submeter("teste", {"x": 1}, executar=_ecoar))
+    assert job["status"] == jobs.CONCLUIDO
+    assert job["resultado"] == {"x": 1}
+
+
+def test_pool_recriado_apos_processo_encerrado(gerenciador):
+    job = _esperar(gerenciador, gerenciador.submeter("teste", {}, executar=_derrubar_processo))
+    assert job["status"] == jobs.ERRO
+
+    job = _esperar(gerenciador, gerenciador.submeter("teste", {"x": 2}, executar=_ecoar))
+    assert job["status"] == jobs.CONCLUIDO
+    assert job["resultado"] == {"x": 2}
+
+
+def _contagem_fase(fase):
+    for linha in registro.texto_prometheus().splitlines():
+        if linha.startswith(f'otimizacao_fase_segundos_count{{fase="{fase}"}}'):
+            return float(linha.split()[-1])
+    return 0
+
+
+@pytest.mark.parametrize(
+    "erro, status",
+    [(ValueError("falha no solve"), jobs.ERRO), (OtimizacaoCancelada("cancelado"), jobs.CANCELADO)],
+)
+def test_spans_registrados_em_job_que_falha(gerenciador, erro, status):
+    antes = _contagem_fase("fase_do_teste")
+    job_id = gerenciador.submeter("teste", {"erro": erro}, executar=_falhar_apos_fase)
+    job = _esperar(gerenciador, job_id)
+    assert job["status"] == status
+    assert job["erro"] == str(erro)
+    assert _contagem_fase("fase_do_teste") == antes + 1
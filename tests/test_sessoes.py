@@ -0,0 +1,145 @@
+import copy
+import datetime
+
+import pytest
+
+import config
+import sessoes
+from escalonamento import REGRAS_DESPACHO, escalonar
+from jobs import CONCLUIDO
+from min_cost_production import Turno, gerar_pedidos_para_intervalo
+from sessoes import GerenciadorSessoes, SessaoPlanejamento
+
+DATA_INICIO = datetime.datetime(2024, 11, 1, 8)
+NOVO_PEDIDO = {"demandas": {"P": 40, "M": 70, "G": 60, "GG": 50}}
+
+
+def _parametros_sessao(regra_despacho):
+    return dict(
+        pedidos=gerar_pedidos_para_intervalo(DATA_INICIO, 3),
+        grades=copy.deepcopy(config.grades),
+        recursos=config.recursos_padrao,
+        turnos=[
+            Turno(t["inicio"], t["fim"], eficiencia=t["eficiencia"])
+            for t in config.turnos_padrao
+        ],
+        data_inicio=DATA_INICIO,
+        criterio_prioridade="prazo",
+        tolerancia_largura=0.1,
+        percentual_superproducao=0.05,
+        max_camadas_por_grade=30,
+        horas_producao=16,
+        comprimento_mesa_enfesto=10,
+        penalizacao_superproducao=10,
+        relaxacao=True,
+        regra_despacho=regra_despacho,
+    )
+
+
+def _criar_sessao(regra_despacho):
+    return SessaoPlanejamento(**_parametros_sessao(regra_despacho))
+
+
+@pytest.fixture(scope="module", params=sorted(REGRAS_DESPACHO))
+def sessao_base(request):
+    return _criar_sessao(request.param)
+
+
+@pytest.fixture
+def sessao(sessao_base):
+    # Cada teste altera a própria cópia; a sessão base é resolvida uma vez por regra
+    return copy.deepcopy(sessao_base)
+
+
+def _escalonamento_completo(sessao):
+    return escalonar(
+        sessao.pedidos_ordenados,
+        sessao.resultados,
+        sessao.data_inicio,
+        sessao.recursos,
+        sessao.calendario,
+        pedidos=sessao.pedidos,
+        regra_enfesto=sessao.regra_despacho,
+    )
+
+
+def _delta(tipo, sessao):
+    ultimo, penultimo = sessao.pedidos_ordenados[-1], sessao.pedidos_ordenados[-2]
+    if tipo == "adicionar":
+        prazo = max(pedido["prazo"] for pedido in sessao.pedidos.values())
+        return {"adicionar": {"N1": dict(NOVO_PEDIDO, prazo=prazo + datetime.timedelta(days=1))}}
+    if tipo == "modificar":
+        return {"modificar": {penultimo: {"demandas": {"P": 20, "M": 50, "G": 40, "GG": 30}}}}
+    if tipo == "cancelar":
+        return {"cancelar": [ultimo]}
+    # Prazo antecipado: o último pedido passa para o início da fila
+    return {"modificar": {ultimo: {"prazo": DATA_INICIO}}}
+
+
+@pytest.mark.parametrize("tipo", ["adicionar", "modificar", "cancelar", "prazo"])
+def test_reparo_igual_ao_escalonamento_completo(sessao, tipo):
+    resumo = sessao.aplicar(**_delta(tipo, sessao))
+
+    assert resumo["versao"] == 1
+    assert sessao.cronograma == _escalonamento_completo(sessao)
+
+
+def test_reparo_mantem_despachos_anteriores_ao_afetado(sessao):
+    resumo = sessao.aplicar(cancelar=[sessao.pedidos_ordenados[-1]])
+
+    assert resumo["reparo"]["enfestos_mantidos"] > 0
+
+
+def test_delta_invalido_nao_altera_a_sessao(sessao):
+    plano = sessao.plano()
+
+    with pytest.raises(ValueError):
+        sessao.aplicar(cancelar=["inexistente"])
+    with pytest.raises(ValueError):
+        sessao.aplicar(adicionar={"N1": {"demandas": {"P": 1}, "prazo": DATA_INICIO}})
+
+    assert sessao.plano() == plano
+
+
+def test_falha_no_reparo_nao_altera_a_sessao(sessao, monkeypatch):
+    plano = sessao.plano()
+
+    def falhar(*args, **kwargs):
+        raise RuntimeError("falha no reparo")
+
+    monkeypatch.setattr(sessoes, "reparar_escalonamento", falhar)
+    with pytest.raises(RuntimeError):
+        sessao.aplicar(**_delta("adicionar", sessao))
+
+    assert sessao.plano() == plano
+    assert "N1" not in sessao.pedidos
+
+
+def test_prazo_com_fuso_vira_horario_local(sessao):
+    prazo = datetime.datetime(2024, 11, 3, 12, tzinfo=datetime.timezone.utc)
+    sessao.aplicar(adicionar={"N1": dict(NOVO_PEDIDO, prazo=prazo)})
+
+    local = prazo.astimezone().replace(tzinfo=None)
+    assert sessao.pedidos["N1"]["prazo"] == local
+    assert sessao.cronograma == _escalonamento_completo(sessao)
+
+
+class _JobsImediatos:
+    """Gerenciador de jobs que executa e finaliza o job dentro de submeter."""
+
+    def submeter(self, usuario, parametros, executar, ao_finalizar, job_id):
+        ao_finalizar(CONCLUIDO, executar(parametros, {}, {}, None))
+        return job_id
+
+
+def test_job_finalizado_dentro_de_submeter_libera_a_sessao():
+    gerenciador = GerenciadorSessoes(jobs=_JobsImediatos())
+    sessao_id, job_id = gerenciador.criar("teste", **_parametros_sessao("ordem"))
+    sessao, pendente = gerenciador.obter(sessao_id, "teste")
+    assert sessao is not None and pendente is None
+
+    # Dois deltas seguidos: o primeiro terminou e não pode deixar a sessão ocupada
+    for pedido in sessao.pedidos_ordenados[-2:]:
+        assert gerenciador.aplicar(sessao_id, "teste", cancelar=[pedido]) is not None
+    sessao, pendente = gerenciador.obter(sessao_id, "teste")
+    assert sessao.versao == 2 and pendente is None
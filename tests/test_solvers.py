@@ -0,0 +1,117 @@
+import pytest
+from ortools.linear_solver import linear_solver_pb2, pywraplp
+
+import solvers
+
+
+def _proto(solver):
+    modelo_proto = linear_solver_pb2.MPModelProto()
+    solver.ExportModelToProto(modelo_proto)
+    return modelo_proto
+
+
+def _modelo_misto():
+    """MIP com variável contínua e coeficientes decimais exatos."""
+    solver = pywraplp.Solver.CreateSolver("SCIP")
+    x = solver.IntVar(0, 20, "x")
+    y = solver.NumVar(0, 50, "y")
+    solver.Add(0.25 * x + 1.5 * y >= 7.5, "demanda")
+    solver.Add(x - 2 * y <= 4.5, "balanco")
+    solver.Minimize(3.2 * x + 2.05 * y + 1)
+    return solver
+
+
+@pytest.mark.parametrize(
+    "valores, escala",
+    [([1, 2, -3], 1), ([0.5, 2], 10), ([0.25, 1.5], 100), ([3.2, 2.05], 100), ([1e-6], 10**6)],
+)
+def test_escala_exata_de_coeficientes_decimais(valores, escala):
+    assert solvers._escala_inteira(valores) == (escala, True)
+
+
+def test_escala_sinaliza_coeficientes_arredondados():
+    assert solvers._escala_inteira([1 / 3]) == (10**solvers.MAX_DIGITOS_COEFICIENTES, False)
+    assert solvers._escala_inteira([0.2500004, 1])[1] is False
+
+
+def test_modelo_exato_nao_tem_linhas_arredondadas():
+    modelo_proto = _proto(_modelo_misto())
+    _, variaveis, escalas, escala_objetivo, arredondadas = solvers._modelo_cp_sat(modelo_proto)
+    assert arredondadas == []
+    # Contínuas em unidades de 1/ESCALA_CONTINUAS, com os limites escalados
+    assert escalas == [1, solvers.ESCALA_CONTINUAS]
+    assert variaveis[1].Proto().domain == [0, 50 * solvers.ESCALA_CONTINUAS]
+    # 3.2 e 2.05 / 100 ficam inteiros só a partir de 10**4
+    assert escala_objetivo == 10**4
+
+
+def test_modelo_sinaliza_coeficientes_e_limites_arredondados():
+    solver = pywraplp.Solver.CreateSolver("SCIP")
+    x = solver.IntVar(0, 10, "x")
+    solver.Add(x / 3 <= 2, "terco")
+    solver.Add(x <= 9.5, "limite")
+    solver.Add(x >= 1, "exata")
+    solver.Maximize(x / 7)
+    arredondadas = solvers._modelo_cp_sat(_proto(solver))[-1]
+    assert arredondadas == ["terco", "limite", "objetivo"]
+
+
+def test_violacao_maxima():
+    modelo_proto = _proto(_modelo_misto())
+    # x = 4, y = 4.4: 0.25*4 + 1.5*4.4 = 7.6 >= 7.5 e 4 - 8.8 <= 4.5
+    assert solvers.violacao_maxima(modelo_proto, [4, 4.4]) == 0
+    # y = 4.3 deixa a demanda 0.05 abaixo de 7.5
+    assert solvers.violacao_maxima(modelo_proto, [4, 4.3]) == pytest.approx(0.05 / 7.5)
+    # Fora do limite da variável
+    assert solvers.violacao_maxima(modelo_proto, [21, 50]) > solvers.TOLERANCIA_VIOLACAO
+
+
+def _modelo_afrouxado_pelo_arredondamento():
+    # 0.2500004 * 10**6 é arredondado para 250000, o que permite x = 4000,
+    # mas 0.2500004 * 4000 = 1000.0016 > 1000
+    solver = pywraplp.Solver.CreateSolver("SCIP")
+    x = solver.IntVar(0, 10000, "x")
+    solver.Add(0.2500004 * x <= 1000)
+    solver.Maximize(x)
+    return solver, x
+
+
+def test_cp_sat_descarta_solucao_que_viola_o_modelo_original():
+    solver, _ = _modelo_afrouxado_pelo_arredondamento()
+    resposta, _ = solvers._resolver_cp_sat(_proto(solver), 60, 1, 0.0, None)
+    assert resposta.status == pywraplp.Solver.ABNORMAL
+    assert "viola o modelo original" in resposta.status_str
+    assert not resposta.variable_value
+    assert not solvers.resposta_conclusiva(resposta)
+
+
+def test_cp_sat_recorre_ao_scip_quando_a_solucao_e_descartada():
+    solver, x = _modelo_afrouxado_pelo_arredondamento()
+    resposta = solvers.resolver_solver(solver, solver="cp_sat", num_search_workers=1)
+    assert solvers.status_resposta(resposta) == solvers.OTIMO
+    assert resposta.status_str.startswith("SCIP após CP-SAT descartado")
+    assert x.solution_value() == 3999
+
+
+def test_cp_sat_sinaliza_modelo_aproximado():
+    solver = pywraplp.Solver.CreateSolver("SCIP")
+    x = solver.IntVar(0, 10, "x")
+    solver.Add(x / 3 <= 2)
+    solver.Maximize(x)
+    resposta = solvers.resolver_solver(solver, solver="cp_sat", num_search_workers=1)
+    assert resposta.status == pywraplp.Solver.OPTIMAL
+    assert "modelo aproximado" in resposta.status_str
+    assert x.solution_value() == 6
+
+
+@pytest.mark.parametrize("nome", ["cbc", "cp_sat"])
+def test_resolver_solver_confere_com_scip(nome):
+    referencia = _modelo_misto()
+    solvers.resolver_solver(referencia, solver="scip")
+    solver = _modelo_misto()
+    resposta = solvers.resolver_solver(solver, solver=nome, num_search_workers=1)
+    assert solvers.status_resposta(resposta) == solvers.OTIMO
+    assert solver.Objective().Value() == pytest.approx(referencia.Objective().Value())
+    assert solvers.violacao_maxima(
+        _proto(solver), [v.solution_value() for v in solver.variables()]
+    ) <= solvers.TOLERANCIA_VIOLACAO
@@ -1,5 +1,6 @@
 import requests
 import json
+import time
 from datetime import datetime
 from tabulate import tabulate
 
@@ -50,6 +51,19 @@ def get_token():
         return None
 
 
+def aguardar_job(job_id, headers, intervalo=2.0):
+    """Consulta o job periodicamente até que ele seja finalizado"""
+    url = f"http://localhost:8000/jobs/{job_id}"
+    while True:
+        response = requests.get(url, headers=headers)
+        response.raise_for_status()
+        job = response.json()
+        if job["status"] in ("concluido", "erro", "cancelado"):
+            return job
+        print(f"  {job['status']}: {job['pedidos_resolvidos']} pedidos resolvidos")
+        time.sleep(intervalo)
+
+
 def visualizar_resultados():
     print("Iniciando script de visualização...")
     token = get_token()
@@ -77,11 +91,18 @@ def visualizar_resultados():
         response = requests.post(url, json=data, headers=headers)
         print(f"Status da resposta: {response.status_code}")
         
-        if response.status_code != 200:
+        if response.status_code != 202:
             print(f"Erro na requisição: {response.text}")
             return
 
-        resultados = response.json()
+        job_id = response.json()["job_id"]
+        print(f"Otimização enfileirada (job {job_id}). Aguardando conclusão...")
+        job = aguardar_job(job_id, headers)
+        if job["status"] != "concluido":
+            print(f"Job finalizado com status {job['status']}: {job['erro']}")
+            return
+
+        resultados = {"data": job["resultado"]}
         print("Dados recebidos com sucesso!")
 
         # Cabeçalho